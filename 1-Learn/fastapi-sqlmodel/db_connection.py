@@ -2,14 +2,46 @@
 FastAPI SQLModel app database connection
 """
 
-from sqlmodel import create_engine, SQLModel, Session
+import os
 
+from sqlalchemy import event
+from sqlmodel import create_engine, SQLModel, Session
 
 sqlite_file_name = "database.db"
 sqlite_url = f"sqlite:///{sqlite_file_name}"
 
+# Same tuning as Back-end/poetry-class/poetryclass/sqlite_engine.py
+SQL_ECHO = os.getenv("SQL_ECHO", "").lower() in ("1", "true", "yes", "on")
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -65536,
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY",
+}
+
 connect_args = {"check_same_thread": False}
-engine = create_engine(sqlite_url, echo=True, connect_args=connect_args)
+engine = create_engine(
+    sqlite_url,
+    echo=SQL_ECHO,
+    connect_args=connect_args,
+    pool_size=10,
+    max_overflow=20,
+    query_cache_size=1200,
+)
+
+
+@event.listens_for(engine, "connect")
+def apply_pragmas(dbapi_connection, _connection_record):
+    """
+    Applies PRAGMAS to every new SQLite connection
+    """
+    cursor = dbapi_connection.cursor()
+    for name, value in PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
 
 
 def create_db_and_tables():
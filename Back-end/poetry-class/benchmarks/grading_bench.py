@@ -0,0 +1,137 @@
+"""
+Benchmark: per-answer Python grading vs the vectorized quiz grader
+
+Builds an answer key of 1k questions and batches of random answer sheets, and
+times grading them answer by answer in Python against grade_sheets, which
+compares NumPy arrays. Then times POST /quiz/grade end to end, parsing and
+serialization included, with the largest batch.
+
+Run from Back-end/poetry-class:
+    PYTHONPATH=poetryclass/quiz-app python -m benchmarks.grading_bench
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+from fastapi.testclient import TestClient
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.pool import StaticPool
+
+from grading import AnswerKey, grade_sheets, invalidate_answer_key
+from main import app
+from schema import AnswerSheet, Quiz, SheetResult, get_session
+
+QUESTIONS = 1000
+
+
+def make_sheets(count: int, answers: int) -> list[dict]:
+    """
+    Random answer sheets of `answers` questions each
+    """
+    rng = random.Random(count)
+    return [
+        {
+            "user": f"user{rng.randrange(100)}",
+            "question_ids": rng.sample(range(1, QUESTIONS + 1), answers),
+            "answers": [rng.randrange(4) for _ in range(answers)],
+        }
+        for _ in range(count)
+    ]
+
+
+def grade_loop(correct_options: dict[int, int], sheets: list[AnswerSheet]) -> list:
+    """
+    Grades answer by answer, as the endpoint would without NumPy
+    """
+    results = []
+    for sheet in sheets:
+        marks = [
+            correct_options.get(question_id) == answer
+            for question_id, answer in zip(sheet.question_ids, sheet.answers)
+        ]
+        results.append(
+            SheetResult.model_construct(
+                user=sheet.user, score=sum(marks), total=len(marks), correct=marks
+            )
+        )
+    return results
+
+
+def best_of(function, repeat: int) -> float:
+    """
+    Fastest of `repeat` calls, in milliseconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main() -> None:
+    """
+    Benchmark entry point
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sheets", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--answers", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    correct_options = {i: rng.randrange(4) for i in range(1, QUESTIONS + 1)}
+    key = AnswerKey(
+        np.array(list(correct_options), dtype=np.int64),
+        np.array(list(correct_options.values()), dtype=np.int64),
+    )
+
+    print(f"{'sheets':>8} {'loop ms':>9} {'numpy ms':>9} {'speedup':>8}")
+    for count in args.sheets:
+        sheets = [
+            AnswerSheet.model_validate(s) for s in make_sheets(count, args.answers)
+        ]
+        loop = best_of(lambda: grade_loop(correct_options, sheets), args.repeat)
+        vectorized = best_of(lambda: grade_sheets(key, sheets), args.repeat)
+        print(f"{count:>8} {loop:>9.1f} {vectorized:>9.1f} {loop / vectorized:>7.2f}x")
+
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(
+            Quiz(
+                id=id,
+                question=f"Question {id}",
+                options=list("abcd"),
+                correct_option=option,
+            )
+            for id, option in correct_options.items()
+        )
+        session.commit()
+
+    def get_bench_session():
+        with Session(engine) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = get_bench_session
+    invalidate_answer_key()
+    body = {"sheets": make_sheets(max(args.sheets), args.answers)}
+    client = TestClient(app)
+
+    def post():
+        response = client.post("/quiz/grade", json=body)
+        assert response.status_code == 200
+
+    elapsed = best_of(post, args.repeat)
+    print(
+        f"POST /quiz/grade with {max(args.sheets)} sheets: {elapsed:.1f} ms, "
+        f"{max(args.sheets) / elapsed * 1000:,.0f} sheets/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
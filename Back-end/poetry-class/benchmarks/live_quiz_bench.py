@@ -0,0 +1,105 @@
+"""
+Benchmark: concurrent players of the quiz app's timed WebSocket quizzes
+
+Opens `--players` connections to /quiz/live of a running quiz app, ramping up
+faster than the quizzes end so they are all open at once, and has every
+player answer each question after a random think time, with some answers left
+to time out. Prints the most players connected at once, how many finished and
+the latency between an answer and its result.
+
+Start the app in one worker first, e.g. from poetryclass/quiz-app:
+    QUIZ_QUESTION_BANK=1 uvicorn main:app --ws websockets --log-level warning
+then run from Back-end/poetry-class:
+    python -m benchmarks.live_quiz_bench --players 10000
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from collections import Counter
+
+import websockets
+
+
+async def player(url: str, think: float, skip: float, stats: dict) -> None:
+    """
+    Plays one quiz, answering after up to `think` seconds or, with chance
+    `skip`, not at all
+    """
+    rng = random.Random()
+    try:
+        async with websockets.connect(url, open_timeout=120) as ws:
+            stats["open"] += 1
+            stats["peak"] = max(stats["peak"], stats["open"])
+            while True:
+                message = json.loads(await ws.recv())
+                if message["type"] == "done":
+                    stats["finished"] += 1
+                    stats["open"] -= 1
+                    return
+                if message["type"] != "question" or rng.random() < skip:
+                    continue
+                await asyncio.sleep(rng.uniform(0, think))
+                sent = time.perf_counter()
+                await ws.send(json.dumps({"index": message["index"], "answer": 0}))
+                message = json.loads(await ws.recv())
+                if message["type"] == "result":
+                    stats["latencies"].append(time.perf_counter() - sent)
+    except (OSError, websockets.WebSocketException) as e:
+        stats["errors"][type(e).__name__] += 1
+
+
+async def run(args: argparse.Namespace) -> None:
+    """
+    Starts every player, `--ramp` per second
+    """
+    stats = {
+        "open": 0,
+        "peak": 0,
+        "finished": 0,
+        "latencies": [],
+        "errors": Counter(),
+    }
+    url = f"{args.url}?n={args.questions}"
+
+    start = time.perf_counter()
+    tasks = []
+    for _ in range(args.players):
+        tasks.append(asyncio.create_task(player(url, args.think, args.skip, stats)))
+        if len(tasks) % 100 == 0:
+            await asyncio.sleep(100 / args.ramp)
+    await asyncio.gather(*tasks)
+
+    latencies = sorted(stats["latencies"])
+    print(
+        f"{stats['peak']} players connected at once, {stats['finished']} finished "
+        f"in {time.perf_counter() - start:.1f} s, errors: {dict(stats['errors'])}"
+    )
+    if latencies:
+        print(
+            f"answer to result latency: median "
+            f"{statistics.median(latencies) * 1000:.1f} ms, p99 "
+            f"{latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms"
+        )
+
+
+def main() -> None:
+    """
+    Benchmark entry point
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="ws://127.0.0.1:8000/quiz/live")
+    parser.add_argument("--players", type=int, default=10000)
+    parser.add_argument("--ramp", type=float, default=1000, help="players/s")
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--think", type=float, default=5.0)
+    parser.add_argument("--skip", type=float, default=0.1)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
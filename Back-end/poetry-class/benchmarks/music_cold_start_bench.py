@@ -0,0 +1,99 @@
+"""
+Benchmark: cold start of the music recommender app
+
+Times, in fresh interpreters, importing the app and answering a first
+/recommend request, and prints the median of the runs. With --ref the app is
+taken from that git revision instead of the working tree, e.g. the version
+that trained the model on import.
+
+Run from Back-end/poetry-class:
+    python -m benchmarks.music_cold_start_bench --ref HEAD~1
+    python -m benchmarks.music_cold_start_bench
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+APP_DIR = Path(__file__).parent.parent / "poetryclass" / "music_recommender"
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    client.post("/recommend", json={"age": 21, "gender": 1})
+print(json.dumps({
+    "import": imported - start,
+    "first_response": time.perf_counter() - start,
+    "pandas": "pandas" in sys.modules,
+    "sklearn": "sklearn" in sys.modules,
+}))
+"""
+
+
+def checkout(ref: str, target: Path) -> Path:
+    """
+    Extracts the app directory at a git revision, returns it
+    """
+    archive = subprocess.run(
+        ["git", "archive", ref, "."],
+        cwd=APP_DIR,
+        capture_output=True,
+        check=True,
+    ).stdout
+    with tarfile.open(fileobj=BytesIO(archive)) as tar:
+        tar.extractall(target, filter="data")
+    return target
+
+
+def measure(app_dir: Path) -> dict:
+    """
+    One cold start in a fresh interpreter
+    """
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", PROBE],
+        cwd=app_dir,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main() -> None:
+    """
+    Benchmark entry point
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--ref", help="git revision of the app, the working tree by default"
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app_dir = checkout(args.ref, Path(tmp)) if args.ref else APP_DIR
+        runs = [measure(app_dir) for _ in range(args.runs)]
+
+    print(f"app: {args.ref or 'working tree'}, median of {args.runs} runs")
+    print(
+        f"import:         {statistics.median(r['import'] for r in runs) * 1000:7.0f} ms"
+    )
+    print(
+        f"first response: "
+        f"{statistics.median(r['first_response'] for r in runs) * 1000:7.0f} ms"
+    )
+    print(f"imports pandas: {runs[0]['pandas']}, sklearn: {runs[0]['sklearn']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark: response_model serialization vs the fast JSON path of the todo app
+
+Seeds an in-memory database with 1k, 10k and 100k todos and times GET / and
+GET /todos through the app built with and without fast_json: Todo objects
+validated and dumped through response_model against column rows encoded
+straight to bytes.
+
+Run from Back-end/poetry-class:
+    PYTHONPATH=poetryclass/todo_app python -m benchmarks.serialization_bench
+"""
+
+import argparse
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel.pool import StaticPool
+
+from poetryclass.todo_app.main import PAGE_SIZE_MAX, Todo, create_app, get_session
+
+
+def seed(engine, rows: int) -> None:
+    """
+    Recreates the tables with `rows` todos
+    """
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.execute(
+            insert(Todo),
+            [{"title": f"Todo {i}", "completed": i % 2 == 0} for i in range(rows)],
+        )
+        session.commit()
+
+
+def best_of(client: TestClient, url: str, repeat: int) -> float:
+    """
+    Fastest of `repeat` requests, in milliseconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200
+    return min(timings) * 1000
+
+
+def main() -> None:
+    """
+    Benchmark entry point
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+
+    def get_bench_session():
+        with Session(engine) as session:
+            yield session
+
+    apps = {"default": create_app("sync"), "fast": create_app("sync", fast_json=True)}
+    for app in apps.values():
+        app.dependency_overrides[get_session] = get_bench_session
+
+    urls = ["/", f"/todos?limit={PAGE_SIZE_MAX}"]
+    print(f"{'rows':>8} {'url':<16} {'default ms':>11} {'fast ms':>9} {'speedup':>8}")
+    for rows in args.sizes:
+        seed(engine, rows)
+        for url in urls:
+            timings = {}
+            for name, app in apps.items():
+                with TestClient(app) as client:
+                    timings[name] = best_of(client, url, args.repeat)
+            print(
+                f"{rows:>8} {url:<16} {timings['default']:>11.1f} "
+                f"{timings['fast']:>9.1f} {timings['default'] / timings['fast']:>7.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark: default create_engine vs the shared tuned SQLite engine
+
+Runs concurrent writer and reader threads against a fresh database file with
+each engine and prints the throughput of both.
+
+Run from Back-end/poetry-class:
+    python -m benchmarks.sqlite_engine_bench --clients 16 --seconds 5
+"""
+
+import argparse
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Field, Session, SQLModel, create_engine, select
+
+from poetryclass.sqlite_engine import create_sqlite_engine
+
+
+class BenchRow(SQLModel, table=True):
+    """
+    Row written and read by the benchmark
+    """
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    title: str
+    completed: bool = False
+
+
+def writer(engine, stop: threading.Event, counts: dict, lock: threading.Lock):
+    """
+    Inserts one row per transaction until stopped
+    """
+    done = failed = 0
+    while not stop.is_set():
+        try:
+            with Session(engine) as session:
+                session.add(BenchRow(title=f"row {done}"))
+                session.commit()
+            done += 1
+        except OperationalError:
+            failed += 1
+    with lock:
+        counts["writes"] += done
+        counts["write_errors"] += failed
+
+
+def reader(engine, stop: threading.Event, counts: dict, lock: threading.Lock):
+    """
+    Reads random rows by primary key until stopped
+    """
+    done = failed = 0
+    while not stop.is_set():
+        try:
+            with Session(engine) as session:
+                session.exec(
+                    select(BenchRow).where(BenchRow.id == random.randint(1, 1000))
+                ).first()
+            done += 1
+        except OperationalError:
+            failed += 1
+    with lock:
+        counts["reads"] += done
+        counts["read_errors"] += failed
+
+
+def run(name: str, engine, clients: int, seconds: float) -> None:
+    """
+    Runs half the clients as writers and half as readers for `seconds`
+    """
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(BenchRow(title=f"seed {i}") for i in range(1000))
+        session.commit()
+
+    counts = {"writes": 0, "reads": 0, "write_errors": 0, "read_errors": 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+    writers = max(1, clients // 2)
+    threads = [
+        threading.Thread(
+            target=writer if i < writers else reader,
+            args=(engine, stop, counts, lock),
+        )
+        for i in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    print(
+        f"{name:>8}: {counts['writes'] / seconds:10.0f} writes/s "
+        f"{counts['reads'] / seconds:10.0f} reads/s "
+        f"({counts['write_errors']} write errors, "
+        f"{counts['read_errors']} read errors)"
+    )
+
+
+def main() -> None:
+    """
+    Benchmark entry point
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before = f"sqlite:///{Path(tmp) / 'before.db'}"
+        after = f"sqlite:///{Path(tmp) / 'after.db'}"
+        print(f"{args.clients} concurrent clients, {args.seconds}s per engine")
+        run(
+            "before",
+            create_engine(before, connect_args={"check_same_thread": False}),
+            args.clients,
+            args.seconds,
+        )
+        run("after", create_sqlite_engine(after), args.clients, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,14 @@
 Auth app database connection
 """
 
-from sqlmodel import SQLModel, create_engine, Field, Session
+from sqlmodel import SQLModel, Field, Session
+
+from poetryclass.sqlite_engine import create_sqlite_engine
 
 DB_URL = "sqlite:///auth_app.db"
 
 
-engine = create_engine(DB_URL, echo=True)
+engine = create_sqlite_engine(DB_URL)
 
 
 class User(SQLModel, table=True):
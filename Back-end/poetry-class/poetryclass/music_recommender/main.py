@@ -1,18 +1,40 @@
 """
 Music Recommender app backend
+
+The model is trained offline with `python train.py` and its newest artifact
+(or the one in MUSIC_MODEL_DIR) is loaded on startup, so serving never
+imports pandas or sklearn.
 """
 
-from typing import Union
+from contextlib import asynccontextmanager
+from typing import Annotated, Union
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from sqlmodel import SQLModel
 
-import pandas as pd
-from sklearn.tree import DecisionTreeClassifier
+from model import TreeModel, load_model
+
+
+class RecommendationRequest(SQLModel):
+    """
+    Recommendation request model, its fields are the features of the model
+    """
+
+    age: int
+    gender: int
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Loads the model artifact, checking it takes the request's features
+    """
+    app.state.model = load_model(list(RecommendationRequest.model_fields))
+    yield
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 
 app.add_middleware(
@@ -23,18 +45,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-music_data = pd.read_csv("./music_data_set.csv")
 
-# input set
-X = music_data.drop(columns=["genre"])
-
-# output set
-y = music_data["genre"]
-
-model = DecisionTreeClassifier()
-model.fit(X.values, y)
-
-prediction = model.predict([[21, 1], [22, 0]])
+def get_model(http_request: Request) -> TreeModel:
+    """
+    Returns the model loaded on startup
+    """
+    return http_request.app.state.model
 
 
 @app.get("/")
@@ -53,19 +69,11 @@ def read_item(item_id: int, q: Union[str, None] = None):
     return {"item_id": item_id, "q": q}
 
 
-class RecommendationRequest(SQLModel):
-    """
-    Recommendation request model
-    """
-
-    age: int
-    gender: int
-
-
 @app.post("/recommend")
-def recommend_music(request: RecommendationRequest):
+def recommend_music(
+    request: RecommendationRequest, model: Annotated[TreeModel, Depends(get_model)]
+):
     """
     Recommends music
     """
-    predict = model.predict([[request.age, request.gender]])
-    return predict[0]
+    return model.predict([request.age, request.gender])
@@ -0,0 +1,139 @@
+"""
+Music Recommender model artifact
+
+The decision tree is trained offline by train.py and saved as a versioned
+artifact directory under artifacts/:
+    manifest.json   version, feature schema, classes and checksums
+    tree.npy        one row per tree node, see NODE_DTYPE
+
+Serving only needs numpy: the nodes are memory-mapped from tree.npy and a
+prediction walks them from the root, without importing pandas or sklearn.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+
+ARTIFACTS_DIR: Path = Path(__file__).parent / "artifacts"
+
+# Version of the artifact layout, bumped when it changes
+ARTIFACT_FORMAT: int = 1
+
+TREE_FILE: str = "tree.npy"
+
+MANIFEST_FILE: str = "manifest.json"
+
+# A node of the tree. Leaves have left == right == -1 and a label; inner nodes
+# go left when features[feature] <= threshold
+NODE_DTYPE = np.dtype(
+    [
+        ("left", "<i4"),
+        ("right", "<i4"),
+        ("feature", "<i4"),
+        ("threshold", "<f8"),
+        ("label", "<i4"),
+    ]
+)
+
+
+class ModelArtifactError(RuntimeError):
+    """
+    Raised for a missing, corrupt or incompatible model artifact
+    """
+
+
+def file_sha256(path: Path) -> str:
+    """
+    Hex SHA-256 of a file
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def latest_artifact(artifacts_dir: Path = ARTIFACTS_DIR) -> Path:
+    """
+    Directory of the newest artifact, versions sort by time
+    """
+    versions = sorted(
+        path for path in artifacts_dir.glob("*") if (path / MANIFEST_FILE).is_file()
+    )
+    if not versions:
+        raise ModelArtifactError(
+            f"No model artifact in {artifacts_dir}, train one with: python train.py"
+        )
+    return versions[-1]
+
+
+class TreeModel:
+    """
+    Decision tree loaded from an artifact
+    """
+
+    def __init__(self, manifest: dict, tree: np.ndarray) -> None:
+        self.version: str = manifest["version"]
+        self.features: list[str] = [feature["name"] for feature in manifest["features"]]
+        self.classes: list[str] = manifest["classes"]
+        self.tree = tree
+
+    @classmethod
+    def load(cls, path: Path, features: Optional[Sequence[str]] = None) -> "TreeModel":
+        """
+        Loads and checks an artifact directory, memory-mapping the tree
+
+        Args:
+            path (Path): Artifact directory
+            features (Sequence[str]): Feature names the caller passes, in order
+
+        Raises:
+            ModelArtifactError: The artifact is missing, fails its checksum or
+                doesn't match the format or the features
+        """
+        try:
+            manifest = json.loads((path / MANIFEST_FILE).read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            raise ModelArtifactError(f"Can't read the manifest of {path}: {e}") from e
+        if manifest.get("format") != ARTIFACT_FORMAT:
+            raise ModelArtifactError(
+                f"{path} has format {manifest.get('format')}, expected {ARTIFACT_FORMAT}"
+            )
+        if file_sha256(path / TREE_FILE) != manifest["files"][TREE_FILE]:
+            raise ModelArtifactError(f"{path / TREE_FILE} doesn't match its checksum")
+
+        tree = np.load(path / TREE_FILE, mmap_mode="r")
+        if tree.dtype != NODE_DTYPE:
+            raise ModelArtifactError(f"{path / TREE_FILE} has nodes of {tree.dtype}")
+        model = cls(manifest, tree)
+        if features is not None and list(features) != model.features:
+            raise ModelArtifactError(
+                f"{path} expects features {model.features}, got {list(features)}"
+            )
+        return model
+
+    def predict(self, features: Sequence[float]) -> str:
+        """
+        Class of one row of features
+        """
+        # Compared in float32, as sklearn does
+        row = np.asarray(features, dtype=np.float32)
+        node = self.tree[0]
+        while node["left"] != -1:
+            if row[node["feature"]] <= node["threshold"]:
+                node = self.tree[node["left"]]
+            else:
+                node = self.tree[node["right"]]
+        return self.classes[node["label"]]
+
+
+def load_model(features: Optional[Sequence[str]] = None) -> TreeModel:
+    """
+    Loads the artifact in MUSIC_MODEL_DIR, or the newest one
+    """
+    path = os.getenv("MUSIC_MODEL_DIR")
+    return TreeModel.load(Path(path) if path else latest_artifact(), features)
@@ -0,0 +1,117 @@
+"""
+Music Recommender offline training
+
+Fits the decision tree on the dataset and writes a new artifact directory,
+artifacts/<version>/, that the app loads on startup (see model.py). Training
+is the only step that needs pandas and sklearn.
+
+Train from the music_recommender directory with:
+    python train.py
+"""
+
+import argparse
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.tree import DecisionTreeClassifier
+
+from model import (
+    ARTIFACT_FORMAT,
+    ARTIFACTS_DIR,
+    MANIFEST_FILE,
+    NODE_DTYPE,
+    TREE_FILE,
+    file_sha256,
+)
+
+DATASET: Path = Path(__file__).parent / "music_data_set.csv"
+
+TARGET: str = "genre"
+
+
+def export_tree(model: DecisionTreeClassifier) -> np.ndarray:
+    """
+    The nodes of a fitted tree as NODE_DTYPE rows
+    """
+    tree = model.tree_
+    nodes = np.empty(tree.node_count, dtype=NODE_DTYPE)
+    nodes["left"] = tree.children_left
+    nodes["right"] = tree.children_right
+    nodes["feature"] = tree.feature
+    nodes["threshold"] = tree.threshold
+    # The class with the most samples in the node, as predict picks it
+    nodes["label"] = tree.value[:, 0, :].argmax(axis=1)
+    return nodes
+
+
+def feature_type(dtype) -> str:
+    """
+    Schema type of a dataset column
+    """
+    if pd.api.types.is_integer_dtype(dtype):
+        return "int"
+    if pd.api.types.is_float_dtype(dtype):
+        return "float"
+    raise ValueError(f"Unsupported feature type {dtype}")
+
+
+def train(dataset: Path, output: Path, version: str) -> Path:
+    """
+    Fits the tree and writes the artifact, returns its directory
+    """
+    music_data = pd.read_csv(dataset)
+    X = music_data.drop(columns=[TARGET])
+    y = music_data[TARGET]
+
+    model = DecisionTreeClassifier(random_state=0)
+    model.fit(X.values, y)
+
+    path = output / version
+    path.mkdir(parents=True, exist_ok=False)
+    np.save(path / TREE_FILE, export_tree(model))
+    manifest = {
+        "format": ARTIFACT_FORMAT,
+        "version": version,
+        "model": "DecisionTreeClassifier",
+        "sklearn": sklearn.__version__,
+        "dataset": {
+            "file": dataset.name,
+            "rows": len(music_data),
+            "sha256": file_sha256(dataset),
+        },
+        "features": [
+            {"name": name, "type": feature_type(dtype)}
+            for name, dtype in X.dtypes.items()
+        ],
+        "target": TARGET,
+        "classes": [str(label) for label in model.classes_],
+        "files": {TREE_FILE: file_sha256(path / TREE_FILE)},
+    }
+    (path / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2) + "\n")
+    return path
+
+
+def main() -> None:
+    """
+    Training command line
+    """
+    parser = argparse.ArgumentParser(description="Train the music recommender")
+    parser.add_argument("--dataset", type=Path, default=DATASET)
+    parser.add_argument("--output", type=Path, default=ARTIFACTS_DIR)
+    parser.add_argument(
+        "--version",
+        default=datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ"),
+        help="Artifact version, the UTC time by default",
+    )
+    args = parser.parse_args()
+
+    path = train(args.dataset, args.output, args.version)
+    print(f"Wrote model artifact {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+FastAPI quiz app in-memory question bank
+
+With QUIZ_QUESTION_BANK=1 the questions are loaded once on startup into an
+immutable bank, and the read endpoints answer from it without touching
+SQLite. Every write to the quiz table builds a new bank and swaps it in, so a
+request always sees a complete one.
+"""
+
+from types import MappingProxyType
+from typing import Mapping
+
+from sqlmodel import Session, select
+
+from poetryclass.sqlite_engine import env_flag
+from schema import Quiz, QuizRead
+
+QUESTION_BANK: bool = env_flag("QUIZ_QUESTION_BANK")
+
+
+class QuestionBank:
+    """
+    Read-only snapshot of the quiz questions
+    """
+
+    def __init__(self, questions: list[QuizRead]) -> None:
+        self.questions: tuple[QuizRead, ...] = tuple(questions)
+        self.by_id: Mapping[int, QuizRead] = MappingProxyType(
+            {question.id: question for question in self.questions}
+        )
+
+    @classmethod
+    def load(cls, session: Session) -> "QuestionBank":
+        """
+        Reads every question from the database
+        """
+        quizzes = session.exec(select(Quiz).order_by(Quiz.id)).all()
+        return cls([QuizRead.model_validate(quiz) for quiz in quizzes])
+
+
+_bank: QuestionBank | None = None
+
+
+def get_bank() -> QuestionBank | None:
+    """
+    The current question bank, None when it is off
+    """
+    return _bank
+
+
+def rebuild_bank(session: Session) -> None:
+    """
+    Replaces the question bank after the quiz table changed, if it is on
+    """
+    global _bank
+    if QUESTION_BANK:
+        _bank = QuestionBank.load(session)
@@ -0,0 +1,159 @@
+"""
+FastAPI quiz app server-side grading
+
+The correct options are kept in memory as NumPy arrays sorted by question id,
+read once until the quiz table changes. A batch of answer sheets is flattened
+into arrays of question ids and answers and graded with a few vectorized
+operations, whatever the number of sheets. Answers to questions that don't
+exist (e.g. deleted since the session started) count as wrong.
+
+Scores are added to the points of the sheet's user and to the total points
+in one transaction, or to the points accumulator with QUIZ_POINTS_BUFFER=1.
+"""
+
+import itertools
+import threading
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+from sqlmodel import Session, select
+
+from bank import get_bank
+from points import TOTAL, record_points
+from schema import AnswerSheet, Quiz, SheetResult
+
+
+class AnswerKey:
+    """
+    Correct option of every question, `correct[i]` is the one of `ids[i]`
+    """
+
+    def __init__(self, ids: np.ndarray, correct: np.ndarray) -> None:
+        order = np.argsort(ids)
+        self.ids = ids[order]
+        self.correct = correct[order]
+
+    @classmethod
+    def load(cls, session: Session) -> "AnswerKey":
+        """
+        Reads the key from the question bank if it is on, else the database
+        """
+        bank = get_bank()
+        if bank:
+            rows = [(quiz.id, quiz.correct_option) for quiz in bank.questions]
+        else:
+            rows = session.exec(select(Quiz.id, Quiz.correct_option)).all()
+        key = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        return cls(key[:, 0], key[:, 1])
+
+    def grade(self, question_ids: np.ndarray, answers: np.ndarray) -> np.ndarray:
+        """
+        Whether each answer is the correct option of its question
+        """
+        if not len(self.ids):
+            return np.zeros(len(question_ids), dtype=bool)
+        # Unknown ids land on a neighbour, or past the end, and are masked out
+        positions = np.minimum(
+            np.searchsorted(self.ids, question_ids), len(self.ids) - 1
+        )
+        known = self.ids[positions] == question_ids
+        return known & (self.correct[positions] == answers)
+
+    def is_correct(self, question_id: int, answer: int) -> bool:
+        """
+        Whether a single answer is the correct option of its question
+        """
+        position = int(np.searchsorted(self.ids, question_id))
+        return bool(
+            position < len(self.ids)
+            and self.ids[position] == question_id
+            and self.correct[position] == answer
+        )
+
+
+_answer_key: Optional[AnswerKey] = None
+# Bumped by every invalidation, so a load that overlapped one isn't kept
+_answer_key_generation = 0
+_answer_key_lock = threading.Lock()
+
+
+def answer_key(session: Session) -> AnswerKey:
+    """
+    The answer key, loaded once until the quiz table changes
+
+    A key loaded while the table changed may be stale, it grades the request
+    that loaded it but isn't cached.
+    """
+    global _answer_key
+    with _answer_key_lock:
+        key, generation = _answer_key, _answer_key_generation
+    if key is not None:
+        return key
+    key = AnswerKey.load(session)
+    with _answer_key_lock:
+        if _answer_key_generation == generation:
+            _answer_key = key
+    return key
+
+
+def invalidate_answer_key() -> None:
+    """
+    Drops the cached answer key after the quiz table changed
+    """
+    global _answer_key, _answer_key_generation
+    with _answer_key_lock:
+        _answer_key_generation += 1
+        _answer_key = None
+
+
+def grade_sheets(key: AnswerKey, sheets: list[AnswerSheet]) -> list[SheetResult]:
+    """
+    Grades every sheet at once
+    """
+    lengths = np.fromiter(
+        (len(sheet.answers) for sheet in sheets), np.int64, len(sheets)
+    )
+    count = int(lengths.sum())
+    question_ids = np.fromiter(
+        itertools.chain.from_iterable(sheet.question_ids for sheet in sheets),
+        np.int64,
+        count,
+    )
+    answers = np.fromiter(
+        itertools.chain.from_iterable(sheet.answers for sheet in sheets),
+        np.int64,
+        count,
+    )
+
+    correct = key.grade(question_ids, answers)
+    scores = np.bincount(
+        np.repeat(np.arange(len(sheets)), lengths),
+        weights=correct,
+        minlength=len(sheets),
+    ).astype(np.int64)
+
+    marks = correct.tolist()
+    ends = np.cumsum(lengths).tolist()
+    return [
+        SheetResult.model_construct(
+            user=sheet.user, score=score, total=end - start, correct=marks[start:end]
+        )
+        for sheet, score, start, end in zip(
+            sheets, scores.tolist(), [0] + ends[:-1], ends
+        )
+    ]
+
+
+def grade_and_record(session: Session, sheets: list[AnswerSheet]) -> list[SheetResult]:
+    """
+    Grades the sheets and adds the scores to the points counters
+    """
+    results = grade_sheets(answer_key(session), sheets)
+    changes: Counter = Counter()
+    for result in results:
+        changes[TOTAL] += result.score
+        if result.user is not None:
+            changes[result.user] += result.score
+    record_points(session, changes)
+    return results
@@ -0,0 +1,174 @@
+"""
+FastAPI quiz app bulk question import
+
+A file is either a JSON array of questions, like quiz-data.json, or NDJSON
+with one question per line. It is parsed as it is read, so the whole file is
+never held in memory, and the questions are inserted in batches within a
+single transaction: either every question is imported or none is.
+
+Import a file from the command line with:
+    python importer.py quiz-data.json
+"""
+
+import argparse
+import io
+import itertools
+import json
+import os
+from typing import IO, Any, Iterator
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlmodel import Session, SQLModel
+
+from database import engine
+from schema import Quiz, QuizImport
+
+# Characters read from the file at a time
+READ_SIZE: int = 64 * 1024
+
+# Longest question accepted in a JSON array, in characters
+MAX_ITEM_SIZE: int = 1024 * 1024
+
+# Questions inserted with one statement
+IMPORT_BATCH_SIZE: int = int(os.getenv("QUIZ_IMPORT_BATCH_SIZE", "500"))
+
+decoder = json.JSONDecoder()
+
+
+class QuizImportError(ValueError):
+    """
+    Raised for a file or question that can't be imported
+    """
+
+
+def iter_json_array(file: IO[str], buffer: str) -> Iterator[Any]:
+    """
+    Yields the items of a top-level JSON array one at a time
+    """
+    position = buffer.index("[") + 1
+    while True:
+        # Skip whitespace and the comma between items, reading more as needed
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer):
+                break
+            chunk = file.read(READ_SIZE)
+            if not chunk:
+                raise QuizImportError("Unexpected end of the JSON array")
+            buffer, position = chunk, 0
+
+        if buffer[position] == "]":
+            return
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+                break
+            except json.JSONDecodeError as e:
+                # The item may continue in the next chunk
+                chunk = file.read(READ_SIZE)
+                if not chunk or len(buffer) - position > MAX_ITEM_SIZE:
+                    raise QuizImportError(f"Invalid JSON: {e}") from e
+                buffer, position = buffer[position:] + chunk, 0
+        yield item
+        position = end
+
+
+def iter_ndjson(file: IO[str], buffer: str) -> Iterator[Any]:
+    """
+    Yields the item on each non-blank line
+    """
+    # The start of the first line was already read to detect the format
+    first_line = buffer + file.readline()
+    for number, line in enumerate(itertools.chain([first_line], file), start=1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise QuizImportError(f"Invalid JSON on line {number}") from e
+
+
+def iter_questions(file: IO[str]) -> Iterator[QuizImport]:
+    """
+    Yields the validated questions of a JSON or NDJSON file
+    """
+    buffer = ""
+    while not buffer.strip():
+        chunk = file.read(1)
+        if not chunk:
+            return
+        buffer += chunk
+    items = (
+        iter_json_array(file, buffer)
+        if buffer.strip().startswith("[")
+        else iter_ndjson(file, buffer)
+    )
+    for number, item in enumerate(items, start=1):
+        try:
+            yield QuizImport.model_validate(item)
+        except ValidationError as e:
+            raise QuizImportError(f"Question {number} is invalid: {e}") from e
+
+
+def import_questions(
+    session: Session, file: IO[str], batch_size: int = IMPORT_BATCH_SIZE
+) -> int:
+    """
+    Inserts every question of the file in one transaction, returns how many
+
+    Raises:
+        QuizImportError: The file or one of its questions is invalid, nothing
+            is imported
+    """
+    imported = 0
+    batch: list[dict] = []
+    try:
+        for question in iter_questions(file):
+            batch.append(question.model_dump())
+            if len(batch) >= batch_size:
+                session.execute(insert(Quiz), batch)
+                imported += len(batch)
+                batch.clear()
+        if batch:
+            session.execute(insert(Quiz), batch)
+            imported += len(batch)
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+    return imported
+
+
+def import_upload(session: Session, file: IO[bytes]) -> int:
+    """
+    Imports an uploaded UTF-8 file, mapping bad input to a 400
+    """
+    text = io.TextIOWrapper(file, encoding="utf-8")
+    try:
+        return import_questions(session, text)
+    except (QuizImportError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    finally:
+        # Leave the upload for FastAPI to close
+        text.detach()
+
+
+def main() -> None:
+    """
+    Bulk import command line
+    """
+    parser = argparse.ArgumentParser(description="Import quiz questions")
+    parser.add_argument("file", help="JSON array or NDJSON file of questions")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    SQLModel.metadata.create_all(engine)
+    with open(args.file, encoding="utf-8") as file, Session(engine) as session:
+        imported = import_questions(session, file, args.batch_size)
+    print(f"Imported {imported} questions")
+
+
+if __name__ == "__main__":
+    main()
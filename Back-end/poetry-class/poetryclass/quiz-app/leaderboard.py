@@ -0,0 +1,232 @@
+"""
+FastAPI quiz app leaderboard
+
+Every player's points are kept in memory, ordered in an indexable skip list,
+so the top players, a player's rank and the players around them are read in
+O(log n) (plus the entries returned) and a score change moves one entry. The
+points themselves are persisted in the `userpoints` table; the leaderboard is
+loaded from it once on startup and then follows every points change, so no
+request sorts the table.
+
+Players with the same points share a rank and are listed by name.
+"""
+
+import random
+import threading
+from typing import Iterable, Optional
+
+from sqlmodel import Session, select
+
+from schema import LeaderboardEntry, UserPoints
+
+# Levels of the skip list, enough for billions of players
+MAX_LEVEL: int = 32
+
+# Chance that a node is linked on the next level too
+LEVEL_PROBABILITY: float = 0.25
+
+# (-points, user): the highest points first, then by name
+Key = tuple[int, str]
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key: Optional[Key], level: int) -> None:
+        self.key = key
+        self.next: list[Optional["_Node"]] = [None] * level
+        # Positions skipped by following next[i]
+        self.width: list[int] = [1] * level
+
+
+class SkipList:
+    """
+    Sorted keys with O(log n) insert, remove, rank and access by position
+    """
+
+    def __init__(self) -> None:
+        self._head = _Node(None, MAX_LEVEL)
+        self._level = 1
+        self._size = 0
+        self._random = random.Random()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < MAX_LEVEL and self._random.random() < LEVEL_PROBABILITY:
+            level += 1
+        return level
+
+    def rank(self, key: Key) -> int:
+        """
+        How many keys are lower than `key`
+        """
+        node, position = self._head, 0
+        for i in reversed(range(self._level)):
+            while node.next[i] is not None and node.next[i].key < key:
+                position += node.width[i]
+                node = node.next[i]
+        return position
+
+    def insert(self, key: Key) -> None:
+        """
+        Adds a key
+        """
+        update = [self._head] * MAX_LEVEL
+        positions = [0] * MAX_LEVEL
+        node, position = self._head, 0
+        for i in reversed(range(self._level)):
+            while node.next[i] is not None and node.next[i].key < key:
+                position += node.width[i]
+                node = node.next[i]
+            update[i], positions[i] = node, position
+
+        level = self._random_level()
+        for i in range(self._level, level):
+            self._head.width[i] = self._size + 1
+        self._level = max(self._level, level)
+
+        new = _Node(key, level)
+        for i in range(level):
+            previous = update[i]
+            new.next[i] = previous.next[i]
+            previous.next[i] = new
+            new.width[i] = positions[i] + previous.width[i] - position
+            previous.width[i] = position + 1 - positions[i]
+        for i in range(level, self._level):
+            update[i].width[i] += 1
+        self._size += 1
+
+    def remove(self, key: Key) -> None:
+        """
+        Removes a key
+
+        Raises:
+            KeyError: The key isn't in the list
+        """
+        update = [self._head] * MAX_LEVEL
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.next[i] is not None and node.next[i].key < key:
+                node = node.next[i]
+            update[i] = node
+
+        target = node.next[0]
+        if target is None or target.key != key:
+            raise KeyError(key)
+        for i in range(self._level):
+            if update[i].next[i] is target:
+                update[i].width[i] += target.width[i] - 1
+                update[i].next[i] = target.next[i]
+            else:
+                update[i].width[i] -= 1
+        while self._level > 1 and self._head.next[self._level - 1] is None:
+            self._level -= 1
+        self._size -= 1
+
+    def slice(self, start: int, count: int) -> list[Key]:
+        """
+        Up to `count` keys from position `start` on
+        """
+        node, position = self._head, 0
+        for i in reversed(range(self._level)):
+            while node.next[i] is not None and position + node.width[i] <= start:
+                position += node.width[i]
+                node = node.next[i]
+        keys = []
+        node = node.next[0]
+        while node is not None and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+class Leaderboard:
+    """
+    Players ranked by their points
+    """
+
+    def __init__(self) -> None:
+        self._points: dict[str, int] = {}
+        self._ranking = SkipList()
+        self._lock = threading.Lock()
+
+    def load(self, rows: Iterable[tuple[str, int]]) -> None:
+        """
+        Replaces every player's points
+        """
+        points = dict(rows)
+        ranking = SkipList()
+        for user, user_points in points.items():
+            ranking.insert((-user_points, user))
+        with self._lock:
+            self._points, self._ranking = points, ranking
+
+    def add(self, user: str, delta: int) -> None:
+        """
+        Adds `delta` to the points of a player, adding them if needed
+        """
+        with self._lock:
+            current = self._points.get(user)
+            if current is not None:
+                self._ranking.remove((-current, user))
+            self._points[user] = (current or 0) + delta
+            self._ranking.insert((-self._points[user], user))
+
+    def _entries(self, start: int, count: int) -> list[LeaderboardEntry]:
+        keys = self._ranking.slice(start, count)
+        if not keys:
+            return []
+        # Players tied with the first one may come before `start`
+        rank = self._ranking.rank((keys[0][0], "")) + 1
+        entries: list[LeaderboardEntry] = []
+        for position, (negative_points, user) in enumerate(keys, start=start):
+            if entries and -negative_points != entries[-1].points:
+                rank = position + 1
+            entries.append(
+                LeaderboardEntry(rank=rank, user=user, points=-negative_points)
+            )
+        return entries
+
+    def top(self, limit: int) -> list[LeaderboardEntry]:
+        """
+        The `limit` best players
+        """
+        with self._lock:
+            return self._entries(0, limit)
+
+    def entry(self, user: str) -> Optional[LeaderboardEntry]:
+        """
+        The rank and points of a player, None if they have none
+        """
+        with self._lock:
+            points = self._points.get(user)
+            if points is None:
+                return None
+            rank = self._ranking.rank((-points, "")) + 1
+            return LeaderboardEntry(rank=rank, user=user, points=points)
+
+    def around(self, user: str, radius: int) -> list[LeaderboardEntry]:
+        """
+        A player with up to `radius` players above and below them, empty if
+        they have no points
+        """
+        with self._lock:
+            points = self._points.get(user)
+            if points is None:
+                return []
+            position = self._ranking.rank((-points, user))
+            start = max(position - radius, 0)
+            return self._entries(start, position - start + radius + 1)
+
+
+leaderboard = Leaderboard()
+
+
+def load_leaderboard(session: Session) -> None:
+    """
+    Loads every player's points from the database
+    """
+    leaderboard.load(session.exec(select(UserPoints.user, UserPoints.points)).all())
@@ -0,0 +1,296 @@
+"""
+FastAPI quiz app timed quizzes over WebSocket
+
+A player connects to /quiz/live and gets the questions of a random session one
+at a time, answering each within QUIZ_LIVE_TIME_LIMIT seconds. The server
+enforces the limit: every deadline sits in one shared timer wheel ticking
+every QUIZ_LIVE_TICK seconds, so thousands of players cost one task and a few
+list appends instead of a sleeping task or timer per player. The score is
+kept in memory and recorded once, when the session ends or the player leaves.
+
+Messages, all JSON:
+    server: {"type": "question", "index", "id", "question", "options", "time_limit"}
+    client: {"index": <question index>, "answer": <option index>}
+    server: {"type": "result", "index", "correct", "score"}
+            or {"type": "timeout", "index", "score"} when no answer came in time
+    server: {"type": "done", "score", "total", "correct"} then closes
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+from collections import Counter
+from typing import Callable, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session
+
+from database import engine
+from grading import AnswerKey, answer_key
+from points import TOTAL, record_points
+from sampler import sample_questions
+from schema import QuizQuestion
+
+logger = logging.getLogger(__name__)
+
+# Seconds a player has to answer a question
+LIVE_TIME_LIMIT: float = float(os.getenv("QUIZ_LIVE_TIME_LIMIT", "20"))
+
+# Seconds between timer wheel ticks, the precision of the time limit
+LIVE_TICK: float = float(os.getenv("QUIZ_LIVE_TICK", "0.1"))
+
+# Slots of the timer wheel, deadlines further than one turn wait for later turns
+WHEEL_SLOTS: int = 512
+
+
+class Timer:
+    """
+    A callback scheduled on the timer wheel
+    """
+
+    __slots__ = ("callback", "expires", "cancelled")
+
+    def __init__(self, callback: Callable[[], None], expires: int) -> None:
+        self.callback = callback
+        self.expires = expires
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """
+        Keeps the callback from running, it is dropped on its slot's turn
+        """
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel running callbacks after a delay, to a tick's precision
+
+    A timer due in `t` ticks is appended to slot `(now + t) % slots`.
+    Scheduling and cancelling are O(1), and each tick only looks at the
+    timers of one slot.
+    """
+
+    def __init__(self, tick: float, slots: int) -> None:
+        self.tick = tick
+        self._slots: list[list[Timer]] = [[] for _ in range(slots)]
+        self._now = 0
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> Timer:
+        """
+        Runs `callback` in `delay` seconds, rounded up to a tick
+        """
+        expires = self._now + max(math.ceil(delay / self.tick), 1)
+        timer = Timer(callback, expires)
+        self._slots[expires % len(self._slots)].append(timer)
+        return timer
+
+    def _advance(self) -> None:
+        self._now += 1
+        slot = self._slots[self._now % len(self._slots)]
+        due = [timer for timer in slot if timer.expires <= self._now]
+        slot[:] = [
+            timer for timer in slot if timer.expires > self._now and not timer.cancelled
+        ]
+        for timer in due:
+            if timer.cancelled:
+                continue
+            try:
+                timer.callback()
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception("Timer callback failed")
+
+    async def run(self) -> None:
+        """
+        Ticks until cancelled, catching up on the ticks missed by a busy loop
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time() - self._now * self.tick
+        while True:
+            await asyncio.sleep(start + (self._now + 1) * self.tick - loop.time())
+            while self._now < int((loop.time() - start) / self.tick):
+                self._advance()
+
+
+timer_wheel = TimerWheel(LIVE_TICK, WHEEL_SLOTS)
+
+# Tasks sending what follows a timeout, referenced until they finish
+_timeouts: set[asyncio.Task] = set()
+
+
+def is_int(value) -> bool:
+    """
+    Whether a decoded JSON value is an integer, booleans aren't
+    """
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class LivePlayer:
+    """
+    The state of one player's timed quiz
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user: Optional[str],
+        questions: list[QuizQuestion],
+        key: AnswerKey,
+    ) -> None:
+        self.websocket = websocket
+        self.user = user
+        self.questions = questions
+        self.key = key
+        self.index = 0
+        self.correct: list[bool] = []
+        self.finished = False
+        self._timer: Optional[Timer] = None
+        # Answers and timeouts both send, one message at a time
+        self._send_lock = asyncio.Lock()
+
+    @property
+    def score(self) -> int:
+        return sum(self.correct)
+
+    async def send(self, message: dict) -> None:
+        async with self._send_lock:
+            await self.websocket.send_json(message)
+
+    async def ask(self) -> None:
+        """
+        Sends the current question, or ends the quiz after the last one
+        """
+        if self.index >= len(self.questions):
+            await self.finish()
+            return
+        index = self.index
+        self._timer = timer_wheel.schedule(LIVE_TIME_LIMIT, lambda: self.expire(index))
+        await self.send(
+            {
+                "type": "question",
+                "index": index,
+                **self.questions[index].model_dump(),
+                "time_limit": LIVE_TIME_LIMIT,
+            }
+        )
+
+    def expire(self, index: int) -> None:
+        """
+        Timer wheel callback, moves on if question `index` is still unanswered
+        """
+        if self.finished or index != self.index:
+            return
+        self.correct.append(False)
+        self.index += 1
+        task = asyncio.create_task(self.after_timeout(index))
+        _timeouts.add(task)
+        task.add_done_callback(_timeouts.discard)
+
+    async def after_timeout(self, index: int) -> None:
+        try:
+            await self.send({"type": "timeout", "index": index, "score": self.score})
+            await self.ask()
+        except (WebSocketDisconnect, RuntimeError):
+            # The player left, the handler records the score
+            pass
+
+    async def answer(self, text: str) -> None:
+        """
+        Grades an answer to the current question and sends the next one
+
+        The answer names the question it is for, so one sent as the question
+        timed out isn't taken for an answer to the next.
+        """
+        try:
+            message = json.loads(text)
+        except json.JSONDecodeError:
+            message = None
+        if not isinstance(message, dict):
+            message = {}
+        index, option = message.get("index"), message.get("answer")
+        if not (is_int(index) and is_int(option)):
+            await self.send(
+                {
+                    "type": "error",
+                    "detail": 'Expected {"index": <int>, "answer": <int>}',
+                }
+            )
+            return
+        if self.finished or index != self.index:
+            # Too late, the question timed out
+            return
+        if self._timer:
+            self._timer.cancel()
+        correct = self.key.is_correct(self.questions[index].id, option)
+        self.correct.append(correct)
+        self.index += 1
+        await self.send(
+            {"type": "result", "index": index, "correct": correct, "score": self.score}
+        )
+        await self.ask()
+
+    async def finish(self) -> None:
+        """
+        Sends the final score and closes the connection
+        """
+        if self.finished:
+            return
+        self.finished = True
+        await self.send(
+            {
+                "type": "done",
+                "score": self.score,
+                "total": len(self.questions),
+                "correct": self.correct,
+            }
+        )
+        await self.websocket.close()
+
+    def stop(self) -> None:
+        """
+        Ends the quiz without sending anything, the player left
+        """
+        self.finished = True
+        if self._timer:
+            self._timer.cancel()
+
+
+def start_session(n: int, seed: Optional[int]) -> tuple[list[QuizQuestion], AnswerKey]:
+    """
+    Picks the questions of a live quiz with the answer key to grade them
+    """
+    with Session(engine) as session:
+        return sample_questions(session, n, seed).questions, answer_key(session)
+
+
+def save_score(user: Optional[str], score: int) -> None:
+    """
+    Adds the score of a finished or abandoned quiz to the points
+    """
+    with Session(engine) as session:
+        changes = Counter({TOTAL: score})
+        if user is not None:
+            changes[user] += score
+        record_points(session, changes)
+
+
+async def play(websocket: WebSocket, user: Optional[str], n: int, seed: Optional[int]):
+    """
+    Runs a timed quiz over an accepted WebSocket until it ends or the player
+    leaves, then records the score
+    """
+    questions, key = await run_in_threadpool(start_session, n, seed)
+    player = LivePlayer(websocket, user, questions, key)
+    try:
+        await player.ask()
+        while not player.finished:
+            await player.answer(await websocket.receive_text())
+    except (WebSocketDisconnect, RuntimeError):
+        # Disconnected, or closed by a timeout finishing the quiz
+        pass
+    finally:
+        player.stop()
+        await run_in_threadpool(save_score, user, player.score)
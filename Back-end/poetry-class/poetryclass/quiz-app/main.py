@@ -2,28 +2,89 @@
 FastAPI quiz app entry point
 """
 
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from typing import Annotated
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import (
+    FastAPI,
+    HTTPException,
+    Depends,
+    Query,
+    Response,
+    UploadFile,
+    WebSocket,
+)
 from fastapi.middleware.cors import CORSMiddleware
 from sqlmodel import SQLModel, Session, select
 
 
-from schema import Quiz, Points, get_session
+from schema import (
+    Quiz,
+    QuizImportResult,
+    QuizSession,
+    GradeRequest,
+    SheetResult,
+    Points,
+    UserPoints,
+    PendingPoints,
+    LeaderboardEntry,
+    get_session,
+)
 from database import engine
+from bank import get_bank, rebuild_bank
+from importer import import_upload
+from grading import grade_and_record, invalidate_answer_key
+from sampler import SESSION_MAX_QUESTIONS, invalidate_question_ids, sample_questions
+from leaderboard import leaderboard, load_leaderboard
+from live import play, timer_wheel
+from points import (
+    POINTS_BUFFER,
+    TOTAL,
+    add_total_points,
+    add_user_points,
+    buffer_points,
+    flush_periodically,
+    points_accumulator,
+    set_total_points,
+)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
-    Creates the database and the quiz table if it doesn't exist
+    Creates the database and the quiz table if it doesn't exist, loads the
+    leaderboard and the question bank, starts the timer wheel of the live
+    quizzes and starts flushing buffered points if they are on
     """
     SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        rebuild_bank(session)
+        load_leaderboard(session)
+    wheel = asyncio.create_task(timer_wheel.run())
+    flusher = asyncio.create_task(flush_periodically()) if POINTS_BUFFER else None
     yield
+    wheel.cancel()
+    if flusher:
+        # The flusher writes the last buffered points as it stops
+        flusher.cancel()
+        with suppress(asyncio.CancelledError):
+            await flusher
 
 
 app = FastAPI(lifespan=lifespan)
 
+# Most players returned by a leaderboard request
+LEADERBOARD_MAX: int = 100
+
+
+def refresh_quiz_caches(session: Session) -> None:
+    """
+    Rebuilds what is kept in memory about the quiz table after it changed
+    """
+    rebuild_bank(session)
+    invalidate_question_ids()
+    invalidate_answer_key()
+
 
 # Allow any origin, credentials, and specific methods and headers
 app.add_middleware(
@@ -42,7 +103,8 @@ def get_quizzes(session: Annotated[Session, Depends(get_session)]):
     """
     Returns all the quizzes
     """
-    quizzes = session.exec(select(Quiz)).all()
+    bank = get_bank()
+    quizzes = bank.questions if bank else session.exec(select(Quiz)).all()
     if quizzes:
         return quizzes
     return "No quizzes in the database"
@@ -71,9 +133,60 @@ def create_quiz_question(
     session.add(new_quiz)
     session.commit()
     session.refresh(new_quiz)
+    refresh_quiz_caches(session)
     return new_quiz
 
 
+@app.post("/quiz/import", response_model=QuizImportResult)
+def import_quiz_questions(
+    session: Annotated[Session, Depends(get_session)], file: UploadFile
+):
+    """
+    Imports the questions of a JSON array or NDJSON file in one transaction
+    """
+    imported = import_upload(session, file.file)
+    refresh_quiz_caches(session)
+    return QuizImportResult(imported=imported)
+
+
+@app.get("/quiz/session", response_model=QuizSession)
+def get_quiz_session(
+    session: Annotated[Session, Depends(get_session)],
+    n: Annotated[int, Query(ge=1, le=SESSION_MAX_QUESTIONS)] = 10,
+    seed: int | None = None,
+):
+    """
+    Returns `n` random questions without their correct options, the same ones
+    for the same seed
+    """
+    return sample_questions(session, n, seed)
+
+
+@app.post("/quiz/grade", response_model=list[SheetResult])
+def grade_quiz(
+    session: Annotated[Session, Depends(get_session)], request: GradeRequest
+):
+    """
+    Grades one or many answer sheets and adds the scores to the points
+    """
+    return grade_and_record(session, request.sheets)
+
+
+@app.websocket("/quiz/live")
+async def live_quiz(
+    websocket: WebSocket,
+    user: str | None = None,
+    n: Annotated[int, Query(ge=1, le=SESSION_MAX_QUESTIONS)] = 10,
+    seed: int | None = None,
+):
+    """
+    Plays a timed quiz of `n` random questions, one message per question and
+    answer, and adds the score to the points when it ends
+    """
+    await websocket.accept()
+    await play(websocket, user, n, seed)
+
+
 @app.post("/quiz/delete")
 def delete_quiz_question(session: Annotated[Session, Depends(get_session)], id: int):
     """
@@ -82,15 +195,52 @@ def delete_quiz_question(session: Annotated[Session, Depends(get_session)], id:
     quiz = session.exec(select(Quiz).where(Quiz.id == id)).first()
     session.delete(quiz)
     session.commit()
+    refresh_quiz_caches(session)
     return quiz
 
 
+@app.get("/leaderboard", response_model=list[LeaderboardEntry])
+def get_leaderboard(limit: Annotated[int, Query(ge=1, le=LEADERBOARD_MAX)] = 10):
+    """
+    Returns the players with the most points
+    """
+    return leaderboard.top(limit)
+
+
+@app.get("/leaderboard/users/{user}", response_model=LeaderboardEntry)
+def get_leaderboard_rank(user: str):
+    """
+    Returns the rank and points of a player
+    """
+    entry = leaderboard.entry(user)
+    if entry:
+        return entry
+    raise HTTPException(status_code=404, detail=f"No points found for {user}")
+
+
+@app.get("/leaderboard/users/{user}/around", response_model=list[LeaderboardEntry])
+def get_leaderboard_around(
+    user: str, radius: Annotated[int, Query(ge=0, le=LEADERBOARD_MAX)] = 5
+):
+    """
+    Returns a player with the players ranked just above and below them
+    """
+    entries = leaderboard.around(user, radius)
+    if entries:
+        return entries
+    raise HTTPException(status_code=404, detail=f"No points found for {user}")
+
+
 @app.get("/{id}")
 def get_quiz_question_by_id(session: Annotated[Session, Depends(get_session)], id: int):
     """
     Returns the quiz question by id
     """
-    quiz = session.exec(select(Quiz).where(Quiz.id == id)).first()
+    bank = get_bank()
+    if bank:
+        quiz = bank.by_id.get(id)
+    else:
+        quiz = session.exec(select(Quiz).where(Quiz.id == id)).first()
     if quiz:
         return quiz
     raise HTTPException(status_code=404, detail=f"Question not found with id {id}")
@@ -99,11 +249,13 @@ def get_quiz_question_by_id(session: Annotated[Session, Depends(get_session)], i
 @app.get("/points/total")
 def get_points(session: Annotated[Session, Depends(get_session)]):
     """
-    Returns the total points
+    Returns the total points, including buffered changes not written yet
     """
-    points = session.exec(select(Points)).first()
+    points = session.exec(select(Points).order_by(Points.id)).first()
     if points:
-        return points
+        return Points(
+            id=points.id, points=points.points + points_accumulator.pending(TOTAL)
+        )
     raise HTTPException(status_code=404, detail="No points found")
 
 
@@ -112,12 +264,55 @@ def edit_points(session: Annotated[Session, Depends(get_session)], points: int):
     """
     Edit the points counter
     """
-    db_points = session.exec(select(Points)).first()
-    print("Db points", db_points)
+    db_points = set_total_points(session, points)
     if db_points:
-        db_points.points = points
-        session.add(db_points)
-        session.commit()
-        session.refresh(db_points)
         return db_points
     raise HTTPException(status_code=404, detail="No points found")
+
+
+@app.post("/points/increment", response_model=Points | PendingPoints)
+def increment_points(
+    session: Annotated[Session, Depends(get_session)],
+    response: Response,
+    delta: int = 1,
+):
+    """
+    Adds `delta` to the points counter without losing concurrent updates
+
+    With buffered points the change is accepted and written on the next flush.
+    """
+    if POINTS_BUFFER:
+        response.status_code = 202
+        buffer_points(TOTAL, delta)
+        return PendingPoints(pending=points_accumulator.pending(TOTAL))
+    db_points = add_total_points(session, delta)
+    if db_points:
+        return db_points
+    raise HTTPException(status_code=404, detail="No points found")
+
+
+@app.get("/points/users/{user}", response_model=UserPoints)
+def get_user_points(session: Annotated[Session, Depends(get_session)], user: str):
+    """
+    Returns the points of a user, including buffered changes not written yet
+    """
+    db_points = session.get(UserPoints, user)
+    points = db_points.points if db_points else 0
+    return UserPoints(user=user, points=points + points_accumulator.pending(user))
+
+
+@app.post("/points/users/{user}/increment", response_model=UserPoints | PendingPoints)
+def increment_user_points(
+    session: Annotated[Session, Depends(get_session)],
+    response: Response,
+    user: str,
+    delta: int = 1,
+):
+    """
+    Adds `delta` to the points of a user, creating their counter if needed
+    """
+    if POINTS_BUFFER:
+        response.status_code = 202
+        buffer_points(user, delta)
+        return PendingPoints(user=user, pending=points_accumulator.pending(user))
+    return add_user_points(session, user, delta)
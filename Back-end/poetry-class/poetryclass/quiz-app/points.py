@@ -0,0 +1,251 @@
+"""
+FastAPI quiz app points counters
+
+Points change with a single `UPDATE ... SET points = points + :delta
+RETURNING` (an upsert for per-user counters), so concurrent answers never
+lose an update. With QUIZ_POINTS_BUFFER=1 changes are instead summed in an
+in-memory accumulator and written every QUIZ_POINTS_FLUSH_INTERVAL seconds
+in one transaction, so frequent scoring doesn't write to disk on every
+answer. Buffered changes not yet flushed are lost if the process dies.
+
+Every per-user change also moves the user on the in-memory leaderboard, as
+soon as it is committed or buffered.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import threading
+from collections import Counter
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session
+
+from database import engine
+from leaderboard import leaderboard
+from poetryclass.sqlite_engine import env_flag
+from schema import Points, UserPoints
+
+logger = logging.getLogger(__name__)
+
+POINTS_BUFFER: bool = env_flag("QUIZ_POINTS_BUFFER")
+
+# Seconds between flushes of the accumulator
+POINTS_FLUSH_INTERVAL: float = float(os.getenv("QUIZ_POINTS_FLUSH_INTERVAL", "1"))
+
+# Independent locks of the accumulator, requests on different threads rarely
+# wait for each other
+POINTS_SHARDS: int = int(os.getenv("QUIZ_POINTS_SHARDS", "16"))
+
+# Accumulator key of the global counter
+TOTAL: Optional[str] = None
+
+
+def total_points_row():
+    """
+    Condition picking the global counter, the first Points row
+    """
+    return Points.id == select(func.min(Points.id)).scalar_subquery()
+
+
+def add_total_points(session: Session, delta: int) -> Optional[Points]:
+    """
+    Atomically adds `delta` to the global counter, None if there is none
+    """
+    row = session.execute(
+        update(Points)
+        .where(total_points_row())
+        .values(points=Points.points + delta)
+        .returning(Points.id, Points.points)
+    ).first()
+    session.commit()
+    return Points(id=row.id, points=row.points) if row else None
+
+
+def set_total_points(session: Session, points: int) -> Optional[Points]:
+    """
+    Sets the global counter in one statement, None if there is none
+    """
+    row = session.execute(
+        update(Points)
+        .where(total_points_row())
+        .values(points=points)
+        .returning(Points.id, Points.points)
+    ).first()
+    session.commit()
+    return Points(id=row.id, points=row.points) if row else None
+
+
+def upsert_user_points(user: str, delta: int):
+    """
+    Statement adding `delta` to a user's counter, creating it at `delta`
+    """
+    statement = insert(UserPoints).values(user=user, points=delta)
+    return statement.on_conflict_do_update(
+        index_elements=[UserPoints.user],
+        set_={"points": UserPoints.points + statement.excluded.points},
+    )
+
+
+def add_user_points(session: Session, user: str, delta: int) -> UserPoints:
+    """
+    Atomically adds `delta` to a user's counter and returns it
+    """
+    row = session.execute(
+        upsert_user_points(user, delta).returning(UserPoints.user, UserPoints.points)
+    ).one()
+    session.commit()
+    leaderboard.add(user, delta)
+    return UserPoints(user=row.user, points=row.points)
+
+
+def apply_points(session: Session, changes: Counter) -> None:
+    """
+    Adds each change to the user's (or with TOTAL the global) counter, the
+    caller commits
+    """
+    for key, delta in changes.items():
+        if key is TOTAL:
+            session.execute(
+                update(Points)
+                .where(total_points_row())
+                .values(points=Points.points + delta)
+            )
+        else:
+            session.execute(upsert_user_points(key, delta))
+
+
+def record_points(session: Session, changes: Counter) -> None:
+    """
+    Adds the changes together, or to the accumulator with buffered points
+    """
+    changes = Counter({key: delta for key, delta in changes.items() if delta})
+    if not changes:
+        return
+    if POINTS_BUFFER:
+        for key, delta in changes.items():
+            buffer_points(key, delta)
+        return
+    apply_points(session, changes)
+    session.commit()
+    for key, delta in changes.items():
+        if key is not TOTAL:
+            leaderboard.add(key, delta)
+
+
+def buffer_points(key: Optional[str], delta: int) -> None:
+    """
+    Adds a change to the accumulator, to be written on the next flush
+    """
+    points_accumulator.add(key, delta)
+    if key is not TOTAL:
+        leaderboard.add(key, delta)
+
+
+class PointsAccumulator:
+    """
+    Sums points changes in memory until they are flushed
+
+    Changes go to one of `shards` counters picked by thread, each with its
+    own lock, so concurrent requests rarely contend. A flush swaps every
+    counter for an empty one and writes the sums.
+    """
+
+    def __init__(self, shards: int) -> None:
+        self._locks = [threading.Lock() for _ in range(max(shards, 1))]
+        self._counters: list[Counter] = [Counter() for _ in self._locks]
+        self._thread_shard = threading.local()
+        self._next_shard = itertools.count()
+
+    def shard(self) -> int:
+        """
+        Shard of the calling thread, threads take the shards in turn
+
+        Thread idents are aligned addresses, so they can't pick a shard by
+        themselves: modulo a power of two they all land on the same one.
+        """
+        try:
+            return self._thread_shard.index
+        except AttributeError:
+            index = next(self._next_shard) % len(self._locks)
+            self._thread_shard.index = index
+            return index
+
+    def add(self, key: Optional[str], delta: int) -> None:
+        """
+        Adds `delta` to the user's (or with TOTAL the global) pending sum
+        """
+        shard = self.shard()
+        with self._locks[shard]:
+            self._counters[shard][key] += delta
+
+    def pending(self, key: Optional[str]) -> int:
+        """
+        Sum of the changes not flushed yet
+        """
+        total = 0
+        for lock, counter in zip(self._locks, self._counters):
+            with lock:
+                total += counter.get(key, 0)
+        return total
+
+    def drain(self) -> Counter:
+        """
+        Takes every pending change, leaving the accumulator empty
+        """
+        drained: Counter = Counter()
+        for shard, lock in enumerate(self._locks):
+            with lock:
+                counter, self._counters[shard] = self._counters[shard], Counter()
+            drained.update(counter)
+        return drained
+
+    def restore(self, changes: Counter) -> None:
+        """
+        Puts back changes whose flush failed
+        """
+        with self._locks[0]:
+            self._counters[0].update(changes)
+
+    def flush(self) -> int:
+        """
+        Writes the pending changes in one transaction, returns how many keys
+
+        Nothing is lost if the write fails; the changes are kept for the next
+        flush.
+        """
+        changes = self.drain()
+        changes = Counter({key: delta for key, delta in changes.items() if delta})
+        if not changes:
+            return 0
+        try:
+            with Session(engine) as session:
+                apply_points(session, changes)
+                session.commit()
+        except Exception:
+            self.restore(changes)
+            raise
+        return len(changes)
+
+
+points_accumulator = PointsAccumulator(POINTS_SHARDS)
+
+
+async def flush_periodically() -> None:
+    """
+    Flushes the accumulator every POINTS_FLUSH_INTERVAL seconds until
+    cancelled, then one last time
+    """
+    try:
+        while True:
+            await asyncio.sleep(POINTS_FLUSH_INTERVAL)
+            try:
+                await run_in_threadpool(points_accumulator.flush)
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception("Points flush failed")
+    finally:
+        points_accumulator.flush()
@@ -0,0 +1,94 @@
+"""
+FastAPI quiz app random quiz sessions
+
+A session is N distinct questions picked at random. The ids of the questions
+are kept in memory (the question bank when it is on), so picking them draws N
+positions in O(N) and only the picked rows are read, by primary key, instead
+of every row or an `ORDER BY RANDOM()` scan. The same seed picks the same
+questions as long as the quiz table doesn't change. The correct options are
+left out; answers are graded on the server.
+"""
+
+import os
+import random
+import secrets
+import threading
+from typing import Optional, Sequence
+
+from sqlmodel import Session, select
+
+from bank import get_bank
+from schema import Quiz, QuizQuestion, QuizSession
+
+# Most questions in a session
+SESSION_MAX_QUESTIONS: int = int(os.getenv("QUIZ_SESSION_MAX_QUESTIONS", "50"))
+
+_question_ids: Optional[tuple[int, ...]] = None
+# Bumped by every invalidation, so a read that overlapped one isn't kept
+_question_ids_generation = 0
+_question_ids_lock = threading.Lock()
+
+
+def question_ids(session: Session) -> tuple[int, ...]:
+    """
+    Ids of every question in id order, read once until the quiz table changes
+
+    Ids read while the table changed may be stale, they serve the request
+    that read them but aren't cached.
+    """
+    global _question_ids
+    with _question_ids_lock:
+        ids, generation = _question_ids, _question_ids_generation
+    if ids is not None:
+        return ids
+    ids = tuple(session.exec(select(Quiz.id).order_by(Quiz.id)).all())
+    with _question_ids_lock:
+        if _question_ids_generation == generation:
+            _question_ids = ids
+    return ids
+
+
+def invalidate_question_ids() -> None:
+    """
+    Drops the cached ids after the quiz table changed
+    """
+    global _question_ids, _question_ids_generation
+    with _question_ids_lock:
+        _question_ids_generation += 1
+        _question_ids = None
+
+
+def sample_positions(total: int, n: int, seed: int) -> list[int]:
+    """
+    `n` distinct positions out of `total` in random order, without building a
+    list of every position
+    """
+    return random.Random(seed).sample(range(total), min(n, total))
+
+
+def sample_questions(
+    session: Session, n: int, seed: Optional[int] = None
+) -> QuizSession:
+    """
+    Picks `n` distinct questions, or every question if there are fewer
+    """
+    if seed is None:
+        seed = secrets.randbits(32)
+
+    bank = get_bank()
+    questions: Sequence
+    if bank:
+        picked = sample_positions(len(bank.questions), n, seed)
+        questions = [bank.questions[position] for position in picked]
+    else:
+        ids = question_ids(session)
+        picked_ids = [ids[position] for position in sample_positions(len(ids), n, seed)]
+        rows = session.exec(select(Quiz).where(Quiz.id.in_(picked_ids))).all()
+        by_id = {quiz.id: quiz for quiz in rows}
+        # Keep the sampled order, skipping questions deleted since the ids were read
+        questions = [by_id[id] for id in picked_ids if id in by_id]
+
+    return QuizSession(
+        seed=seed,
+        questions=[QuizQuestion.model_validate(quiz) for quiz in questions],
+    )
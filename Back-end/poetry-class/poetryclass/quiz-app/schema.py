@@ -2,9 +2,16 @@
 FastAPI quiz app Database schema
 """
 
+from typing import Annotated
+
+from pydantic import BaseModel, ConfigDict, Field as PydanticField, model_validator
 from sqlmodel import SQLModel, Session, Field, Integer, Column, JSON
 from database import engine
 
+# Question ids and answers are graded as int64 (see grading.py), the range of
+# a SQLite INTEGER; negative ones can't match a question or an option
+GradedInt = Annotated[int, PydanticField(ge=0, le=2**63 - 1)]
+
 
 class Quiz(SQLModel, table=True):
     """
@@ -17,6 +24,119 @@ class Quiz(SQLModel, table=True):
     correct_option: int = Field(sa_column=Column("correct_option", Integer))
 
 
+class QuizImport(SQLModel):
+    """
+    A question of a bulk import
+    """
+
+    question: str = Field(min_length=1)
+    options: list[str] = Field(min_length=2)
+    correct_option: int
+
+    @model_validator(mode="after")
+    def check_correct_option(self) -> "QuizImport":
+        """
+        Validates that the correct option is one of the options
+        """
+        if not 0 <= self.correct_option < len(self.options):
+            raise ValueError(
+                f"Correct option should be an index from 0 to {len(self.options) - 1}"
+            )
+        return self
+
+
+class QuizImportResult(SQLModel):
+    """
+    Outcome of a bulk import
+    """
+
+    imported: int
+
+
+class QuizRead(SQLModel):
+    """
+    Read-only quiz question held by the in-memory question bank
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    id: int
+    question: str
+    options: tuple[str, ...]
+    correct_option: int
+
+
+class QuizQuestion(SQLModel):
+    """
+    A question as sent to a quiz taker, without its correct option
+    """
+
+    id: int
+    question: str
+    options: list[str]
+
+
+class QuizSession(SQLModel):
+    """
+    Randomly picked questions, the seed picks the same ones again
+    """
+
+    seed: int
+    questions: list[QuizQuestion]
+
+
+class AnswerSheet(BaseModel):
+    """
+    Answers of one quiz taker, `answers[i]` is the option picked for
+    `question_ids[i]`
+
+    The grading models are plain pydantic models: a classroom batch holds
+    thousands of sheets, and SQLModel's per-instance setup would dominate
+    grading them.
+    """
+
+    user: str | None = None
+    question_ids: list[GradedInt]
+    answers: list[GradedInt]
+
+    @model_validator(mode="after")
+    def check_lengths(self) -> "AnswerSheet":
+        """
+        Validates that every question has an answer
+        """
+        if len(self.question_ids) != len(self.answers):
+            raise ValueError("question_ids and answers should have the same length")
+        return self
+
+    @model_validator(mode="after")
+    def check_unique_questions(self) -> "AnswerSheet":
+        """
+        Validates that each question is answered once, so it scores once
+        """
+        if len(set(self.question_ids)) != len(self.question_ids):
+            raise ValueError("question_ids should not repeat a question")
+        return self
+
+
+class GradeRequest(BaseModel):
+    """
+    One or many answer sheets graded together
+    """
+
+    sheets: list[AnswerSheet] = PydanticField(min_length=1)
+
+
+class SheetResult(BaseModel):
+    """
+    Grade of an answer sheet, `correct[i]` tells whether `answers[i]` was
+    """
+
+    user: str | None = None
+    score: int
+    total: int
+    correct: list[bool]
+
+
 class Points(SQLModel, table=True):
     """
     Credit points counter
@@ -26,6 +146,34 @@ class Points(SQLModel, table=True):
     points: int = Field(default=0)
 
 
+class UserPoints(SQLModel, table=True):
+    """
+    Credit points counter of one user
+    """
+
+    user: str = Field(primary_key=True)
+    points: int = Field(default=0)
+
+
+class LeaderboardEntry(SQLModel):
+    """
+    A player's place on the leaderboard, tied players share a rank
+    """
+
+    rank: int
+    user: str
+    points: int
+
+
+class PendingPoints(SQLModel):
+    """
+    Points change accepted by the accumulator, written on its next flush
+    """
+
+    user: str | None = None
+    pending: int
+
+
 def get_session():
     """
     Returns the database session
@@ -0,0 +1,131 @@
+"""
+Shared SQLite engine factory for the poetryclass apps
+
+Every connection handed out by the pool gets the same PRAGMAs, the pool is
+sized explicitly and SQL echo is off unless asked for through the environment.
+
+Environment variables:
+    SQL_ECHO: Log every statement when set to 1/true/yes
+    SQLITE_POOL_SIZE: Connections kept open in the pool
+    SQLITE_MAX_OVERFLOW: Extra connections allowed under load
+    SQLITE_QUERY_CACHE_SIZE: Compiled statements kept in SQLAlchemy's cache
+    SQLITE_MMAP_SIZE: Bytes of the database file mapped in memory
+    SQLITE_CACHE_SIZE: Page cache size (negative values are KiB)
+    SQLITE_BUSY_TIMEOUT: Milliseconds to wait on a locked database
+"""
+
+import os
+from typing import TYPE_CHECKING
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import StaticPool
+from sqlmodel import create_engine
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """
+    Reads a boolean flag from the environment
+    """
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+SQL_ECHO: bool = env_flag("SQL_ECHO")
+
+POOL_SIZE: int = int(os.getenv("SQLITE_POOL_SIZE", "10"))
+MAX_OVERFLOW: int = int(os.getenv("SQLITE_MAX_OVERFLOW", "20"))
+QUERY_CACHE_SIZE: int = int(os.getenv("SQLITE_QUERY_CACHE_SIZE", "1200"))
+
+PRAGMAS: dict[str, str | int] = {
+    # Readers don't block the writer and the writer doesn't block readers
+    "journal_mode": "WAL",
+    # Safe with WAL, only the checkpoint fsyncs
+    "synchronous": "NORMAL",
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000")),
+    "temp_store": "MEMORY",
+}
+
+
+def apply_pragmas(dbapi_connection, _connection_record) -> None:
+    """
+    Applies PRAGMAS to a freshly opened SQLite connection
+    """
+    cursor = dbapi_connection.cursor()
+    for name, value in PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def is_memory_database(url: str) -> bool:
+    """
+    Whether the url points to an in-memory SQLite database
+    """
+    database = url.split("://", 1)[-1]
+    return database in ("", "/", "/:memory:")
+
+
+def engine_options(url: str) -> dict:
+    """
+    Returns the create_engine keyword arguments for a SQLite url
+    """
+    options = {
+        "echo": SQL_ECHO,
+        "query_cache_size": QUERY_CACHE_SIZE,
+        "connect_args": {"check_same_thread": False},
+    }
+    if is_memory_database(url):
+        # Every connection to ":memory:" is a new database, share one instead
+        options["poolclass"] = StaticPool
+    else:
+        options["pool_size"] = POOL_SIZE
+        options["max_overflow"] = MAX_OVERFLOW
+    return options
+
+
+def create_sqlite_engine(url: str, **kwargs) -> Engine:
+    """
+    Creates a tuned engine for a SQLite url
+
+    Non SQLite urls get a plain engine with the same echo setting, so apps
+    that read their url from the environment can still point at another
+    database.
+
+    Args:
+        url (str): Database url
+        kwargs: Extra create_engine arguments, they win over the defaults
+    """
+    if not url.startswith("sqlite"):
+        return create_engine(url, **{"echo": SQL_ECHO, **kwargs})
+
+    engine = create_engine(url, **{**engine_options(url), **kwargs})
+    event.listen(engine, "connect", apply_pragmas)
+    return engine
+
+
+def create_async_sqlite_engine(url: str, **kwargs) -> "AsyncEngine":
+    """
+    Creates a tuned async engine for a SQLite url (sqlite+aiosqlite://...)
+
+    Needs the aiosqlite and greenlet packages, which the sync apps don't.
+
+    Args:
+        url (str): Database url
+        kwargs: Extra create_async_engine arguments, they win over the defaults
+    """
+    # pylint: disable=import-outside-toplevel
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    if not url.startswith("sqlite"):
+        return create_async_engine(url, **{"echo": SQL_ECHO, **kwargs})
+
+    engine = create_async_engine(url, **{**engine_options(url), **kwargs})
+    event.listen(engine.sync_engine, "connect", apply_pragmas)
+    return engine
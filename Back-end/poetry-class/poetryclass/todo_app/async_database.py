@@ -0,0 +1,21 @@
+"""
+FastAPI todo app async database connection (aiosqlite)
+"""
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from poetryclass.sqlite_engine import create_async_sqlite_engine
+
+from database import DB_FILE
+
+ASYNC_DATABASE: str = f"sqlite+aiosqlite:///{DB_FILE}"
+
+async_engine = create_async_sqlite_engine(ASYNC_DATABASE)
+
+
+async def get_async_session():
+    """
+    Returns async database session
+    """
+    async with AsyncSession(async_engine) as session:
+        yield session
@@ -0,0 +1,269 @@
+"""
+FastAPI todo app Crud Operation API's on the async (aiosqlite) backend
+
+Same endpoints as main.py, served with an AsyncSession so requests wait on
+the database without holding a threadpool worker. Each endpoint runs the
+operation main.py calls, from crud.py, through `AsyncSession.run_sync`.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, FastAPI, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+
+from async_database import async_engine, get_async_session
+from cache import todo_cache
+from changes import compact_periodically, compact_tombstones, read_changes
+from crud import (
+    create_todo,
+    read_all_todos,
+    read_ndjson_chunk,
+    read_page,
+    read_todo,
+    remove_todo,
+    update_todo,
+    write_bulk,
+)
+from database import upgrade_todo_table
+from schema import (
+    PAGE_SIZE_MAX,
+    STREAM_CHUNK_SIZE,
+    Todo,
+    TodoBulkOperation,
+    TodoBulkResponse,
+    TodoChanges,
+    TodoPage,
+    TodoSearchPage,
+)
+from search import ensure_search_index, search_page
+
+
+async def compact_todo_tombstones_async() -> int:
+    """
+    Compact delta sync tombstones in an async session of its own
+    """
+    async with AsyncSession(async_engine) as session:
+        return await session.run_sync(compact_tombstones)
+
+
+@asynccontextmanager
+async def async_lifespan(app: FastAPI):
+    """
+    Create or upgrade database tables with the async engine, compact tombstones
+    in the background and yield
+    """
+    async with async_engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(upgrade_todo_table)
+        await conn.run_sync(ensure_search_index)
+    compaction = asyncio.create_task(
+        compact_periodically(compact_todo_tombstones_async)
+    )
+    yield
+    compaction.cancel()
+
+
+router = APIRouter()
+
+
+@router.get("/", response_model=list[Todo])
+async def read_todos(
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_async_session),
+) -> list[Todo] | JSONResponse:
+    """
+    Read all todos from database
+
+    Args:
+        session (AsyncSession): Database session
+
+    Returns:
+        Union[List[Todo], JSONResponse]: List of Todos or error message
+    """
+    return await session.run_sync(read_all_todos, request, response)
+
+
+@router.get("/todos", response_model=TodoPage)
+async def read_todos_page(
+    request: Request,
+    response: Response,
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    limit: int = Query(default=100, ge=1, le=PAGE_SIZE_MAX),
+    after: int | None = Query(default=None, ge=0),
+) -> TodoPage:
+    """
+    Read one page of todos ordered by id
+
+    Args:
+        limit (int): Maximum number of todos in the page
+        after (int | None): Cursor returned as `next_cursor` by the previous page
+
+    Returns:
+        TodoPage: Todos in the page and the cursor of the next one
+    """
+    return await session.run_sync(read_page, request, response, limit, after)
+
+
+async def aiter_todos_ndjson(
+    session: AsyncSession, chunk_size: int, after: int | None = None
+):
+    """
+    Yield todos as newline delimited JSON, one chunk of rows at a time
+    """
+    last_id: int | None = after or 0
+    while last_id is not None:
+        chunk, last_id = await session.run_sync(read_ndjson_chunk, last_id, chunk_size)
+        if chunk:
+            yield chunk
+
+
+@router.get("/todos/stream")
+async def stream_todos(
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    after: int | None = Query(default=None, ge=0),
+) -> StreamingResponse:
+    """
+    Stream every todo as NDJSON (one JSON object per line)
+
+    Args:
+        after (int | None): Only stream todos with an id greater than this
+    """
+    return StreamingResponse(
+        aiter_todos_ndjson(session, STREAM_CHUNK_SIZE, after),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.get("/todos/search", response_model=TodoSearchPage)
+async def search_todo_titles(
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    q: str = Query(min_length=1),
+    limit: int = Query(default=20, ge=1, le=PAGE_SIZE_MAX),
+    offset: int = Query(default=0, ge=0),
+) -> TodoSearchPage:
+    """
+    Full-text search over todo titles, ranked by bm25
+
+    Args:
+        q (str): Words that must all appear in the title
+        limit (int): Maximum number of todos in the page
+        offset (int): Number of results to skip
+
+    Returns:
+        TodoSearchPage: Matching todos and the offset of the next page
+    """
+    return await session.run_sync(search_page, q, limit, offset)
+
+
+@router.get("/todos/changes", response_model=TodoChanges)
+async def read_todo_changes(
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    since: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=1, le=PAGE_SIZE_MAX),
+) -> TodoChanges:
+    """
+    Delta sync: todos written and deleted after a sync version
+
+    Args:
+        since (int): `version` returned by the previous sync, 0 for everything
+        limit (int): Maximum number of changes in the page
+
+    Returns:
+        TodoChanges: Written todos, deleted ids and the version to sync from
+            next. 410 Gone when the tombstones after `since` were compacted.
+    """
+    return await session.run_sync(read_changes, since, limit)
+
+
+@router.post("/todos/bulk", response_model=TodoBulkResponse)
+async def bulk_todos(
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    operations: list[TodoBulkOperation],
+    atomic: bool = True,
+):
+    """
+    Create, update and delete many todos in a single transaction
+
+    Args:
+        operations (list[TodoBulkOperation]): Operations to apply
+        atomic (bool): Apply nothing if any operation is invalid, otherwise
+            apply the valid ones and report the others
+
+    Returns:
+        TodoBulkResponse: Whether the batch was committed and per-item results
+    """
+    return await session.run_sync(write_bulk, operations, atomic)
+
+
+@router.post("/new/todo")
+async def create_new_todo(
+    session: Annotated[AsyncSession, Depends(get_async_session)], todo: Todo
+) -> Todo:
+    """Create new todo
+
+    Args:
+        todo (Todo)
+    """
+    return await session.run_sync(create_todo, todo)
+
+
+@router.get("/todo/{id}")
+async def get_todo_by_id(
+    request: Request,
+    session: Annotated[AsyncSession, Depends(get_async_session)],
+    id: int,
+):
+    """
+    Return the todo which matches against the id
+    """
+    return await session.run_sync(read_todo, request, id)
+
+
+@router.patch("/edit/todo/{id}", response_model=Todo)
+async def edit_todo(
+    id: int,
+    todo_update: Todo,
+    session: AsyncSession = Depends(get_async_session),
+):
+    """
+    Edit and return the todo
+
+    Args:
+        id (int): ID of the todo to edit
+        todo_update (TodoUpdate): Updated todo data
+
+    Returns:
+        Todo: Updated todo item
+    """
+    return await session.run_sync(update_todo, id, todo_update)
+
+
+@router.delete("/delete/todo/{todo_id}", response_model=Todo)
+async def delete_todo(
+    todo_id: int, session: AsyncSession = Depends(get_async_session)
+) -> JSONResponse:
+    """
+    Delete a todo by ID
+
+    Args:
+        todo_id (int): ID of the todo to delete
+
+    Returns:
+        JSONResponse: Deleted Todo or error message
+    """
+    return await session.run_sync(remove_todo, todo_id)
+
+
+@router.get("/todos/cache/stats")
+async def read_cache_stats() -> dict:
+    """
+    Hit, miss and eviction counters of the single todo cache
+    """
+    return todo_cache.stats()
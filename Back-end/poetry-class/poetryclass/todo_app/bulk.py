@@ -0,0 +1,150 @@
+"""
+FastAPI todo app bulk operations
+"""
+
+import os
+
+from sqlalchemy import bindparam, delete, insert, update
+from sqlmodel import Session, select
+
+from schema import (
+    Todo,
+    TodoBulkOperation,
+    TodoBulkResponse,
+    TodoBulkResult,
+    TodoEvent,
+)
+
+# Largest number of operations accepted in one bulk request
+BULK_MAX_BATCH: int = int(os.getenv("TODO_BULK_MAX_BATCH", "1000"))
+
+
+def validate_operation(
+    operation: TodoBulkOperation, existing_ids: set[int], seen_ids: set[int]
+) -> str | None:
+    """
+    Returns the error message for an operation, or None if it can be applied
+    """
+    if operation.op == "create":
+        if operation.title is None:
+            return "A title is required to create a todo"
+        return None
+
+    if operation.id is None:
+        return f"An id is required to {operation.op} a todo"
+    if operation.id in seen_ids:
+        return f"Todo with id {operation.id} appears more than once in the batch"
+    seen_ids.add(operation.id)
+    if operation.id not in existing_ids:
+        return f"Todo not found with id {operation.id}"
+    if (
+        operation.op == "update"
+        and operation.title is None
+        and operation.completed is None
+    ):
+        return "Nothing to update"
+    return None
+
+
+def apply_bulk_operations(
+    session: Session, operations: list[TodoBulkOperation], atomic: bool
+) -> TodoBulkResponse:
+    """
+    Apply creates, updates and deletes as batched statements in one transaction
+
+    Operations are grouped by kind and each group runs as a single
+    executemany-style statement, so the whole batch costs one commit. With
+    `atomic` any invalid operation aborts the batch, otherwise only the valid
+    operations are applied.
+    """
+    referenced_ids = {
+        op.id for op in operations if op.op != "create" and op.id is not None
+    }
+    existing_ids: set[int] = set()
+    if referenced_ids:
+        existing_ids = set(
+            session.exec(select(Todo.id).where(Todo.id.in_(referenced_ids))).all()
+        )
+
+    results: list[TodoBulkResult] = []
+    seen_ids: set[int] = set()
+    for index, operation in enumerate(operations):
+        error = validate_operation(operation, existing_ids, seen_ids)
+        results.append(
+            TodoBulkResult(
+                index=index,
+                op=operation.op,
+                ok=error is None,
+                id=operation.id if operation.op != "create" else None,
+                error=error,
+            )
+        )
+
+    if atomic and not all(result.ok for result in results):
+        return TodoBulkResponse(committed=False, results=results)
+
+    valid = [(r, operations[r.index]) for r in results if r.ok]
+    creates = [(r, op) for r, op in valid if op.op == "create"]
+    updates = [op for _, op in valid if op.op == "update"]
+    delete_ids = [op.id for _, op in valid if op.op == "delete"]
+
+    if creates:
+        new_ids = session.execute(
+            insert(Todo).returning(Todo.id, sort_by_parameter_order=True),
+            [{"title": op.title, "completed": bool(op.completed)} for _, op in creates],
+        ).scalars()
+        for (result, _), new_id in zip(creates, new_ids):
+            result.id = new_id
+    if updates:
+        # One executemany per set of updated columns, bumping each row version
+        todos = Todo.__table__
+        groups: dict[tuple[str, ...], list[dict]] = {}
+        for op in updates:
+            values = op.model_dump(include={"title", "completed"}, exclude_none=True)
+            groups.setdefault(tuple(sorted(values)), []).append(
+                {"b_id": op.id, **{f"b_{key}": value for key, value in values.items()}}
+            )
+        for columns, params in groups.items():
+            statement = (
+                update(todos)
+                .where(todos.c.id == bindparam("b_id"))
+                .values(
+                    {
+                        **{column: bindparam(f"b_{column}") for column in columns},
+                        "version": todos.c.version + 1,
+                    }
+                )
+            )
+            session.execute(statement, params)
+    if delete_ids:
+        session.execute(delete(Todo).where(Todo.id.in_(delete_ids)))
+
+    session.commit()
+    return TodoBulkResponse(committed=True, results=results)
+
+
+def bulk_events(
+    operations: list[TodoBulkOperation], response: TodoBulkResponse
+) -> list[TodoEvent]:
+    """
+    Returns the change feed events of the applied operations
+    """
+    events = []
+    for result in response.results:
+        if not result.ok:
+            continue
+        operation = operations[result.index]
+        todo = None
+        if operation.op == "create":
+            todo = {
+                "id": result.id,
+                "title": operation.title,
+                "completed": bool(operation.completed),
+                "version": 1,
+            }
+        elif operation.op == "update":
+            todo = operation.model_dump(
+                include={"id", "title", "completed"}, exclude_none=True
+            )
+        events.append(TodoEvent(action=operation.op, id=result.id, todo=todo))
+    return events
@@ -0,0 +1,151 @@
+"""
+FastAPI todo app in-process read-through cache
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from versioning import TableVersion, todo_table_version
+
+# Marks a key cached as missing (negative caching)
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries also expire after a time to live
+
+    A key can be cached as missing with a separate, usually shorter, time to
+    live so a storm of lookups for an id that doesn't exist hits the database
+    once. Negative caching is off when `negative_ttl` is 0.
+
+    With a `table_version`, a value read from the table can be stored only
+    if no write happened since the read: the version is compared under the
+    cache lock, which invalidations also take, so a write can't bump the
+    version and invalidate between the compare and the store.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        negative_ttl: float = 0,
+        table_version: Optional[TableVersion] = None,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.table_version = table_version
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Returns the cached value, MISSING for a cached miss or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Caches a value, evicting the least recently used entry when full
+        """
+        self._store(key, value, self.ttl)
+
+    def set_missing(self, key: Hashable) -> None:
+        """
+        Caches the key as missing if negative caching is on
+        """
+        if self.negative_ttl > 0:
+            self._store(key, MISSING, self.negative_ttl)
+
+    def set_if_version(self, key: Hashable, value: Any, expected_version: int) -> None:
+        """
+        Caches a value read at `expected_version` of the table, unless the
+        table was written since
+        """
+        self._store(key, value, self.ttl, expected_version)
+
+    def set_missing_if_version(self, key: Hashable, expected_version: int) -> None:
+        """
+        Caches the key as missing, unless the table was written since
+        `expected_version`
+        """
+        if self.negative_ttl > 0:
+            self._store(key, MISSING, self.negative_ttl, expected_version)
+
+    def _store(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: float,
+        expected_version: Optional[int] = None,
+    ) -> None:
+        if self.maxsize <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            if (
+                expected_version is not None
+                and self.table_version is not None
+                and self.table_version.version != expected_version
+            ):
+                return
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        Drops the key from the cache, after the write bumped the table version
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Drops every entry and resets the counters
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        """
+        Hit, miss and eviction counters
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+
+# Serialized todos keyed by id, as (etag, json bytes)
+todo_cache = TTLCache(
+    maxsize=int(os.getenv("TODO_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("TODO_CACHE_TTL", "60")),
+    negative_ttl=float(os.getenv("TODO_CACHE_NEGATIVE_TTL", "0")),
+    table_version=todo_table_version,
+)
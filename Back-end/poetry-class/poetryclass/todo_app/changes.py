@@ -0,0 +1,187 @@
+"""
+FastAPI todo app delta sync ("changes since version N")
+
+Every insert, update and delete of a todo takes the next sync version from
+`todo_sync_state` in a trigger, so the single-row and bulk write paths on
+both backends are tracked the same way. Updated rows carry the version in
+`todo.updated_version`, deleted rows leave a tombstone in `todo_tombstone`.
+SQLite has a single writer, so versions are committed in increasing order.
+
+Compact old tombstones of a database with:
+    python changes.py compact
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable
+
+from fastapi import HTTPException
+from sqlalchemy import delete, event, func
+from sqlalchemy.engine import Connection
+from sqlmodel import Session, SQLModel, select
+
+from database import engine
+from schema import Todo, TodoChanges, TodoSyncState, TodoTombstone
+
+logger = logging.getLogger(__name__)
+
+# Seconds a tombstone is kept before compaction may remove it
+TOMBSTONE_TTL: float = float(os.getenv("TODO_TOMBSTONE_TTL", str(7 * 24 * 3600)))
+
+# Seconds between two compactions run by the app
+COMPACT_INTERVAL: float = float(os.getenv("TODO_COMPACT_INTERVAL", "3600"))
+
+NEXT_VERSION = "UPDATE todo_sync_state SET version = version + 1 WHERE id = 1;"
+CURRENT_VERSION = "(SELECT version FROM todo_sync_state WHERE id = 1)"
+
+CHANGES_DDL: list[str] = [
+    "INSERT OR IGNORE INTO todo_sync_state (id, version, compacted_version) "
+    "VALUES (1, 0, 0)",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todo_sync_insert AFTER INSERT ON todo BEGIN
+        {NEXT_VERSION}
+        UPDATE todo SET updated_version = {CURRENT_VERSION} WHERE id = new.id;
+        DELETE FROM todo_tombstone WHERE todo_id = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todo_sync_update
+    AFTER UPDATE OF title, completed, version ON todo BEGIN
+        {NEXT_VERSION}
+        UPDATE todo SET updated_version = {CURRENT_VERSION} WHERE id = new.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todo_sync_delete AFTER DELETE ON todo BEGIN
+        {NEXT_VERSION}
+        INSERT OR REPLACE INTO todo_tombstone (todo_id, deleted_version, deleted_at)
+        VALUES (old.id, {CURRENT_VERSION}, CAST(strftime('%s', 'now') AS INTEGER));
+    END
+    """,
+]
+
+
+def create_change_tracking(connection: Connection) -> None:
+    """
+    Seeds the sync state and creates the triggers if they don't exist
+    """
+    for ddl in CHANGES_DDL:
+        connection.exec_driver_sql(ddl)
+
+
+@event.listens_for(SQLModel.metadata, "after_create")
+def after_metadata_create(_metadata, connection: Connection, **_) -> None:
+    """
+    Tracks changes as soon as the todo tables exist
+    """
+    create_change_tracking(connection)
+
+
+def read_changes(session: Session, since: int, limit: int) -> TodoChanges:
+    """
+    Returns the todos written and deleted after version `since`, oldest first
+
+    The current version is read first and the rows are capped at it: a write
+    that commits meanwhile gets a higher version and shows up next time.
+    """
+    state = session.get(TodoSyncState, 1)
+    if since < state.compacted_version:
+        raise HTTPException(
+            status_code=410,
+            detail=f"Changes up to version {state.compacted_version} were "
+            "compacted, fetch every todo again",
+        )
+    current = state.version
+
+    # Fetch one extra row of each kind to know whether another page exists
+    todos = session.exec(
+        select(Todo)
+        .where(Todo.updated_version > since, Todo.updated_version <= current)
+        .order_by(Todo.updated_version)
+        .limit(limit + 1)
+    ).all()
+    tombstones = session.exec(
+        select(TodoTombstone)
+        .where(
+            TodoTombstone.deleted_version > since,
+            TodoTombstone.deleted_version <= current,
+        )
+        .order_by(TodoTombstone.deleted_version)
+        .limit(limit + 1)
+    ).all()
+
+    changes = sorted(
+        [(todo.updated_version, todo) for todo in todos]
+        + [(tombstone.deleted_version, tombstone) for tombstone in tombstones],
+        key=lambda change: change[0],
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    return TodoChanges(
+        todos=[change for _, change in changes if isinstance(change, Todo)],
+        deleted=[
+            change.todo_id for _, change in changes if isinstance(change, TodoTombstone)
+        ],
+        version=changes[-1][0] if has_more else current,
+        has_more=has_more,
+    )
+
+
+def compact_tombstones(session: Session, ttl: float = TOMBSTONE_TTL) -> int:
+    """
+    Removes tombstones older than `ttl` seconds and returns how many
+
+    Everything up to the newest removed version goes, so `compacted_version`
+    is an exact boundary for clients.
+    """
+    cutoff = time.time() - ttl
+    newest = session.exec(
+        select(func.max(TodoTombstone.deleted_version)).where(
+            TodoTombstone.deleted_at < cutoff
+        )
+    ).one()
+    if newest is None:
+        return 0
+
+    removed = session.execute(
+        delete(TodoTombstone).where(TodoTombstone.deleted_version <= newest)
+    ).rowcount
+    state = session.get(TodoSyncState, 1)
+    state.compacted_version = max(state.compacted_version, newest)
+    session.add(state)
+    session.commit()
+    return removed
+
+
+async def compact_periodically(compact: Callable[[], Awaitable[int]]) -> None:
+    """
+    Runs `compact` every COMPACT_INTERVAL seconds until cancelled
+    """
+    while True:
+        await asyncio.sleep(COMPACT_INTERVAL)
+        try:
+            await compact()
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Tombstone compaction failed")
+
+
+def main() -> None:
+    """
+    Delta sync command line
+    """
+    parser = argparse.ArgumentParser(description="Todo delta sync maintenance")
+    parser.add_argument("command", choices=["compact"])
+    parser.add_argument("--ttl", type=float, default=TOMBSTONE_TTL)
+    args = parser.parse_args()
+
+    with Session(engine) as session:
+        removed = compact_tombstones(session, args.ttl)
+    print(f"Removed {removed} tombstones")
+
+
+if __name__ == "__main__":
+    main()
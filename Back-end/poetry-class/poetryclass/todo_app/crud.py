@@ -0,0 +1,248 @@
+"""
+FastAPI todo app Crud Operations shared by both database backends
+
+Each operation takes a blocking Session: main.py calls it directly and
+async_main.py through `AsyncSession.run_sync`, so both routers read, cache
+and write todos with the same code.
+"""
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+from sqlmodel import Session, select
+
+from bulk import BULK_MAX_BATCH, apply_bulk_operations, bulk_events
+from cache import MISSING, todo_cache
+from fast_json import (
+    TODO_COLUMNS,
+    TODO_LIST_ADAPTER,
+    TODO_PAGE_ADAPTER,
+    FastJSONResponse,
+    rows_as_dicts,
+)
+from schema import Todo, TodoBulkOperation, TodoBulkResponse, TodoEvent, TodoPage
+from versioning import (
+    conditional_response,
+    etag_matches,
+    not_modified,
+    row_etag,
+    todo_table_version,
+)
+from writes import todos_written
+
+
+def read_all_todos(
+    session: Session, request: Request, response: Response
+) -> list[Todo] | Response:
+    """
+    Every todo, 304 when the client has the current table version
+    """
+    # Taken before the query, so a concurrent write can only leave the ETag
+    # older than the rows and the next poll refetches
+    etag = todo_table_version.etag
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+
+    try:
+        fast_json = request.app.state.fast_json
+        query = select(*TODO_COLUMNS) if fast_json else select(Todo)
+        todos = session.exec(query).all()
+        if not todos:
+            return JSONResponse(
+                status_code=404,
+                content={"error": {"code": 404, "message": "No todos in the database"}},
+            )
+        if fast_json:
+            return FastJSONResponse(
+                rows_as_dicts(todos), TODO_LIST_ADAPTER, headers={"ETag": etag}
+            )
+        return todos
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+def read_page(
+    session: Session,
+    request: Request,
+    response: Response,
+    limit: int,
+    after: int | None,
+) -> TodoPage | Response:
+    """
+    One page of todos ordered by id, 304 when the client has the current
+    table version
+    """
+    etag = todo_table_version.etag
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+
+    # Fetch one extra row to know whether another page exists
+    fast_json = request.app.state.fast_json
+    query = select(*TODO_COLUMNS) if fast_json else select(Todo)
+    query = query.order_by(Todo.id).limit(limit + 1)
+    if after is not None:
+        query = query.where(Todo.id > after)
+    todos = session.exec(query).all()
+
+    next_cursor = None
+    if len(todos) > limit:
+        todos = todos[:limit]
+        next_cursor = todos[-1].id
+    if fast_json:
+        return FastJSONResponse(
+            {"items": rows_as_dicts(todos), "next_cursor": next_cursor},
+            TODO_PAGE_ADAPTER,
+            headers={"ETag": etag},
+        )
+    return TodoPage(items=todos, next_cursor=next_cursor)
+
+
+def read_ndjson_chunk(
+    session: Session, after: int, chunk_size: int
+) -> tuple[str, int | None]:
+    """
+    Up to `chunk_size` todos after id `after` as newline delimited JSON, with
+    the id to read the next chunk after, None once the table is exhausted
+
+    Rows are read with keyset pagination on the id and detached from the
+    session, so memory stays flat whatever the table size.
+    """
+    query = select(Todo).where(Todo.id > after).order_by(Todo.id).limit(chunk_size)
+    todos = session.exec(query).all()
+    if not todos:
+        return "", None
+    chunk = "".join(todo.model_dump_json() + "\n" for todo in todos)
+    session.expunge_all()
+    return chunk, todos[-1].id if len(todos) == chunk_size else None
+
+
+def read_todo(session: Session, request: Request, id: int) -> Response:
+    """
+    One todo from the cache or the database, 304 when the client has it
+    """
+    cached = todo_cache.get(id)
+    if cached is not None and cached is not MISSING:
+        return conditional_response(request, *cached)
+
+    # Writes bump the table version before invalidating the cache, and the
+    # cache compares the version under its lock, so a row read while a write
+    # is in flight is never cached
+    version = todo_table_version.version
+    try:
+        todo: Todo | None = None
+        if cached is not MISSING:
+            todo = session.exec(select(Todo).where(Todo.id == id)).first()
+        if not todo:
+            if cached is None:
+                todo_cache.set_missing_if_version(id, version)
+            return JSONResponse(
+                status_code=404,
+                content={
+                    "error": {"code": 404, "message": f"Todo not found with id {id}"}
+                },
+            )
+        etag = row_etag(todo.updated_version)
+        body = todo.model_dump_json().encode()
+        todo_cache.set_if_version(id, (etag, body), version)
+        return conditional_response(request, etag, body)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+def create_todo(session: Session, todo: Todo) -> Todo:
+    """
+    Inserts a todo built from the title and completed flag of `todo`
+    """
+    new_todo = Todo(title=todo.title, completed=todo.completed)
+    session.add(new_todo)
+    try:
+        session.commit()
+        session.refresh(new_todo)
+        todos_written(
+            [TodoEvent(action="create", id=new_todo.id, todo=new_todo.model_dump())]
+        )
+    except Exception as e:
+        # Undo partial changes if error happens
+        session.rollback()
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    return new_todo
+
+
+def update_todo(session: Session, id: int, todo_update: Todo) -> Todo:
+    """
+    Applies the title and completed flag set in `todo_update`, bumping the
+    row version
+    """
+    existing_todo = session.exec(select(Todo).where(Todo.id == id)).first()
+    if not existing_todo:
+        raise HTTPException(status_code=404, detail=f"Todo not found with id {id}")
+
+    if todo_update.title is not None:
+        existing_todo.title = todo_update.title
+    if todo_update.completed is not None:
+        existing_todo.completed = todo_update.completed
+    existing_todo.version += 1
+
+    try:
+        session.add(existing_todo)
+        session.commit()
+        session.refresh(existing_todo)
+        todos_written(
+            [TodoEvent(action="update", id=id, todo=existing_todo.model_dump())]
+        )
+    except Exception as e:
+        session.rollback()
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+    return existing_todo
+
+
+def remove_todo(session: Session, todo_id: int) -> JSONResponse:
+    """
+    Deletes a todo by id
+    """
+    try:
+        todo = session.get(Todo, todo_id)
+        if not todo:
+            raise HTTPException(
+                status_code=404, detail=f"Todo with ID {todo_id} not found"
+            )
+
+        session.delete(todo)
+        session.commit()
+        todos_written([TodoEvent(action="delete", id=todo_id)])
+        return JSONResponse(
+            status_code=200,
+            content={"detail": f"Todo with ID {todo_id} deleted successfully"},
+        )
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        session.rollback()
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+def write_bulk(
+    session: Session, operations: list[TodoBulkOperation], atomic: bool
+) -> TodoBulkResponse | JSONResponse:
+    """
+    Applies bulk operations in one transaction, 400 when nothing was committed
+    """
+    if len(operations) > BULK_MAX_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"A bulk request can hold at most {BULK_MAX_BATCH} operations",
+        )
+
+    try:
+        result = apply_bulk_operations(session, operations, atomic)
+    except Exception as e:
+        session.rollback()
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+    if not result.committed:
+        return JSONResponse(status_code=400, content=result.model_dump())
+    todos_written(bulk_events(operations, result))
+    return result
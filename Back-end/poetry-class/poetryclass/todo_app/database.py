@@ -2,15 +2,22 @@
 FastAPI todo app Database connection
 """
 
-from sqlmodel import Session, create_engine
+import os
+
+from sqlalchemy.engine import Connection
+from sqlmodel import Session
+
+from poetryclass.sqlite_engine import create_sqlite_engine
+from schema import Todo
 
 DB_FILE: str = "todos.db"
 
 DATABASE: str = f"sqlite:///{DB_FILE}"
 
-connect_args = {"check_same_thread": False}
+engine = create_sqlite_engine(DATABASE)
 
-engine = create_engine(DATABASE, echo=True, connect_args=connect_args)
+# "sync" serves the API with blocking sessions, "async" with aiosqlite
+DB_BACKEND: str = os.getenv("TODO_DB_BACKEND", "sync")
 
 
 def get_session():
@@ -19,3 +26,29 @@ def get_session():
     """
     with Session(engine) as session:
         yield session
+
+
+def upgrade_todo_table(connection: Connection) -> None:
+    """
+    Adds the columns and indexes added since a todo table was created
+
+    Run after create_all, which seeds the sync state. Existing todos take
+    their id as sync version, so delta sync clients starting from 0 get
+    them and their row ETags stay unique.
+    """
+    columns = {row[1] for row in connection.exec_driver_sql("PRAGMA table_info(todo)")}
+    if "version" not in columns:
+        connection.exec_driver_sql(
+            "ALTER TABLE todo ADD COLUMN version INTEGER NOT NULL DEFAULT 1"
+        )
+    if "updated_version" not in columns:
+        connection.exec_driver_sql(
+            "ALTER TABLE todo ADD COLUMN updated_version INTEGER NOT NULL DEFAULT 0"
+        )
+        connection.exec_driver_sql("UPDATE todo SET updated_version = id")
+        connection.exec_driver_sql(
+            "UPDATE todo_sync_state SET version = "
+            "max(version, (SELECT coalesce(max(id), 0) FROM todo)) WHERE id = 1"
+        )
+    for index in Todo.__table__.indexes:
+        index.create(connection, checkfirst=True)
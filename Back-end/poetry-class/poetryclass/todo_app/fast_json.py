@@ -0,0 +1,78 @@
+"""
+FastAPI todo app fast JSON serialization
+
+With TODO_FAST_JSON=1 (or create_app(fast_json=True)) the list endpoints
+select plain column rows instead of Todo objects and encode them straight to
+bytes, skipping both the ORM object construction and the response_model
+pass. Each endpoint dumps its rows with a precompiled TypeAdapter of its
+response shape. orjson is optional (the `fast-json` extra) and encodes faster
+when it is installed; the TypeAdapters are the path without it.
+"""
+
+from typing import Any, Optional, Sequence
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from typing_extensions import TypedDict
+
+from poetryclass.sqlite_engine import env_flag
+from schema import Todo
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - the fast-json extra is optional
+    orjson = None
+
+FAST_JSON: bool = env_flag("TODO_FAST_JSON")
+
+# Selected instead of the Todo entity on the fast path
+TODO_COLUMNS = list(Todo.__table__.columns)
+TODO_FIELDS: list[str] = [column.name for column in TODO_COLUMNS]
+
+
+class TodoRow(TypedDict):
+    """
+    A todo as a plain dict, the items of the fast responses
+    """
+
+    id: Optional[int]
+    title: str
+    completed: bool
+    version: int
+    updated_version: int
+
+
+class TodoRowPage(TypedDict):
+    """
+    TodoPage with plain dict items
+    """
+
+    items: list[TodoRow]
+    next_cursor: Optional[int]
+
+
+TODO_LIST_ADAPTER = TypeAdapter(list[TodoRow])
+TODO_PAGE_ADAPTER = TypeAdapter(TodoRowPage)
+
+
+def rows_as_dicts(rows: Sequence[Sequence[Any]]) -> list[dict[str, Any]]:
+    """
+    Turns rows of TODO_COLUMNS into todo dicts
+    """
+    return [dict(zip(TODO_FIELDS, row)) for row in rows]
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response encoded with orjson, or with the TypeAdapter of its shape
+    without it
+    """
+
+    def __init__(self, content: Any, adapter: TypeAdapter, **kwargs) -> None:
+        self.adapter = adapter
+        super().__init__(content, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content)
+        return self.adapter.dump_json(content)
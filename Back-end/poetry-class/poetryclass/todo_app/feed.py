@@ -0,0 +1,257 @@
+"""
+FastAPI todo app change feed over Server-Sent Events and WebSocket
+
+Writes publish small create/update/delete events to `todo_feed`. Each
+connection reads them from its own bounded queue: a client that falls behind
+is disconnected rather than slowing the writers down, and it can reconnect
+with the last event id it saw to resume from the retained events.
+"""
+
+import asyncio
+import json
+import os
+import threading
+from collections import deque
+from uuid import uuid4
+
+from fastapi import APIRouter, Header, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+
+from schema import TodoEvent
+
+# Events kept in memory for clients resuming with a Last-Event-ID
+FEED_RETENTION: int = int(os.getenv("TODO_FEED_RETENTION", "1000"))
+
+# Events queued per connection before a slow client is dropped
+FEED_BUFFER_SIZE: int = int(os.getenv("TODO_FEED_BUFFER_SIZE", "100"))
+
+# Seconds between SSE keep-alive comments on an idle connection
+FEED_KEEPALIVE: float = float(os.getenv("TODO_FEED_KEEPALIVE", "15"))
+
+# Queued in place of the events a slow client missed
+OVERFLOW = object()
+
+
+class Subscriber:
+    """
+    One feed connection with its bounded event queue
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int) -> None:
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def push(self, event: tuple[str, TodoEvent]) -> None:
+        """
+        Queues an event, safe to call from any thread
+        """
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The loop closed before the connection unsubscribed
+            pass
+
+    def _put(self, event: tuple[str, TodoEvent]) -> None:
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Drop what is queued and tell the connection to close
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+
+class ChangeFeed:
+    """
+    Publishes todo events to every subscriber and retains the latest ones
+
+    Event ids are "<epoch>-<sequence>". The epoch changes on every start, so
+    an id from before a restart is recognised and the client told to reset.
+    """
+
+    def __init__(self, retention: int, buffer_size: int) -> None:
+        self.buffer_size = buffer_size
+        self._epoch = uuid4().hex[:8]
+        self._sequence = 0
+        self._events: deque[tuple[int, TodoEvent]] = deque(maxlen=retention)
+        self._subscribers: set[Subscriber] = set()
+        self._lock = threading.Lock()
+
+    def event_id(self, sequence: int) -> str:
+        """
+        Public id of an event
+        """
+        return f"{self._epoch}-{sequence}"
+
+    def publish(self, event: TodoEvent) -> None:
+        """
+        Retains the event and queues it for every subscriber
+        """
+        with self._lock:
+            self._sequence += 1
+            self._events.append((self._sequence, event))
+            subscribers = list(self._subscribers)
+            event_id = self.event_id(self._sequence)
+        for subscriber in subscribers:
+            subscriber.push((event_id, event))
+
+    def subscribe(
+        self, last_event_id: str | None
+    ) -> tuple[Subscriber, list[tuple[str, TodoEvent]] | None]:
+        """
+        Registers a subscriber and returns the events it missed
+
+        The backlog is None when the events after `last_event_id` are no
+        longer retained and the client has to refetch the todos.
+        """
+        subscriber = Subscriber(asyncio.get_running_loop(), self.buffer_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if last_event_id is None:
+                return subscriber, []
+
+            epoch, _, sequence = last_event_id.partition("-")
+            if epoch != self._epoch or not sequence.isdigit():
+                return subscriber, None
+            after = int(sequence)
+            oldest = self._events[0][0] if self._events else self._sequence + 1
+            if after < oldest - 1 or after > self._sequence:
+                return subscriber, None
+            backlog = [
+                (self.event_id(seq), event)
+                for seq, event in self._events
+                if seq > after
+            ]
+            return subscriber, backlog
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        """
+        Removes a subscriber
+        """
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+
+todo_feed = ChangeFeed(FEED_RETENTION, FEED_BUFFER_SIZE)
+
+router = APIRouter()
+
+
+def sse_message(event_id: str, event: TodoEvent) -> str:
+    """
+    Formats an event as a Server-Sent Events message
+    """
+    data = event.model_dump_json()
+    return f"id: {event_id}\nevent: {event.action}\ndata: {data}\n\n"
+
+
+async def sse_stream(request: Request, last_event_id: str | None):
+    """
+    Yields the missed events, then live events until the client goes away
+    """
+    subscriber, backlog = todo_feed.subscribe(last_event_id)
+    try:
+        if backlog is None:
+            yield "event: reset\ndata: {}\n\n"
+            backlog = []
+        for event_id, event in backlog:
+            yield sse_message(event_id, event)
+
+        while True:
+            try:
+                item = await asyncio.wait_for(subscriber.queue.get(), FEED_KEEPALIVE)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keep-alive\n\n"
+                continue
+            if item is OVERFLOW:
+                break
+            yield sse_message(*item)
+    finally:
+        todo_feed.unsubscribe(subscriber)
+
+
+@router.get("/todos/feed")
+async def todo_feed_sse(
+    request: Request,
+    last_event_id: str | None = Header(default=None),
+    after: str | None = Query(default=None),
+) -> StreamingResponse:
+    """
+    Stream todo changes as Server-Sent Events
+
+    Args:
+        last_event_id (str | None): Last-Event-ID header sent by EventSource
+            when it reconnects
+        after (str | None): Event id to resume from, for a first connection
+
+    An `event: reset` message means the missed events are gone and the todos
+    have to be fetched again.
+    """
+    return StreamingResponse(
+        sse_stream(request, last_event_id or after),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def ws_message(event_id: str, event: TodoEvent) -> str:
+    """
+    Formats an event as a WebSocket message
+    """
+    return json.dumps({"id": event_id, "event": event.model_dump()})
+
+
+async def wait_for_disconnect(websocket: WebSocket) -> None:
+    """
+    Reads the socket until the client goes away, ignoring its messages
+    """
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+
+
+@router.websocket("/todos/feed/ws")
+async def todo_feed_websocket(websocket: WebSocket, after: str | None = None):
+    """
+    Stream todo changes over a WebSocket, one JSON message per event
+
+    Messages are {"id": ..., "event": {...}}, or {"reset": true} when the
+    events after `after` are gone and the todos have to be fetched again.
+    Messages from the client are ignored.
+    """
+    await websocket.accept()
+    subscriber, backlog = todo_feed.subscribe(after)
+    # Read the socket alongside the queue, so a client that goes away while
+    # no todo changes is unsubscribed instead of waiting for the next event
+    receiver = asyncio.create_task(wait_for_disconnect(websocket))
+    try:
+        if backlog is None:
+            await websocket.send_text(json.dumps({"reset": True}))
+            backlog = []
+        for event_id, event in backlog:
+            await websocket.send_text(ws_message(event_id, event))
+
+        while True:
+            getter = asyncio.create_task(subscriber.queue.get())
+            await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done():
+                getter.cancel()
+                break
+            item = getter.result()
+            if item is OVERFLOW:
+                # 1013: try again later, the client resumes from its last id
+                await websocket.close(code=1013)
+                break
+            await websocket.send_text(ws_message(*item))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        todo_feed.unsubscribe(subscriber)
@@ -2,46 +2,118 @@
 FastAPI todo app Crud Operation API's
 """
 
+import asyncio
 from contextlib import asynccontextmanager
 from typing import Annotated
 
-from fastapi import FastAPI, Depends, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, FastAPI, Depends, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-
-from sqlmodel import SQLModel, select, Session
+from fastapi.concurrency import run_in_threadpool
+
+from sqlmodel import SQLModel, Session
+
+
+from cache import todo_cache
+from changes import compact_periodically, compact_tombstones, read_changes
+from crud import (
+    create_todo,
+    read_all_todos,
+    read_ndjson_chunk,
+    read_page,
+    read_todo,
+    remove_todo,
+    update_todo,
+    write_bulk,
+)
+from database import DB_BACKEND, engine, get_session, upgrade_todo_table
+from fast_json import FAST_JSON
+from feed import router as feed_router
+from schema import (
+    PAGE_SIZE_MAX,
+    STREAM_CHUNK_SIZE,
+    Todo,
+    TodoBulkOperation,
+    TodoBulkResponse,
+    TodoChanges,
+    TodoPage,
+    TodoSearchPage,
+)
+from search import ensure_search_index, search_page
 
 
-from database import engine, get_session
-from schema import Todo
+def compact_todo_tombstones() -> int:
+    """
+    Compact delta sync tombstones in a session of its own
+    """
+    with Session(engine) as session:
+        return compact_tombstones(session)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
-    Create database tables and yield
+    Create or upgrade database tables, compact tombstones in the background
+    and yield
     """
     SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        upgrade_todo_table(connection)
+        ensure_search_index(connection)
+    compaction = asyncio.create_task(
+        compact_periodically(lambda: run_in_threadpool(compact_todo_tombstones))
+    )
     yield
+    compaction.cancel()
 
 
-app = FastAPI(
-    lifespan=lifespan, title="Todo API", description="A simple Todo app API's"
-)
+def create_app(backend: str = DB_BACKEND, fast_json: bool = FAST_JSON) -> FastAPI:
+    """
+    Build the todo app served by the sync or the async database backend
 
+    Args:
+        backend (str): "sync" or "async"
+        fast_json (bool): Serialize the todo lists straight to bytes
+    """
+    if backend not in ("sync", "async"):
+        raise ValueError(f"Unknown database backend {backend!r}")
 
-# Allow middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    app_lifespan, app_router = lifespan, router
+    if backend == "async":
+        # Only the async backend needs aiosqlite and greenlet
+        # pylint: disable=import-outside-toplevel
+        from async_main import async_lifespan, router as async_router
+
+        app_lifespan, app_router = async_lifespan, async_router
+
+    app = FastAPI(
+        lifespan=app_lifespan,
+        title="Todo API",
+        description="A simple Todo app API's",
+    )
+
+    # Allow middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
 
+    app.state.fast_json = fast_json
+    app.include_router(app_router)
+    app.include_router(feed_router)
+    return app
 
-@app.get("/", response_model=list[Todo])
+
+router = APIRouter()
+
+
+@router.get("/", response_model=list[Todo])
 def read_todos(
+    request: Request,
+    response: Response,
     session: Session = Depends(get_session),
 ) -> list[Todo] | JSONResponse:
     """
@@ -53,20 +125,59 @@ def read_todos(
     Returns:
         Union[List[Todo], JSONResponse]: List of Todos or error message
     """
-    try:
-        query = select(Todo)
-        todos = session.exec(query).all()
-        if not todos:
-            return JSONResponse(
-                status_code=404,
-                content={"error": {"code": 404, "message": "No todos in the database"}},
-            )
-        return todos
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) from e
+    return read_all_todos(session, request, response)
+
+
+@router.get("/todos", response_model=TodoPage)
+def read_todos_page(
+    request: Request,
+    response: Response,
+    session: Annotated[Session, Depends(get_session)],
+    limit: int = Query(default=100, ge=1, le=PAGE_SIZE_MAX),
+    after: int | None = Query(default=None, ge=0),
+) -> TodoPage:
+    """
+    Read one page of todos ordered by id
 
+    Args:
+        limit (int): Maximum number of todos in the page
+        after (int | None): Cursor returned as `next_cursor` by the previous page
 
-@app.post("/new/todo")
+    Returns:
+        TodoPage: Todos in the page and the cursor of the next one
+    """
+    return read_page(session, request, response, limit, after)
+
+
+def iter_todos_ndjson(session: Session, chunk_size: int, after: int | None = None):
+    """
+    Yield todos as newline delimited JSON, one chunk of rows at a time
+    """
+    last_id: int | None = after or 0
+    while last_id is not None:
+        chunk, last_id = read_ndjson_chunk(session, last_id, chunk_size)
+        if chunk:
+            yield chunk
+
+
+@router.get("/todos/stream")
+def stream_todos(
+    session: Annotated[Session, Depends(get_session)],
+    after: int | None = Query(default=None, ge=0),
+) -> StreamingResponse:
+    """
+    Stream every todo as NDJSON (one JSON object per line)
+
+    Args:
+        after (int | None): Only stream todos with an id greater than this
+    """
+    return StreamingResponse(
+        iter_todos_ndjson(session, STREAM_CHUNK_SIZE, after),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.post("/new/todo")
 def create_new_todo(
     session: Annotated[Session, Depends(get_session)], todo: Todo
 ) -> Todo:
@@ -75,40 +186,81 @@ def create_new_todo(
     Args:
         todo (Todo)
     """
-    new_todo = Todo(title=todo.title, completed=todo.completed)
-    session.add(new_todo)
-    try:
-        session.commit()
-        session.refresh(new_todo)
-    except Exception as e:
-        # Undo partial changes if error happens
-        session.rollback()
-        raise HTTPException(status_code=400, detail=str(e)) from e
+    return create_todo(session, todo)
+
+
+@router.get("/todos/search", response_model=TodoSearchPage)
+def search_todo_titles(
+    session: Annotated[Session, Depends(get_session)],
+    q: str = Query(min_length=1),
+    limit: int = Query(default=20, ge=1, le=PAGE_SIZE_MAX),
+    offset: int = Query(default=0, ge=0),
+) -> TodoSearchPage:
+    """
+    Full-text search over todo titles, ranked by bm25
+
+    Args:
+        q (str): Words that must all appear in the title
+        limit (int): Maximum number of todos in the page
+        offset (int): Number of results to skip
+
+    Returns:
+        TodoSearchPage: Matching todos and the offset of the next page
+    """
+    return search_page(session, q, limit, offset)
+
+
+@router.get("/todos/changes", response_model=TodoChanges)
+def read_todo_changes(
+    session: Annotated[Session, Depends(get_session)],
+    since: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=1, le=PAGE_SIZE_MAX),
+) -> TodoChanges:
+    """
+    Delta sync: todos written and deleted after a sync version
+
+    Args:
+        since (int): `version` returned by the previous sync, 0 for everything
+        limit (int): Maximum number of changes in the page
+
+    Returns:
+        TodoChanges: Written todos, deleted ids and the version to sync from
+            next. 410 Gone when the tombstones after `since` were compacted.
+    """
+    return read_changes(session, since, limit)
+
+
+@router.post("/todos/bulk", response_model=TodoBulkResponse)
+def bulk_todos(
+    session: Annotated[Session, Depends(get_session)],
+    operations: list[TodoBulkOperation],
+    atomic: bool = True,
+):
+    """
+    Create, update and delete many todos in a single transaction
+
+    Args:
+        operations (list[TodoBulkOperation]): Operations to apply
+        atomic (bool): Apply nothing if any operation is invalid, otherwise
+            apply the valid ones and report the others
 
-    return new_todo
+    Returns:
+        TodoBulkResponse: Whether the batch was committed and per-item results
+    """
+    return write_bulk(session, operations, atomic)
 
 
-@app.get("/todo/{id}")
-def get_todo_by_id(session: Annotated[Session, Depends(get_session)], id: int):
+@router.get("/todo/{id}")
+def get_todo_by_id(
+    request: Request, session: Annotated[Session, Depends(get_session)], id: int
+):
     """
     Return the todo which matches against the id
     """
-    try:
-        query = select(Todo).where(Todo.id == id)
-        todo: Todo | None = session.exec(query).first()
-        if not todo:
-            return JSONResponse(
-                status_code=404,
-                content={
-                    "error": {"code": 404, "message": f"Todo not found with id {id}"}
-                },
-            )
-        return todo
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) from e
-
-
-@app.patch("/edit/todo/{id}", response_model=Todo)
+    return read_todo(session, request, id)
+
+
+@router.patch("/edit/todo/{id}", response_model=Todo)
 def edit_todo(
     id: int,
     todo_update: Todo,
@@ -124,27 +276,10 @@ def edit_todo(
     Returns:
         Todo: Updated todo item
     """
-    existing_todo = session.exec(select(Todo).where(Todo.id == id)).first()
-    if not existing_todo:
-        raise HTTPException(status_code=404, detail=f"Todo not found with id {id}")
-
-    if todo_update.title is not None:
-        existing_todo.title = todo_update.title
-    if todo_update.completed is not None:
-        existing_todo.completed = todo_update.completed
+    return update_todo(session, id, todo_update)
 
-    try:
-        session.add(existing_todo)
-        session.commit()
-        session.refresh(existing_todo)
-    except Exception as e:
-        session.rollback()
-        raise HTTPException(status_code=500, detail=str(e)) from e
 
-    return existing_todo
-
-
-@app.delete("/delete/todo/{todo_id}", response_model=Todo)
+@router.delete("/delete/todo/{todo_id}", response_model=Todo)
 def delete_todo(todo_id: int, session: Session = Depends(get_session)) -> JSONResponse:
     """
     Delete a todo by ID
@@ -155,21 +290,15 @@ def delete_todo(todo_id: int, session: Session = Depends(get_session)) -> JSONRe
     Returns:
         JSONResponse: Deleted Todo or error message
     """
-    try:
-        todo = session.get(Todo, todo_id)
-        if not todo:
-            raise HTTPException(
-                status_code=404, detail=f"Todo with ID {todo_id} not found"
-            )
-
-        session.delete(todo)
-        session.commit()
-        return JSONResponse(
-            status_code=200,
-            content={"detail": f"Todo with ID {todo_id} deleted successfully"},
-        )
-    except HTTPException as e:
-        raise e
-    except Exception as e:
-        session.rollback()
-        raise HTTPException(status_code=500, detail=str(e)) from e
+    return remove_todo(session, todo_id)
+
+
+@router.get("/todos/cache/stats")
+def read_cache_stats() -> dict:
+    """
+    Hit, miss and eviction counters of the single todo cache
+    """
+    return todo_cache.stats()
+
+
+app = create_app()
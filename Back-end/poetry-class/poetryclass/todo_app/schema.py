@@ -3,7 +3,13 @@ FastAPI todo app schemas
 """
 
 from sqlmodel import SQLModel, Field
-from typing import Optional
+from typing import Literal, Optional
+
+# Largest page a client can ask for on the paginated list
+PAGE_SIZE_MAX: int = 500
+
+# Rows fetched from the database per chunk while streaming
+STREAM_CHUNK_SIZE: int = 1000
 
 
 class Todo(SQLModel, table=True):
@@ -14,3 +20,121 @@ class Todo(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str
     completed: bool = False
+    # Bumped on every edit
+    version: int = 1
+    # Sync version of the last write, set by a trigger (see changes.py) and
+    # used for the row ETag
+    updated_version: int = Field(default=0, index=True)
+
+
+class TodoTombstone(SQLModel, table=True):
+    """
+    A deleted todo, kept for delta sync clients until compacted
+    """
+
+    __tablename__ = "todo_tombstone"
+
+    todo_id: int = Field(primary_key=True)
+    deleted_version: int = Field(index=True)
+    # Unix time of the delete
+    deleted_at: int
+
+
+class TodoSyncState(SQLModel, table=True):
+    """
+    Single row holding the last sync version handed out
+
+    Tombstones up to `compacted_version` are gone, clients that synced
+    before it have to fetch every todo again.
+    """
+
+    __tablename__ = "todo_sync_state"
+
+    id: int = Field(default=1, primary_key=True)
+    version: int = 0
+    compacted_version: int = 0
+
+
+class TodoPage(SQLModel):
+    """
+    A page of todos for keyset pagination
+
+    `next_cursor` is the id to pass as `after` to fetch the next page,
+    or None when there are no more todos.
+    """
+
+    items: list[Todo]
+    next_cursor: Optional[int] = None
+
+
+class TodoSearchPage(SQLModel):
+    """
+    A page of search results, best match first
+
+    `next_offset` is the offset of the next page, or None on the last one.
+    """
+
+    items: list[Todo]
+    next_offset: Optional[int] = None
+
+
+class TodoBulkOperation(SQLModel):
+    """
+    One operation of a bulk request
+
+    `create` needs a title, `update` and `delete` need the id of the todo.
+    """
+
+    op: Literal["create", "update", "delete"]
+    id: Optional[int] = None
+    title: Optional[str] = None
+    completed: Optional[bool] = None
+
+
+class TodoBulkResult(SQLModel):
+    """
+    Outcome of one bulk operation, in request order
+    """
+
+    index: int
+    op: str
+    ok: bool
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class TodoBulkResponse(SQLModel):
+    """
+    Outcome of a bulk request
+    """
+
+    committed: bool
+    results: list[TodoBulkResult]
+
+
+class TodoEvent(SQLModel):
+    """
+    A change to one todo, published on the change feed
+
+    `todo` holds the fields known after the write: the whole todo for
+    single creates and edits, the updated fields for bulk updates and
+    nothing for deletes.
+    """
+
+    action: Literal["create", "update", "delete"]
+    id: int
+    todo: Optional[dict] = None
+
+
+class TodoChanges(SQLModel):
+    """
+    Todos written and deleted after a sync version
+
+    Pass `version` as `since` on the next request. When `has_more` is true
+    the page was cut at `limit` and the next request continues from it.
+    """
+
+    todos: list[Todo]
+    deleted: list[int]
+    version: int
+    has_more: bool
@@ -0,0 +1,165 @@
+"""
+FastAPI todo app full-text search (SQLite FTS5)
+
+`todo_fts` is an external content FTS5 table over `todo.title`: it stores only
+the index, and triggers on `todo` keep it in sync with every insert, update
+and delete, including the bulk statements.
+
+Rebuild the index of an existing database with:
+    python search.py rebuild
+"""
+
+import argparse
+import re
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Connection
+from sqlmodel import Session
+
+from database import engine
+from schema import Todo, TodoSearchPage
+
+SEARCH_DDL: list[str] = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS todo_fts
+    USING fts5(title, content='todo', content_rowid='id')
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_fts_insert AFTER INSERT ON todo BEGIN
+        INSERT INTO todo_fts(rowid, title) VALUES (new.id, new.title);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_fts_delete AFTER DELETE ON todo BEGIN
+        INSERT INTO todo_fts(todo_fts, rowid, title)
+        VALUES ('delete', old.id, old.title);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS todo_fts_update AFTER UPDATE OF title ON todo BEGIN
+        INSERT INTO todo_fts(todo_fts, rowid, title)
+        VALUES ('delete', old.id, old.title);
+        INSERT INTO todo_fts(rowid, title) VALUES (new.id, new.title);
+    END
+    """,
+]
+
+# `rank` is bm25() for FTS5; ranking and paging run inside the FTS5 table
+# so only the rows of the page are joined back to `todo`
+SEARCH_QUERY = text("""
+    SELECT todo.*
+    FROM (
+        SELECT rowid, rank FROM todo_fts
+        WHERE todo_fts MATCH :query
+        ORDER BY rank
+        LIMIT :limit OFFSET :offset
+    ) AS hits
+    JOIN todo ON todo.id = hits.rowid
+    ORDER BY hits.rank
+    """)
+
+
+def create_search_index(connection: Connection) -> None:
+    """
+    Creates the FTS5 table and its triggers if they don't exist
+    """
+    for ddl in SEARCH_DDL:
+        connection.exec_driver_sql(ddl)
+
+
+def rebuild_search_index(connection: Connection) -> None:
+    """
+    Rebuilds the FTS5 index from the rows of `todo`
+    """
+    create_search_index(connection)
+    connection.exec_driver_sql("INSERT INTO todo_fts(todo_fts) VALUES ('rebuild')")
+
+
+def ensure_search_index(connection: Connection) -> None:
+    """
+    Creates the index of a database made before search existed, and fills it
+    """
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'todo_fts'"
+    ).first()
+    if not exists:
+        rebuild_search_index(connection)
+
+
+def drop_search_index(connection: Connection) -> None:
+    """
+    Drops the FTS5 table, the triggers go away with `todo`
+    """
+    connection.exec_driver_sql("DROP TABLE IF EXISTS todo_fts")
+
+
+@event.listens_for(Todo.__table__, "after_create")
+def after_todo_create(_table, connection: Connection, **_) -> None:
+    """
+    Creates the index together with the todo table
+    """
+    create_search_index(connection)
+
+
+@event.listens_for(Todo.__table__, "before_drop")
+def before_todo_drop(_table, connection: Connection, **_) -> None:
+    """
+    Drops the index together with the todo table
+    """
+    drop_search_index(connection)
+
+
+def fts_query(query: str) -> str:
+    """
+    Turns user input into an FTS5 query matching every word
+
+    Each word is quoted so FTS5 operators and punctuation in the input
+    can't break the query.
+    """
+    words = re.findall(r"\w+", query)
+    return " ".join(f'"{word}"' for word in words)
+
+
+def search_todos(session: Session, query: str, limit: int, offset: int) -> list[Todo]:
+    """
+    Returns todos whose title matches the query, best match first
+    """
+    match = fts_query(query)
+    if not match:
+        return []
+    rows = session.connection().execute(
+        SEARCH_QUERY, {"query": match, "limit": limit, "offset": offset}
+    )
+    return [Todo.model_validate(row._mapping) for row in rows]
+
+
+def search_page(
+    session: Session, query: str, limit: int, offset: int
+) -> TodoSearchPage:
+    """
+    One page of search results with the offset of the next page
+    """
+    # Fetch one extra row to know whether another page exists
+    todos = search_todos(session, query, limit + 1, offset)
+    next_offset = None
+    if len(todos) > limit:
+        todos = todos[:limit]
+        next_offset = offset + limit
+    return TodoSearchPage(items=todos, next_offset=next_offset)
+
+
+def main() -> None:
+    """
+    Search index command line
+    """
+    parser = argparse.ArgumentParser(description="Todo full-text search index")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+
+    with engine.begin() as connection:
+        rebuild_search_index(connection)
+    print("Search index rebuilt")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+FastAPI todo app table versions and ETags
+"""
+
+import threading
+from uuid import uuid4
+
+from fastapi import Request, Response
+
+
+class TableVersion:
+    """
+    Monotonically increasing version of a table, bumped by every write
+
+    The version lives in process memory so a conditional GET can be answered
+    without touching the database. It starts from a random epoch on every
+    start, so an ETag handed out before a restart never matches again. Writes
+    made by another process are not seen, run the app as a single worker.
+    """
+
+    def __init__(self) -> None:
+        self._epoch = uuid4().hex[:8]
+        self._version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        """
+        Current version
+        """
+        return self._version
+
+    @property
+    def etag(self) -> str:
+        """
+        Strong ETag of the current version
+        """
+        return f'"{self._epoch}-{self._version}"'
+
+    def bump(self) -> int:
+        """
+        Records a write and returns the new version
+        """
+        with self._lock:
+            self._version += 1
+            return self._version
+
+
+todo_table_version = TableVersion()
+
+
+def row_etag(updated_version: int) -> str:
+    """
+    Strong ETag of one todo row
+
+    Built from the sync version of the row's last write, which is unique
+    across the whole table: SQLite reuses the id of a deleted todo, so an
+    id and per-row counter would match a different todo created later.
+    """
+    return f'"{updated_version}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches the ETag
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so ignore W/ prefixes
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in candidates
+
+
+def not_modified(etag: str) -> Response:
+    """
+    Empty 304 response carrying the ETag
+    """
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def conditional_response(request: Request, etag: str, body: bytes) -> Response:
+    """
+    JSON response for a serialized body, or 304 if the client already has it
+    """
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
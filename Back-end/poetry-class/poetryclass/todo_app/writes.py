@@ -0,0 +1,24 @@
+"""
+FastAPI todo app bookkeeping after a committed write
+"""
+
+from cache import todo_cache
+from feed import todo_feed
+from schema import TodoEvent
+from versioning import todo_table_version
+
+
+def todos_written(events: list[TodoEvent]) -> None:
+    """
+    Runs after a write is committed, with one event per changed todo
+
+    Bumps the table version before invalidating the cache, which
+    get_todo_by_id relies on to never cache a row read during a write, then
+    publishes the events on the change feed.
+    """
+    if not events:
+        return
+    todo_table_version.bump()
+    for event in events:
+        todo_cache.invalidate(event.id)
+        todo_feed.publish(event)
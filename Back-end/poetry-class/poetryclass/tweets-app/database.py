@@ -1,8 +1,14 @@
-from sqlmodel import SQLModel, create_engine, Session
+from sqlmodel import SQLModel, Session
+
+from poetryclass.sqlite_engine import create_sqlite_engine
 
 DATABASE_URL = "sqlite:///./tweets.db"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_sqlite_engine(DATABASE_URL)
+
+# The current UTC time as SQLAlchemy stores a DateTime in SQLite,
+# "YYYY-MM-DD HH:MM:SS.ffffff" (%f has milliseconds, padded to microseconds)
+DATETIME_NOW = "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
 
 
 def get_db() -> Session:
@@ -18,3 +24,32 @@ def create_db_and_tables():
     Create the database tables.
     """
     SQLModel.metadata.create_all(engine)
+    upgrade_tweet_table()
+
+
+def upgrade_tweet_table():
+    """
+    Add the columns and indexes added since a tweet table was created.
+    """
+    table = SQLModel.metadata.tables.get("tweet")
+    if table is None:
+        return
+    with engine.begin() as connection:
+        columns = {
+            row[1] for row in connection.exec_driver_sql("PRAGMA table_info(tweet)")
+        }
+        if "created_at" not in columns:
+            # Existing tweets are dated to the upgrade and ordered by id
+            connection.exec_driver_sql(
+                "ALTER TABLE tweet ADD COLUMN created_at DATETIME"
+            )
+            connection.exec_driver_sql(f"UPDATE tweet SET created_at = {DATETIME_NOW}")
+        # Dates are compared as strings by the timeline cursor, so every one
+        # has to be in SQLAlchemy's format, with microseconds. Earlier
+        # upgrades stored CURRENT_TIMESTAMP, which has none.
+        connection.exec_driver_sql(
+            "UPDATE tweet SET created_at = created_at || '.000000' "
+            "WHERE length(created_at) = 19"
+        )
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
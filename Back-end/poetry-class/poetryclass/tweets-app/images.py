@@ -0,0 +1,299 @@
+"""
+Resized tweet image variants
+
+Every uploaded image gets smaller WebP copies for the feed and the dashboard.
+They are rendered in a process pool, so the resizing neither blocks the event
+loop nor competes with it for the GIL, and written to `uploads/variants`,
+sharded like the uploads. A variant that is missing, because it was never
+generated or was deleted, is rendered on its first request.
+
+Uploads themselves are normalized in the same pool before they are stored:
+the camera orientation is applied, metadata (EXIF, GPS, color profiles) is
+dropped, the dimensions are capped and the image is re-encoded. Animated and
+undecodable images are stored as uploaded.
+"""
+
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+from poetryclass.sqlite_engine import env_flag
+from utils import (
+    CHUNK_SIZE,
+    UPLOAD_FOLDER,
+    ImageTooLarge,
+    SpooledFile,
+    image_path,
+    remove_temp_file,
+    shard_folder,
+    temp_file,
+)
+
+VARIANT_FOLDER = Path(UPLOAD_FOLDER) / "variants"
+
+VARIANT_FORMAT = "WEBP"
+VARIANT_EXTENSION = "webp"
+VARIANT_QUALITY = int(os.getenv("TWEETS_VARIANT_QUALITY", "80"))
+
+# Processes rendering variants, defaults to the number of CPUs
+VARIANT_WORKERS = int(os.getenv("TWEETS_VARIANT_WORKERS", "0")) or None
+
+
+class ImageSize(str, Enum):
+    """
+    Sizes an image can be served in besides the original
+    """
+
+    thumb = "thumb"
+    medium = "medium"
+
+
+# Longest side of each variant in pixels, images are never upscaled
+VARIANT_MAX_SIDE: dict[ImageSize, int] = {
+    ImageSize.thumb: 160,
+    ImageSize.medium: 640,
+}
+
+# Upload normalization, on unless TWEETS_NORMALIZE=0
+NORMALIZE = env_flag("TWEETS_NORMALIZE", True)
+NORMALIZE_FORMAT = os.getenv("TWEETS_NORMALIZE_FORMAT", "WEBP").upper()
+NORMALIZE_QUALITY = int(os.getenv("TWEETS_NORMALIZE_QUALITY", "85"))
+
+# Longest side of a stored upload in pixels
+MAX_DIMENSION = int(os.getenv("TWEETS_MAX_DIMENSION", "2048"))
+
+FORMAT_EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg", "PNG": "png", "AVIF": "avif"}
+
+_pool: ProcessPoolExecutor | None = None
+
+# Renders in progress, so concurrent requests for a variant share one
+_pending: dict[Path, asyncio.Future] = {}
+
+
+def variant_path(filename: str, size: ImageSize) -> Path:
+    """
+    Path of a variant of an uploaded image
+    """
+    stem = Path(filename).stem
+    name = f"{stem}.{size.value}.{VARIANT_EXTENSION}"
+    return VARIANT_FOLDER / shard_folder(filename) / name
+
+
+def variant_urls(filename: str) -> dict[str, str]:
+    """
+    URL of every variant of an uploaded image, by size
+    """
+    return {size.value: f"/uploads/{filename}?size={size.value}" for size in ImageSize}
+
+
+def render_variant(source: str, destination: str, max_side: int) -> None:
+    """
+    Writes a resized WebP copy of `source` to `destination`
+
+    Runs in a worker process. The copy is written to a temporary file and
+    renamed into place, so a reader never sees a half-written variant. The
+    shard folder is only created once the image was read and resized, so a
+    failed render leaves nothing behind.
+    """
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(destination), prefix=".variant-", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                image.save(tmp_file, VARIANT_FORMAT, quality=VARIANT_QUALITY)
+            os.replace(tmp_path, destination)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+
+def normalize_image(
+    source: str, extension: str, image_format: str, quality: int, max_dimension: int
+) -> SpooledFile | None:
+    """
+    Writes a normalized copy of the image at `source` to a temporary file
+
+    Runs in a worker process. Returns None when the image is kept as
+    uploaded.
+
+    Raises:
+        ImageTooLarge: The image has more pixels than Pillow agrees to decode
+    """
+    try:
+        with Image.open(source) as image:
+            if getattr(image, "n_frames", 1) > 1:
+                return None
+            # Orientation is applied before the EXIF holding it is dropped
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+            if image_format == "JPEG" or image.mode not in ("RGB", "RGBA"):
+                has_alpha = "A" in image.getbands() and image_format != "JPEG"
+                image = image.convert("RGBA" if has_alpha else "RGB")
+
+            fd, tmp_path = temp_file()
+            try:
+                # Nothing from image.info is passed on, so no metadata is kept
+                with os.fdopen(fd, "wb") as tmp_file:
+                    image.save(tmp_file, image_format, quality=quality)
+            except BaseException:
+                remove_temp_file(tmp_path)
+                raise
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e)) from e
+    except OSError:
+        # Not an image Pillow can read or write
+        return None
+
+    digest = hashlib.sha256()
+    with open(tmp_path, "rb") as file:
+        while chunk := file.read(CHUNK_SIZE):
+            digest.update(chunk)
+    size = os.path.getsize(tmp_path)
+    return SpooledFile(tmp_path, digest.hexdigest(), size, extension)
+
+
+class NormalizationStats:
+    """
+    Totals of the upload normalization, for the metrics endpoint
+    """
+
+    def __init__(self) -> None:
+        self.uploads = 0
+        self.normalized = 0
+        self.bytes_received = 0
+        self.bytes_stored = 0
+        self._lock = threading.Lock()
+
+    def record(self, received: int, stored: int, normalized: bool) -> None:
+        """
+        Counts one upload
+        """
+        with self._lock:
+            self.uploads += 1
+            self.normalized += normalized
+            self.bytes_received += received
+            self.bytes_stored += stored
+
+    def as_dict(self) -> dict[str, int]:
+        """
+        The totals and the bytes saved
+        """
+        with self._lock:
+            return {
+                "uploads": self.uploads,
+                "normalized": self.normalized,
+                "bytes_received": self.bytes_received,
+                "bytes_stored": self.bytes_stored,
+                "bytes_saved": self.bytes_received - self.bytes_stored,
+            }
+
+
+normalization_stats = NormalizationStats()
+
+
+async def normalize_upload(upload: SpooledFile) -> SpooledFile:
+    """
+    Normalizes a spooled upload in the process pool
+
+    Returns the normalized file, or `upload` itself when it is kept as is.
+    """
+    normalized = await asyncio.get_running_loop().run_in_executor(
+        get_pool(),
+        normalize_image,
+        upload.path,
+        FORMAT_EXTENSIONS.get(NORMALIZE_FORMAT, NORMALIZE_FORMAT.lower()),
+        NORMALIZE_FORMAT,
+        NORMALIZE_QUALITY,
+        MAX_DIMENSION,
+    )
+    if normalized is None:
+        normalization_stats.record(upload.size, upload.size, False)
+        return upload
+    normalization_stats.record(upload.size, normalized.size, True)
+    return normalized
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """
+    Process pool rendering the variants, started on first use
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=VARIANT_WORKERS)
+    return _pool
+
+
+def shutdown_pool() -> None:
+    """
+    Stops the worker processes
+    """
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+async def ensure_variant(filename: str, size: ImageSize) -> Path:
+    """
+    Returns the path of a variant, rendering it first if it doesn't exist
+
+    Raises:
+        OSError: The original is missing or is not an image Pillow can read
+    """
+    path = variant_path(filename, size)
+    if path.exists():
+        return path
+
+    pending = _pending.get(path)
+    if pending is None:
+        source = image_path(filename)
+        # Names come from the URL, don't queue renders of uploads that don't exist
+        if not os.path.exists(source):
+            raise FileNotFoundError(source)
+        pending = asyncio.get_running_loop().run_in_executor(
+            get_pool(),
+            render_variant,
+            source,
+            str(path),
+            VARIANT_MAX_SIDE[size],
+        )
+        _pending[path] = pending
+        pending.add_done_callback(lambda _: _pending.pop(path, None))
+    await asyncio.shield(pending)
+    return path
+
+
+async def generate_variants(filename: str) -> None:
+    """
+    Renders every variant of a new upload
+
+    Meant to run as a background task; a variant that fails here is retried
+    when it is first requested.
+    """
+    await asyncio.gather(
+        *(ensure_variant(filename, size) for size in ImageSize),
+        return_exceptions=True,
+    )
+
+
+def remove_variants(filename: str) -> None:
+    """
+    Deletes the variants of an uploaded image
+    """
+    for size in ImageSize:
+        variant_path(filename, size).unlink(missing_ok=True)
@@ -2,19 +2,72 @@
 Posts app main file
 """
 
+import asyncio
+from contextlib import asynccontextmanager
 from typing import List, Optional
-from pathlib import Path
-from fastapi import FastAPI, Depends, UploadFile, Form, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import (
+    BackgroundTasks,
+    FastAPI,
+    Depends,
+    UploadFile,
+    Form,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
 from fastapi.middleware.cors import CORSMiddleware
 from sqlmodel import Session, select
 
 
-from database import create_db_and_tables, get_db
-from models import Tweet
-from utils import save_image_locally
+from database import create_db_and_tables, engine, get_db
+from images import (
+    NORMALIZE,
+    ImageSize,
+    generate_variants,
+    normalization_stats,
+    normalize_upload,
+    shutdown_pool,
+)
+from models import TrendingTag, Tweet, TweetPage, TweetRead
+from serving import image_response
+from storage import collect_periodically, reap_releases, release_image
+from tags import (
+    delete_tweet_tags,
+    read_tagged,
+    read_trending,
+    set_tweet_tags,
+    trending,
+    warm_trending,
+)
+from timeline import (
+    PAGE_SIZE_DEFAULT,
+    PAGE_SIZE_MAX,
+    invalidate_timeline,
+    read_timeline,
+)
+from utils import ImageTooLarge, StoredImage, release_claim, save_image
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """
+    Counts the trending tags, runs the upload reaper and garbage collector,
+    stops the image worker processes on shutdown
+    """
+    with Session(engine) as db:
+        warm_trending(db)
+    tasks = [
+        asyncio.create_task(reap_releases()),
+        asyncio.create_task(collect_periodically()),
+    ]
+    yield
+    for task in tasks:
+        task.cancel()
+    shutdown_pool()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 
 app.add_middleware(
@@ -28,11 +81,31 @@ app.add_middleware(
 
 create_db_and_tables()
 
-UPLOAD_FOLDER = Path("uploads")
+
+async def store_image(image: UploadFile, response: Response) -> str:
+    """
+    Validates, normalizes and saves an uploaded image, returns its file name
+
+    The bytes normalization saved are reported in the X-Image-Bytes-Saved
+    header. The image is claimed until release_claim is called after the
+    commit.
+    """
+    if not image.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="Uploaded file is not an image.")
+    try:
+        stored: StoredImage = await save_image(
+            image, normalize=normalize_upload if NORMALIZE else None
+        )
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e)) from e
+    response.headers["X-Image-Bytes-Saved"] = str(stored.original_size - stored.size)
+    return stored.filename
 
 
 @app.post("/tweets/", response_model=Tweet)
 async def create_tweet(
+    background_tasks: BackgroundTasks,
+    response: Response,
     text: str = Form(...),
     image: Optional[UploadFile] = None,
     db: Session = Depends(get_db),
@@ -40,46 +113,96 @@ async def create_tweet(
     """
     API to create a new tweet with an optional image.
     """
-    if image and not image.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="Uploaded file is not an image.")
-
-    image_filename = save_image_locally(image) if image else None
-    tweet = Tweet(text=text, image_filename=image_filename)
-    db.add(tweet)
-    db.commit()
-    db.refresh(tweet)
+    image_filename = await store_image(image, response) if image else None
+    if image_filename:
+        background_tasks.add_task(generate_variants, image_filename)
+    try:
+        tweet = Tweet(text=text, image_filename=image_filename)
+        db.add(tweet)
+        db.flush()
+        tags = set_tweet_tags(db, tweet)
+        db.commit()
+        db.refresh(tweet)
+    finally:
+        if image_filename:
+            await release_claim(image_filename)
+    invalidate_timeline()
+    trending.add(tags)
 
     return tweet
 
 
-@app.get("/tweets/", response_model=List[Tweet])
+@app.get("/tweets/", response_model=List[TweetRead])
 async def get_tweets(db: Session = Depends(get_db)):
     """
     API to fetch all tweets.
     """
-    tweets = db.exec(select(Tweet)).all()
+    return db.exec(select(Tweet)).all()
+
+
+@app.get("/tweets/timeline", response_model=TweetPage)
+async def get_timeline(
+    limit: int = Query(default=PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    API to fetch tweets newest first, a page at a time.
 
-    # Add full URL to image filenames if they exist
-    for tweet in tweets:
-        if tweet.image_filename:
-            tweet.image_filename = f"/uploads/{tweet.image_filename}"
-    return tweets
+    Pass the `next_cursor` of a page as `cursor` to get the next one; it is
+    null on the last page.
+    """
+    return read_timeline(db, limit, cursor)
+
+
+@app.get("/tweets/tag/{tag}", response_model=TweetPage)
+async def get_tagged_tweets(
+    tag: str,
+    limit: int = Query(default=PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    API to fetch the tweets using a hashtag or mention, newest first.
+
+    A bare tag is a hashtag, start it with "@" for a mention. Pages work like
+    the timeline's.
+    """
+    return read_tagged(db, tag, limit, cursor)
+
+
+@app.get("/trending", response_model=List[TrendingTag])
+async def get_trending(limit: int = Query(default=10, ge=1, le=PAGE_SIZE_MAX)):
+    """
+    API to fetch the most used tags of the last hour.
+    """
+    return read_trending(limit)
+
+
+@app.get("/metrics/uploads")
+async def get_upload_metrics():
+    """
+    API to fetch the totals of upload normalization, including bytes saved.
+    """
+    return normalization_stats.as_dict()
 
 
 @app.get("/uploads/{filename}")
-async def get_image(filename: str):
+async def get_image(request: Request, filename: str, size: Optional[ImageSize] = None):
     """
-    Serve uploaded images.
+    Serve uploaded images, resized when a size is given.
+
+    Images are cached by browsers for good and support conditional and Range
+    requests.
     """
-    file_path = UPLOAD_FOLDER / filename
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="Image not found")
-    return FileResponse(file_path)
+    return await image_response(request, filename, size)
 
 
 @app.put("/tweets/{tweet_id}", response_model=Tweet)
 async def update_tweet(
     tweet_id: int,
+    background_tasks: BackgroundTasks,
+    response: Response,
     text: Optional[str] = Form(None),
     image: Optional[UploadFile] = None,
     db: Session = Depends(get_db),
@@ -91,29 +214,35 @@ async def update_tweet(
     if not tweet:
         raise HTTPException(status_code=404, detail="Tweet not found")
 
-    # Update text if provided
-    if text is not None:
-        tweet.text = text
-
     # Update image if provided
+    old_image_filename = new_image_filename = None
     if image:
-        if not image.content_type.startswith("image/"):
-            raise HTTPException(
-                status_code=400, detail="Uploaded file is not an image."
-            )
+        # Save the new image first so a failed upload keeps the old one
+        new_image_filename = await store_image(image, response)
+        background_tasks.add_task(generate_variants, new_image_filename)
+        old_image_filename = tweet.image_filename
+        tweet.image_filename = new_image_filename
 
-        # Delete the old image if it exists
-        if tweet.image_filename:
-            old_image_path = UPLOAD_FOLDER / tweet.image_filename
-            if old_image_path.exists():
-                old_image_path.unlink()
+    # Update text and its tags if provided, after the upload so the write
+    # transaction isn't held open while the image is saved
+    tags = set()
+    if text is not None:
+        tweet.text = text
+        tags = set_tweet_tags(db, tweet)
 
-        # Save the new image
-        tweet.image_filename = save_image_locally(image)
+    try:
+        db.add(tweet)
+        db.commit()
+        db.refresh(tweet)
+    finally:
+        if new_image_filename:
+            await release_claim(new_image_filename)
+    invalidate_timeline()
+    trending.add(tags)
 
-    db.add(tweet)
-    db.commit()
-    db.refresh(tweet)
+    # The old image is deleted in the background if no other tweet uses it
+    if old_image_filename and old_image_filename != new_image_filename:
+        release_image(old_image_filename)
     return tweet
 
 
@@ -126,12 +255,13 @@ async def delete_tweet(tweet_id: int, db: Session = Depends(get_db)):
     if not tweet:
         raise HTTPException(status_code=404, detail="Tweet not found")
 
-    # Delete the associated image if it exists
-    if tweet.image_filename:
-        image_path = UPLOAD_FOLDER / tweet.image_filename
-        if image_path.exists():
-            image_path.unlink()
-
+    image_filename = tweet.image_filename
+    delete_tweet_tags(db, tweet_id)
     db.delete(tweet)
     db.commit()
+    invalidate_timeline()
+
+    # The associated image is deleted in the background if no other tweet uses it
+    if image_filename:
+        release_image(image_filename)
     return {"detail": "Tweet deleted successfully"}
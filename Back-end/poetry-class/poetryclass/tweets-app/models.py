@@ -1,8 +1,56 @@
+from datetime import datetime, timezone
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 from typing import Optional
+from pydantic import computed_field, field_serializer
+
+from images import variant_urls
 
 
 class Tweet(SQLModel, table=True):
+    # Timeline pages are read newest first along this index
+    __table_args__ = (Index("ix_tweet_created_at_id", "created_at", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     text: str
+    image_filename: Optional[str] = Field(default=None, index=True)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class TweetRead(SQLModel):
+    id: int
+    text: str
+    created_at: datetime
     image_filename: Optional[str] = None
+
+    @field_serializer("image_filename")
+    def image_url(self, image_filename: Optional[str]) -> Optional[str]:
+        """
+        Full URL of the image
+        """
+        return f"/uploads/{image_filename}" if image_filename else None
+
+    @computed_field
+    @property
+    def image_variants(self) -> Optional[dict[str, str]]:
+        """
+        URLs of the resized variants of the image
+        """
+        return variant_urls(self.image_filename) if self.image_filename else None
+
+
+class TweetPage(SQLModel):
+    items: list[TweetRead]
+    next_cursor: Optional[str] = None
+
+
+class TweetTag(SQLModel, table=True):
+    # A hashtag ("#python") or mention ("@sarmad") used in a tweet. The
+    # primary key (tag, tweet_id) is the index tag pages are read from
+    tag: str = Field(primary_key=True)
+    tweet_id: int = Field(foreign_key="tweet.id", primary_key=True, index=True)
+
+
+class TrendingTag(SQLModel):
+    tag: str
+    count: int
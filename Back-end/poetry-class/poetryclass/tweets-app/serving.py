@@ -0,0 +1,129 @@
+"""
+Tweets app HTTP caching of served uploads
+
+An upload is named after the hash of its content, so its bytes never change:
+browsers may keep it forever, and its ETag is derived from the name without
+touching the disk. A revalidation with If-None-Match is answered 304 before
+any filesystem access; other requests cost a single `stat`, whose result is
+handed to FileResponse. FileResponse serves Range requests and uses zero-copy
+sendfile (`http.response.pathsend`) on servers that offer it.
+"""
+
+import os
+import re
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse
+
+from images import ImageSize, ensure_variant, variant_path
+from utils import image_path
+
+# Content-addressed upload names, anything else is answered 404 unchecked
+IMAGE_NAME = re.compile(r"[0-9a-f]{64}\.[a-z0-9]{1,5}")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def image_etag(filename: str, size: Optional[ImageSize]) -> str:
+    """
+    Strong ETag of an upload or one of its variants
+    """
+    stem = filename.split(".", 1)[0]
+    return f'"{stem}-{size.value}"' if size else f'"{stem}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches the ETag
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so ignore W/ prefixes
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag in candidates
+
+
+def modified_since(if_modified_since: Optional[str], mtime: float) -> bool:
+    """
+    Whether the file changed after the If-Modified-Since date
+    """
+    if not if_modified_since:
+        return True
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return True
+    # HTTP dates have a one second resolution
+    return int(mtime) > since
+
+
+def not_modified(headers: dict[str, str]) -> Response:
+    """
+    Empty 304 response carrying the caching headers
+    """
+    return Response(status_code=304, headers=headers)
+
+
+async def stat_image(
+    filename: str, size: Optional[ImageSize]
+) -> tuple[str, os.stat_result]:
+    """
+    Path and stat of the file to serve for an upload
+
+    The original is checked first, so a request for an upload that doesn't
+    exist never renders anything. A missing variant is rendered first; the
+    original is served when it can't be resized.
+
+    Raises:
+        HTTPException: 404 when the upload doesn't exist
+    """
+    original = image_path(filename)
+    try:
+        original_stat = os.stat(original)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail="Image not found") from e
+
+    if size:
+        path = str(variant_path(filename, size))
+        try:
+            return path, os.stat(path)
+        except FileNotFoundError:
+            pass
+        try:
+            path = str(await ensure_variant(filename, size))
+            return path, os.stat(path)
+        except OSError:
+            # Not an image Pillow can resize, or deleted since, serve the original
+            pass
+
+    return original, original_stat
+
+
+async def image_response(
+    request: Request, filename: str, size: Optional[ImageSize]
+) -> Response:
+    """
+    An upload or its variant with caching headers, or 304
+    """
+    if not IMAGE_NAME.fullmatch(filename):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    headers = {
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "ETag": image_etag(filename, size),
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if etag_matches(if_none_match, headers["ETag"]):
+        return not_modified(headers)
+
+    path, stat_result = await stat_image(filename, size)
+    # If-Modified-Since only counts when the client sent no ETag
+    if if_none_match is None and not modified_since(
+        request.headers.get("if-modified-since"), stat_result.st_mtime
+    ):
+        return not_modified(headers)
+    return FileResponse(path, headers=headers, stat_result=stat_result)
@@ -0,0 +1,333 @@
+"""
+Tweets app upload reference counting, reaper and garbage collector
+
+An upload is referenced by every tweet whose `image_filename` names it.
+Requests don't delete files themselves: they hand the images a tweet stopped
+using to the reaper, which deletes the ones still unreferenced in the
+background. A periodic garbage collector walks the uploads folder and deletes
+the files no tweet references, such as those left behind by a crash between
+saving an upload and committing its tweet.
+
+Maintenance commands:
+    python storage.py migrate   # move uploads to their hash name and shard
+    python storage.py gc        # delete orphaned uploads now
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session, select
+
+from database import create_db_and_tables, engine
+from images import VARIANT_FOLDER, remove_variants
+from models import Tweet
+from utils import (
+    UPLOAD_FOLDER,
+    claims_lock,
+    file_extension,
+    file_sha256,
+    image_path,
+    is_claimed,
+)
+
+logger = logging.getLogger(__name__)
+
+# Released images the reaper checks with one query
+RELEASE_BATCH_SIZE = int(os.getenv("TWEETS_RELEASE_BATCH_SIZE", "100"))
+
+# Seconds between garbage collections of the uploads folder
+GC_INTERVAL = float(os.getenv("TWEETS_GC_INTERVAL", "3600"))
+
+# Files the garbage collector checks with one query
+GC_BATCH_SIZE = int(os.getenv("TWEETS_GC_BATCH_SIZE", "500"))
+
+# Seconds a file is left alone after it was written, so the garbage collector
+# never races an upload whose tweet is being committed
+GC_GRACE = float(os.getenv("TWEETS_GC_GRACE", "3600"))
+
+# Images a tweet stopped using, waiting for the reaper while it runs
+_releases: asyncio.Queue[str] | None = None
+
+
+def referenced_images(db: Session, filenames: Iterable[str]) -> set[str]:
+    """
+    The uploads among `filenames` that some tweet uses
+    """
+    return set(
+        db.exec(
+            select(Tweet.image_filename)
+            .where(Tweet.image_filename.in_(list(filenames)))
+            .distinct()
+        ).all()
+    )
+
+
+def delete_unreferenced(filenames: Iterable[str]) -> tuple[int, int]:
+    """
+    Deletes the uploads, and their variants, that no tweet or pending request
+    uses
+
+    Returns the number of files deleted and the bytes freed.
+    """
+    filenames = set(filenames)
+    deleted = freed = 0
+    with Session(engine) as db, claims_lock:
+        # Checked under the lock so no request claims a file in between
+        for filename in filenames - referenced_images(db, filenames):
+            if is_claimed(filename):
+                continue
+            path = image_path(filename)
+            try:
+                size = os.stat(path).st_size
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            else:
+                deleted += 1
+                freed += size
+            remove_variants(filename)
+    return deleted, freed
+
+
+def release_image(filename: str) -> None:
+    """
+    Hands an image a tweet stopped using to the reaper
+
+    Call it after committing the change that dropped the reference. Without
+    a running reaper the image is left to the garbage collector.
+    """
+    if _releases is not None:
+        _releases.put_nowait(filename)
+
+
+async def reap_releases() -> None:
+    """
+    Deletes released images no tweet uses anymore, until cancelled
+
+    Images still queued on shutdown are left to the garbage collector.
+    """
+    global _releases
+    releases = _releases = asyncio.Queue()
+    try:
+        while True:
+            batch = [await releases.get()]
+            while len(batch) < RELEASE_BATCH_SIZE and not releases.empty():
+                batch.append(releases.get_nowait())
+            try:
+                await run_in_threadpool(delete_unreferenced, batch)
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception("Deleting released images failed")
+    finally:
+        _releases = None
+
+
+def iter_shards(folder: str) -> Iterator[str]:
+    """
+    Paths of the two-level shard folders under `folder`
+    """
+    if not os.path.isdir(folder):
+        return
+    for first in os.scandir(folder):
+        if first.is_dir() and len(first.name) == 2:
+            for second in os.scandir(first.path):
+                if second.is_dir() and len(second.name) == 2:
+                    yield second.path
+
+
+def remove_stale_temp_files(folder: str, prefix: str, cutoff: float) -> int:
+    """
+    Deletes temporary files of interrupted writes older than `cutoff`
+    """
+    removed = 0
+    for entry in os.scandir(folder):
+        if entry.name.startswith(prefix) and entry.stat().st_mtime < cutoff:
+            Path(entry.path).unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+
+def collect_garbage(
+    grace: float = GC_GRACE, batch_size: int = GC_BATCH_SIZE
+) -> dict[str, int]:
+    """
+    Deletes the uploads and variants no tweet references
+
+    Files written less than `grace` seconds ago are skipped. Uploads are
+    checked against the tweet table `batch_size` at a time, so memory use
+    doesn't grow with the number of files.
+    """
+    cutoff = time.time() - grace
+    report = {"scanned": 0, "deleted": 0, "bytes_freed": 0, "temp_files": 0}
+    if not os.path.isdir(UPLOAD_FOLDER):
+        return report
+
+    def delete_batch(batch: list[str]) -> None:
+        deleted, freed = delete_unreferenced(batch)
+        report["deleted"] += deleted
+        report["bytes_freed"] += freed
+        batch.clear()
+
+    batch: list[str] = []
+    for shard in iter_shards(UPLOAD_FOLDER):
+        for entry in os.scandir(shard):
+            if not entry.is_file():
+                continue
+            report["scanned"] += 1
+            if entry.stat().st_mtime < cutoff:
+                batch.append(entry.name)
+            if len(batch) >= batch_size:
+                delete_batch(batch)
+    if batch:
+        delete_batch(batch)
+
+    report["temp_files"] += remove_stale_temp_files(UPLOAD_FOLDER, ".upload-", cutoff)
+
+    # Variants whose original is gone, e.g. rendered while it was deleted
+    for shard in iter_shards(str(VARIANT_FOLDER)):
+        upload_shard = os.path.join(
+            UPLOAD_FOLDER, os.path.relpath(shard, VARIANT_FOLDER)
+        )
+        stems = (
+            {name.split(".", 1)[0] for name in os.listdir(upload_shard)}
+            if os.path.isdir(upload_shard)
+            else set()
+        )
+        report["temp_files"] += remove_stale_temp_files(shard, ".variant-", cutoff)
+        for entry in os.scandir(shard):
+            if (
+                entry.is_file()
+                and not entry.name.startswith(".")
+                and entry.name.split(".", 1)[0] not in stems
+                and entry.stat().st_mtime < cutoff
+            ):
+                report["bytes_freed"] += entry.stat().st_size
+                Path(entry.path).unlink(missing_ok=True)
+    return report
+
+
+async def collect_periodically() -> None:
+    """
+    Runs collect_garbage every GC_INTERVAL seconds until cancelled
+    """
+    while True:
+        await asyncio.sleep(GC_INTERVAL)
+        try:
+            await run_in_threadpool(collect_garbage)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Upload garbage collection failed")
+
+
+def disk_usage(paths: set[Path]) -> int:
+    """
+    Bytes used by the files, counting hard links once
+    """
+    inodes = {}
+    for path in paths:
+        if path.exists():
+            stat = path.stat()
+            inodes[(stat.st_dev, stat.st_ino)] = stat.st_size
+    return sum(inodes.values())
+
+
+def migrate_uploads(db: Session) -> dict[str, int]:
+    """
+    Moves referenced uploads to their content hash name in their shard folder,
+    merging duplicates
+
+    New paths are linked next to the old ones before the tweets are updated,
+    and the old paths unlinked after the commit, so an interrupted migration
+    leaves every tweet pointing at an existing file and can be run again.
+    """
+    tweets = db.exec(select(Tweet).where(Tweet.image_filename.is_not(None))).all()
+    moves: list[tuple[Tweet, Path, Path]] = []
+    missing = 0
+    for tweet in tweets:
+        old_path = Path(UPLOAD_FOLDER) / tweet.image_filename
+        if not old_path.is_file():
+            old_path = Path(image_path(tweet.image_filename))
+        if not old_path.is_file():
+            missing += 1
+            continue
+        extension = file_extension(tweet.image_filename)
+        new_name = f"{file_sha256(str(old_path))}.{extension}"
+        moves.append((tweet, old_path, Path(image_path(new_name))))
+
+    old_paths = {old_path for _, old_path, _ in moves}
+    new_paths = {new_path for _, _, new_path in moves}
+    before = disk_usage(old_paths | new_paths)
+
+    moved = 0
+    for tweet, old_path, new_path in moves:
+        if new_path == old_path:
+            continue
+        if not new_path.exists():
+            new_path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(old_path, new_path)
+            except OSError:
+                # No hard links on this filesystem, copy instead
+                new_path.write_bytes(old_path.read_bytes())
+        tweet.image_filename = new_path.name
+        db.add(tweet)
+        moved += 1
+    db.commit()
+
+    for old_path in old_paths - new_paths:
+        old_path.unlink(missing_ok=True)
+        remove_variants(old_path.name)
+    # Variants from before sharding, rendered again on request
+    if VARIANT_FOLDER.is_dir():
+        for entry in os.scandir(VARIANT_FOLDER):
+            if entry.is_file():
+                os.unlink(entry.path)
+    after = disk_usage(new_paths)
+
+    return {
+        "tweets": len(tweets),
+        "moved": moved,
+        "missing": missing,
+        "files_before": len(old_paths),
+        "files_after": len(new_paths),
+        "bytes_before": before,
+        "bytes_after": after,
+        "bytes_reclaimed": before - after,
+    }
+
+
+def main() -> None:
+    """
+    Upload storage command line
+    """
+    parser = argparse.ArgumentParser(description="Tweet upload storage")
+    parser.add_argument("command", choices=["migrate", "gc"])
+    parser.add_argument("--grace", type=float, default=GC_GRACE)
+    args = parser.parse_args()
+
+    create_db_and_tables()
+    if args.command == "gc":
+        report = collect_garbage(args.grace)
+        print(
+            f"Scanned {report['scanned']} uploads, deleted {report['deleted']} "
+            f"and {report['temp_files']} temporary files"
+        )
+        print(f"Freed {report['bytes_freed']} bytes")
+        return
+
+    with Session(engine) as db:
+        report = migrate_uploads(db)
+    print(
+        f"Migrated {report['moved']} of {report['tweets']} tweet images "
+        f"({report['missing']} missing)"
+    )
+    print(f"Files: {report['files_before']} -> {report['files_after']}")
+    print(f"Reclaimed {report['bytes_reclaimed']} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Tweets app hashtag and mention index with trending counts
+
+The hashtags and mentions of a tweet are parsed when it is written and kept in
+the `tweettag` side table, so the tweets using a tag are read from an index
+instead of scanning every text. Trending tags are counted in memory in
+per-minute buckets over a sliding window; the counts are warmed from the
+database on startup and no request runs a GROUP BY. They count uses, so
+editing or deleting a tweet doesn't take back the uses already counted.
+
+Index the tweets of a database made before tags existed with:
+    python tags.py rebuild
+"""
+
+import argparse
+import os
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from sqlalchemy import delete
+from sqlmodel import Session, select
+
+from database import create_db_and_tables, engine
+from models import TrendingTag, Tweet, TweetPage, TweetRead, TweetTag
+
+# Minutes of tag uses the trending counts cover
+TRENDING_WINDOW = int(os.getenv("TWEETS_TRENDING_WINDOW", "60"))
+
+# A # or @ not preceded by a word character, e.g. not in an email address
+TAG_PATTERN = re.compile(r"(?<![\w#@])([#@])(\w{1,50})")
+
+
+def parse_tags(text: str) -> set[str]:
+    """
+    Lowercased hashtags and mentions of a text, with their # or @
+    """
+    return {sigil + word.lower() for sigil, word in TAG_PATTERN.findall(text)}
+
+
+def normalize_tag(tag: str) -> str:
+    """
+    A tag from a URL, where a bare word is a hashtag
+    """
+    tag = tag.lower()
+    return tag if tag[:1] in ("#", "@") else f"#{tag}"
+
+
+class TrendingCounter:
+    """
+    Tag use counts over the last `window` minutes
+
+    Uses are added to the bucket of their minute. A running total is kept
+    next to the buckets, so reading the top tags never sums them, and a
+    bucket is subtracted from it once it falls out of the window.
+    """
+
+    def __init__(self, window: int) -> None:
+        self.window = window
+        self._buckets: dict[int, Counter[str]] = {}
+        self._totals: Counter[str] = Counter()
+        self._lock = threading.Lock()
+
+    def _expire(self) -> int:
+        """
+        Drops the buckets that left the window, returns the oldest minute kept
+        """
+        oldest = int(time.time() // 60) - self.window + 1
+        for minute in [minute for minute in self._buckets if minute < oldest]:
+            bucket = self._buckets.pop(minute)
+            self._totals.subtract(bucket)
+            for tag in bucket:
+                if self._totals[tag] <= 0:
+                    del self._totals[tag]
+        return oldest
+
+    def add(self, tags: set[str], at: float | None = None) -> None:
+        """
+        Counts one use of each tag at the `at` timestamp, now by default
+        """
+        minute = int((time.time() if at is None else at) // 60)
+        with self._lock:
+            if not tags or minute < self._expire():
+                return
+            self._buckets.setdefault(minute, Counter()).update(tags)
+            self._totals.update(tags)
+
+    def top(self, limit: int) -> list[tuple[str, int]]:
+        """
+        The most used tags of the window with their counts
+        """
+        with self._lock:
+            self._expire()
+            return self._totals.most_common(limit)
+
+    def clear(self) -> None:
+        """
+        Drops every count
+        """
+        with self._lock:
+            self._buckets.clear()
+            self._totals.clear()
+
+
+trending = TrendingCounter(TRENDING_WINDOW)
+
+
+def set_tweet_tags(db: Session, tweet: Tweet) -> set[str]:
+    """
+    Replaces the indexed tags of a flushed tweet, returns the new ones
+
+    The caller commits.
+    """
+    tags = parse_tags(tweet.text)
+    current = set(
+        db.exec(select(TweetTag.tag).where(TweetTag.tweet_id == tweet.id)).all()
+    )
+    if current - tags:
+        db.execute(
+            delete(TweetTag).where(
+                TweetTag.tweet_id == tweet.id, TweetTag.tag.in_(current - tags)
+            )
+        )
+    db.add_all(TweetTag(tag=tag, tweet_id=tweet.id) for tag in tags - current)
+    return tags - current
+
+
+def delete_tweet_tags(db: Session, tweet_id: int) -> None:
+    """
+    Removes the indexed tags of a tweet, the caller commits
+    """
+    db.execute(delete(TweetTag).where(TweetTag.tweet_id == tweet_id))
+
+
+def read_tagged(
+    db: Session, tag: str, limit: int, cursor: str | None = None
+) -> TweetPage:
+    """
+    A page of the tweets using a tag, newest first
+    """
+    statement = (
+        select(Tweet)
+        .join(TweetTag, TweetTag.tweet_id == Tweet.id)
+        .where(TweetTag.tag == normalize_tag(tag))
+        .order_by(TweetTag.tweet_id.desc())
+    )
+    if cursor is not None:
+        if not cursor.isdigit():
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        statement = statement.where(TweetTag.tweet_id < int(cursor))
+    # One extra row tells whether there is a next page
+    tweets = db.exec(statement.limit(limit + 1)).all()
+
+    return TweetPage(
+        items=[TweetRead.model_validate(tweet) for tweet in tweets[:limit]],
+        next_cursor=str(tweets[limit - 1].id) if len(tweets) > limit else None,
+    )
+
+
+def read_trending(limit: int) -> list[TrendingTag]:
+    """
+    The most used tags of the trending window
+    """
+    return [TrendingTag(tag=tag, count=count) for tag, count in trending.top(limit)]
+
+
+def warm_trending(db: Session) -> None:
+    """
+    Counts the tags of the tweets created within the trending window
+    """
+    since = datetime.now(timezone.utc) - timedelta(minutes=TRENDING_WINDOW)
+    rows = db.exec(
+        select(TweetTag.tag, Tweet.created_at)
+        .join(Tweet, Tweet.id == TweetTag.tweet_id)
+        .where(Tweet.created_at >= since)
+    ).all()
+    trending.clear()
+    for tag, created_at in rows:
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        trending.add({tag}, created_at.timestamp())
+
+
+def rebuild_tags(db: Session) -> int:
+    """
+    Indexes the tags of every tweet, returns how many tweets have tags
+    """
+    db.execute(delete(TweetTag))
+    tagged = 0
+    for tweet in db.exec(select(Tweet)):
+        tags = parse_tags(tweet.text)
+        db.add_all(TweetTag(tag=tag, tweet_id=tweet.id) for tag in tags)
+        tagged += bool(tags)
+    db.commit()
+    return tagged
+
+
+def main() -> None:
+    """
+    Tag index command line
+    """
+    parser = argparse.ArgumentParser(description="Tweet hashtag and mention index")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+
+    create_db_and_tables()
+    with Session(engine) as db:
+        tagged = rebuild_tags(db)
+    print(f"Indexed the tags of {tagged} tweets")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Tweets app reverse-chronological timeline
+
+Pages are read along the (created_at, id) index with a keyset cursor, so a
+page costs the same however deep the client has scrolled. The first page,
+which nearly every client asks for, is kept in memory until a tweet is
+created, updated or deleted.
+"""
+
+import base64
+import binascii
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+from sqlmodel import Session, select
+
+from models import Tweet, TweetPage, TweetRead
+
+PAGE_SIZE_DEFAULT = 20
+PAGE_SIZE_MAX = 100
+
+# First timeline page by page size
+_first_pages: dict[int, TweetPage] = {}
+
+
+def encode_cursor(tweet: Tweet) -> str:
+    """
+    Opaque cursor pointing after `tweet`
+    """
+    key = f"{tweet.created_at.isoformat()}|{tweet.id}"
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    The (created_at, id) a cursor points after
+
+    Raises:
+        HTTPException: 400 for a cursor this app didn't make
+    """
+    try:
+        created_at, _, tweet_id = (
+            base64.urlsafe_b64decode(cursor.encode()).decode().partition("|")
+        )
+        return datetime.fromisoformat(created_at), int(tweet_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from e
+
+
+def read_timeline(db: Session, limit: int, cursor: str | None = None) -> TweetPage:
+    """
+    A page of tweets, newest first
+    """
+    if cursor is None and limit in _first_pages:
+        return _first_pages[limit]
+
+    statement = select(Tweet).order_by(Tweet.created_at.desc(), Tweet.id.desc())
+    if cursor is not None:
+        statement = statement.where(
+            tuple_(Tweet.created_at, Tweet.id) < decode_cursor(cursor)
+        )
+    # One extra row tells whether there is a next page
+    tweets = db.exec(statement.limit(limit + 1)).all()
+
+    page = TweetPage(
+        items=[TweetRead.model_validate(tweet) for tweet in tweets[:limit]],
+        next_cursor=encode_cursor(tweets[limit - 1]) if len(tweets) > limit else None,
+    )
+    if cursor is None:
+        _first_pages[limit] = page
+    return page
+
+
+def invalidate_timeline() -> None:
+    """
+    Drops the cached first pages, call it after every tweet write
+    """
+    _first_pages.clear()
@@ -1,21 +1,243 @@
+"""
+Tweets app upload storage
+
+Uploads are content addressed: a file is named after the sha256 of its bytes,
+so posting the same image again reuses the stored file. Tweets reference it
+through `Tweet.image_filename` and `storage.release_image` deletes it when the
+last reference goes away.
+
+Files are spread over two levels of directories named after the first
+characters of the hash (`uploads/ab/cd/abcd....png`), so no directory grows
+past a few entries even with millions of uploads.
+
+An upload is first written to a temporary file in the uploads folder. It can
+be replaced by a normalized copy (see images.normalize_upload) before it is
+moved to its content-addressed name.
+"""
+
+import hashlib
 import os
-from uuid import uuid4
+import tempfile
+import threading
+from collections import Counter
+from typing import Awaitable, BinaryIO, Callable, NamedTuple, Optional
+
 from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
 
 UPLOAD_FOLDER = "uploads"
 
+# Bytes read and written at a time while saving an upload
+CHUNK_SIZE = 1024 * 1024
 
-def save_image_locally(image: UploadFile) -> str:
+# Largest image accepted, in bytes
+MAX_IMAGE_SIZE = int(os.getenv("TWEETS_MAX_IMAGE_SIZE", str(20 * 1024 * 1024)))
+
+# Saved images whose tweet is not committed yet, kept safe from release_image
+_claims: Counter[str] = Counter()
+
+# Held while claiming a stored file and while deleting one, so a duplicate
+# upload never claims a file the reaper is about to remove. The reaper holds
+# it across a database query, so it is only ever taken in worker threads,
+# never on the event loop
+claims_lock = threading.Lock()
+
+
+class ImageTooLarge(Exception):
     """
-    Saves the uploaded image locally and returns the file name.
+    Raised when an upload goes over the size limit while it is being saved
     """
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)  # Ensure the uploads folder exists
 
-    file_extension = image.filename.split(".")[-1]
-    filename = f"{uuid4().hex}.{file_extension}"
-    file_path = os.path.join(UPLOAD_FOLDER, filename)
 
-    with open(file_path, "wb") as f:  # wb (Write Binary)
-        f.write(image.file.read())
+class SpooledFile(NamedTuple):
+    """
+    A complete file waiting in a temporary path of the uploads folder
+    """
+
+    path: str
+    sha256: str
+    size: int
+    extension: str
+
+
+class StoredImage(NamedTuple):
+    """
+    An image saved in the upload folder
+    """
+
+    filename: str
+    sha256: str
+    size: int
+    duplicate: bool
+    # Size of the upload as received, before any normalization
+    original_size: int
+
+
+def file_extension(filename: str | None) -> str:
+    """
+    Returns a safe lowercase extension for the uploaded file name
+    """
+    extension = (filename or "").rsplit(".", 1)[-1].lower()
+    if extension.isalnum() and len(extension) <= 5:
+        return extension
+    return "bin"
+
+
+def shard_folder(filename: str) -> str:
+    """
+    Folder of an upload relative to the uploads folder, e.g. "ab/cd"
+    """
+    return os.path.join(filename[:2], filename[2:4])
+
+
+def image_path(filename: str) -> str:
+    """
+    Path of an upload in the sharded uploads folder
+    """
+    return os.path.join(UPLOAD_FOLDER, shard_folder(filename), filename)
+
+
+def temp_file() -> tuple[int, str]:
+    """
+    Opens a new temporary file in the uploads folder
+    """
+    return tempfile.mkstemp(dir=UPLOAD_FOLDER, prefix=".upload-", suffix=".tmp")
+
+
+def spool_to_disk(source: BinaryIO, extension: str, max_size: int) -> SpooledFile:
+    """
+    Copies `source` to a temporary file in chunks, hashing it on the way
+
+    Nothing is left behind when the copy fails or goes over `max_size`.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = temp_file()
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:  # wb (Write Binary)
+            while chunk := source.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise ImageTooLarge(f"Image is larger than {max_size} bytes")
+                digest.update(chunk)
+                tmp_file.write(chunk)
+    except BaseException:
+        remove_temp_file(tmp_path)
+        raise
+    return SpooledFile(tmp_path, digest.hexdigest(), size, extension)
+
+
+def store_spooled(spooled: SpooledFile) -> tuple[str, bool]:
+    """
+    Moves a spooled file to its content-addressed path
+
+    The file is synced to disk and renamed into place, so a stored upload is
+    never partial. When a file with the same content is already stored the
+    spooled one is dropped and the stored one reused. Returns the file name
+    and whether it was a duplicate.
+    """
+    filename = f"{spooled.sha256}.{spooled.extension}"
+    path = image_path(filename)
+    if os.path.exists(path):
+        os.unlink(spooled.path)
+        return filename, True
+    with open(spooled.path, "r+b") as file:
+        os.fsync(file.fileno())
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(spooled.path, path)
+    return filename, False
+
+
+def remove_temp_file(path: str) -> None:
+    """
+    Deletes a temporary file if it is still there
+    """
+    if os.path.exists(path):
+        os.unlink(path)
+
+
+def file_sha256(path: str) -> str:
+    """
+    sha256 of a stored file, read in chunks
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def claim_stored(filename: str) -> bool:
+    """
+    Claims a stored file, False if it was deleted in the meantime
+
+    Waits for claims_lock, run it in a worker thread.
+    """
+    with claims_lock:
+        if not os.path.exists(image_path(filename)):
+            return False
+        _claims[filename] += 1
+        return True
+
+
+def drop_claim(filename: str) -> None:
+    """
+    Drops a claim, waiting for claims_lock
+    """
+    with claims_lock:
+        _claims[filename] -= 1
+        if _claims[filename] <= 0:
+            del _claims[filename]
+
+
+async def release_claim(filename: str) -> None:
+    """
+    Drops a claim taken by save_image, without blocking the event loop
+    """
+    await run_in_threadpool(drop_claim, filename)
+
+
+def is_claimed(filename: str) -> bool:
+    """
+    Whether a request has saved the image but not committed its tweet yet
+
+    Call it holding claims_lock when deleting based on the answer.
+    """
+    return _claims[filename] > 0
+
+
+async def save_image(
+    image: UploadFile,
+    max_size: int = MAX_IMAGE_SIZE,
+    normalize: Optional[Callable[[SpooledFile], Awaitable[SpooledFile]]] = None,
+) -> StoredImage:
+    """
+    Saves the uploaded image locally without blocking the event loop
+
+    `normalize` may replace the spooled upload with a new spooled file before
+    it is stored. The image is claimed for the caller, which calls
+    release_claim once the tweet referencing it is committed (or not).
+
+    Raises:
+        ImageTooLarge: The image is bigger than `max_size` bytes
+    """
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)  # Ensure the uploads folder exists
+    extension = file_extension(image.filename)
+
+    while True:
+        await image.seek(0)
+        upload = await run_in_threadpool(spool_to_disk, image.file, extension, max_size)
+        spooled = upload
+        try:
+            if normalize is not None:
+                spooled = await normalize(upload)
+            filename, duplicate = await run_in_threadpool(store_spooled, spooled)
+        finally:
+            remove_temp_file(upload.path)
+            remove_temp_file(spooled.path)
 
-    return filename
+        # A duplicate may have been reaped while the file was stored
+        if await run_in_threadpool(claim_stored, filename):
+            return StoredImage(
+                filename, spooled.sha256, spooled.size, duplicate, upload.size
+            )
@@ -0,0 +1,54 @@
+"""
+Imports the apps under poetryclass/ whose modules import each other by bare
+name (`from database import engine`) into one test session
+
+Several apps have modules with the same names, such as `database` and `main`,
+so only one app's modules may sit in sys.modules at a time. `app_modules`
+puts an app's folder first on sys.path for the tests of a module and takes
+its modules out again afterwards, leaving the next app to import its own.
+Modules are not unloaded while tests run, as the worker processes of the
+tweets app import them by name.
+"""
+
+import importlib
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from types import ModuleType, SimpleNamespace
+from typing import Iterator
+
+APPS_DIR = Path(__file__).parent.parent / "poetryclass"
+
+
+def flat_app_modules() -> dict[str, ModuleType]:
+    """
+    The modules of any app imported by bare name
+    """
+    return {
+        name: module
+        for name, module in sys.modules.items()
+        if "." not in name
+        and getattr(module, "__file__", None)
+        and Path(module.__file__).parent.parent == APPS_DIR
+    }
+
+
+@contextmanager
+def app_modules(app: str, *names: str) -> Iterator[SimpleNamespace]:
+    """
+    Imports modules of the app in `poetryclass/<app>`, e.g.
+    app_modules("tweets-app", "main", "storage") yields a namespace with
+    `main` and `storage`
+    """
+    shadowed = flat_app_modules()
+    for name in shadowed:
+        del sys.modules[name]
+    folder = str(APPS_DIR / app)
+    sys.path.insert(0, folder)
+    try:
+        yield SimpleNamespace(**{name: importlib.import_module(name) for name in names})
+    finally:
+        sys.path.remove(folder)
+        for name in flat_app_modules():
+            del sys.modules[name]
+        sys.modules.update(shadowed)
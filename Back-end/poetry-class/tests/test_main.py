@@ -1,8 +1,29 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
 import pytest
 from fastapi.testclient import TestClient
-from poetryclass.todo_app.main import app, get_session
+import fast_json
+from async_database import get_async_session
+from cache import MISSING, TTLCache
+from feed import todo_feed, todo_feed_websocket
+from poetryclass.todo_app.main import (
+    app,
+    compact_tombstones,
+    create_app,
+    get_session,
+    todo_cache,
+    upgrade_todo_table,
+)
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import SQLModel, Session, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlmodel.pool import StaticPool
+from versioning import TableVersion
 
 # Create a new database session for testing
 DATABASE_URL = "sqlite://"
@@ -10,6 +31,12 @@ engine = create_engine(
     DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool
 )
 
+ASYNC_DATABASE_URL = "sqlite+aiosqlite://"
+
+async_app = create_app("async")
+
+fast_json_app = create_app("sync", fast_json=True)
+
 
 # Dependency override to use the test database
 def get_test_session():
@@ -18,14 +45,40 @@ def get_test_session():
 
 
 app.dependency_overrides[get_session] = get_test_session
+fast_json_app.dependency_overrides[get_session] = get_test_session
 
 
-@pytest.fixture(name="client")
-def client_fixture():
-    SQLModel.metadata.create_all(engine)
-    with TestClient(app) as client:
+@pytest.fixture(name="client", params=["sync", "async"])
+def client_fixture(request):
+    todo_cache.clear()
+    if request.param == "sync":
+        SQLModel.metadata.create_all(engine)
+        with TestClient(app) as client:
+            yield client
+        SQLModel.metadata.drop_all(engine)
+        return
+
+    # The aiosqlite connection is bound to the client's event loop,
+    # so every test gets its own in-memory database
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+
+    async def get_test_async_session():
+        async with AsyncSession(async_engine) as session:
+            yield session
+
+    async def create_tables():
+        async with async_engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+
+    async_app.dependency_overrides[get_async_session] = get_test_async_session
+    with TestClient(async_app) as client:
+        client.portal.call(create_tables)
         yield client
-    SQLModel.metadata.drop_all(engine)
+        client.portal.call(async_engine.dispose)
 
 
 def test_get_todos(client):
@@ -75,3 +128,345 @@ def test_delete_todo(client):
     assert data["completed"] is False
     response = client.get(f"/todo/{todo_id}")
     assert response.status_code == 404
+
+
+def test_read_todos_page(client):
+    for i in range(5):
+        client.post("/new/todo", json={"title": f"Todo {i}", "completed": False})
+    response = client.get("/todos", params={"limit": 2})
+    assert response.status_code == 200
+    data = response.json()
+    assert [todo["title"] for todo in data["items"]] == ["Todo 0", "Todo 1"]
+    assert data["next_cursor"] == data["items"][-1]["id"]
+
+    titles = [todo["title"] for todo in data["items"]]
+    while data["next_cursor"] is not None:
+        data = client.get(
+            "/todos", params={"limit": 2, "after": data["next_cursor"]}
+        ).json()
+        titles += [todo["title"] for todo in data["items"]]
+    assert titles == [f"Todo {i}" for i in range(5)]
+
+
+def test_stream_todos(client):
+    for i in range(3):
+        client.post("/new/todo", json={"title": f"Todo {i}", "completed": False})
+    response = client.get("/todos/stream")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = response.text.splitlines()
+    assert [json.loads(line)["title"] for line in lines] == [
+        "Todo 0",
+        "Todo 1",
+        "Todo 2",
+    ]
+
+
+def test_bulk_todos(client):
+    response = client.post("/new/todo", json={"title": "Old Todo", "completed": False})
+    old_id = response.json()["id"]
+    response = client.post("/new/todo", json={"title": "Gone Todo", "completed": False})
+    gone_id = response.json()["id"]
+
+    response = client.post(
+        "/todos/bulk",
+        json=[
+            {"op": "create", "title": "New Todo"},
+            {"op": "update", "id": old_id, "completed": True},
+            {"op": "delete", "id": gone_id},
+        ],
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["committed"] is True
+    assert all(result["ok"] for result in data["results"])
+    new_id = data["results"][0]["id"]
+
+    assert client.get(f"/todo/{new_id}").json()["title"] == "New Todo"
+    assert client.get(f"/todo/{old_id}").json()["completed"] is True
+    assert client.get(f"/todo/{gone_id}").status_code == 404
+
+
+def test_bulk_todos_atomic_and_partial(client):
+    operations = [
+        {"op": "create", "title": "Kept Todo"},
+        {"op": "delete", "id": 999},
+    ]
+    response = client.post("/todos/bulk", json=operations)
+    assert response.status_code == 400
+    data = response.json()
+    assert data["committed"] is False
+    assert [result["ok"] for result in data["results"]] == [True, False]
+    assert client.get("/todos").json()["items"] == []
+
+    response = client.post("/todos/bulk", params={"atomic": False}, json=operations)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["committed"] is True
+    assert data["results"][1]["error"] == "Todo not found with id 999"
+    assert [todo["title"] for todo in client.get("/todos").json()["items"]] == [
+        "Kept Todo"
+    ]
+
+
+def test_todos_etag(client):
+    client.post("/new/todo", json={"title": "Test Todo", "completed": False})
+    response = client.get("/todos")
+    etag = response.headers["etag"]
+
+    response = client.get("/todos", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+    client.post("/new/todo", json={"title": "Other Todo", "completed": False})
+    response = client.get("/todos", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_todo_row_etag(client):
+    response = client.post("/new/todo", json={"title": "Test Todo", "completed": False})
+    todo_id = response.json()["id"]
+    response = client.get(f"/todo/{todo_id}")
+    etag = response.headers["etag"]
+
+    response = client.get(f"/todo/{todo_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    client.patch(
+        f"/edit/todo/{todo_id}", json={"title": "Test Todo", "completed": True}
+    )
+    response = client.get(f"/todo/{todo_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["completed"] is True
+    assert response.headers["etag"] != etag
+
+
+def test_todo_row_etag_after_id_reuse(client):
+    response = client.post("/new/todo", json={"title": "Gone", "completed": False})
+    todo_id = response.json()["id"]
+    etag = client.get(f"/todo/{todo_id}").headers["etag"]
+    client.delete(f"/delete/todo/{todo_id}")
+
+    # SQLite hands the freed id to the next todo
+    response = client.post("/new/todo", json={"title": "New", "completed": False})
+    assert response.json()["id"] == todo_id
+    response = client.get(f"/todo/{todo_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["title"] == "New"
+
+
+def test_todo_cache(client):
+    response = client.post("/new/todo", json={"title": "Test Todo", "completed": False})
+    todo_id = response.json()["id"]
+    client.get(f"/todo/{todo_id}")
+    response = client.get(f"/todo/{todo_id}")
+    assert response.json()["title"] == "Test Todo"
+    stats = client.get("/todos/cache/stats").json()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+    client.patch(f"/edit/todo/{todo_id}", json={"title": "Updated Todo"})
+    assert client.get(f"/todo/{todo_id}").json()["title"] == "Updated Todo"
+
+    client.delete(f"/delete/todo/{todo_id}")
+    assert client.get(f"/todo/{todo_id}").status_code == 404
+
+
+def test_cache_set_if_version():
+    table_version = TableVersion()
+    cache = TTLCache(maxsize=8, ttl=60, negative_ttl=60, table_version=table_version)
+    version = table_version.version
+    cache.set_if_version(1, "read", version)
+    cache.set_missing_if_version(2, version)
+    assert cache.get(1) == "read"
+    assert cache.get(2) is MISSING
+
+    # Read before a write, stored after it
+    cache.invalidate(1)
+    table_version.bump()
+    cache.set_if_version(1, "stale", version)
+    cache.set_missing_if_version(3, version)
+    assert cache.get(1) is None
+    assert cache.get(3) is None
+
+
+def test_search_todos(client):
+    for title in ["Buy milk", "Buy bread and milk", "Walk the dog"]:
+        client.post("/new/todo", json={"title": title, "completed": False})
+
+    response = client.get("/todos/search", params={"q": "milk"})
+    assert response.status_code == 200
+    titles = [todo["title"] for todo in response.json()["items"]]
+    assert sorted(titles) == ["Buy bread and milk", "Buy milk"]
+    assert all(todo["updated_version"] > 0 for todo in response.json()["items"])
+
+    response = client.get("/todos/search", params={"q": "milk", "limit": 1})
+    assert len(response.json()["items"]) == 1
+    assert response.json()["next_offset"] == 1
+
+    todo_id = client.get("/todos/search", params={"q": "dog"}).json()["items"][0]["id"]
+    client.patch(f"/edit/todo/{todo_id}", json={"title": "Walk the cat"})
+    assert client.get("/todos/search", params={"q": "dog"}).json()["items"] == []
+    assert (
+        client.get("/todos/search", params={"q": "cat"}).json()["items"][0]["id"]
+        == todo_id
+    )
+
+
+def test_todo_feed_websocket(client):
+    with client.websocket_connect("/todos/feed/ws") as websocket:
+        response = client.post(
+            "/new/todo", json={"title": "Test Todo", "completed": False}
+        )
+        todo_id = response.json()["id"]
+        message = websocket.receive_json()
+        assert message["event"]["action"] == "create"
+        assert message["event"]["id"] == todo_id
+        assert message["event"]["todo"]["title"] == "Test Todo"
+
+        client.delete(f"/delete/todo/{todo_id}")
+        deleted = websocket.receive_json()
+        assert deleted["event"] == {"action": "delete", "id": todo_id, "todo": None}
+
+    # Resume after the create event and get only the delete
+    with client.websocket_connect(f"/todos/feed/ws?after={message['id']}") as websocket:
+        assert websocket.receive_json() == deleted
+
+    with client.websocket_connect("/todos/feed/ws?after=unknown-1") as websocket:
+        assert websocket.receive_json() == {"reset": True}
+
+
+class ClosingWebSocket:
+    """
+    A WebSocket whose client sends a message and goes away
+    """
+
+    def __init__(self):
+        self.messages = [
+            {"type": "websocket.receive", "text": "ignored"},
+            {"type": "websocket.disconnect", "code": 1000},
+        ]
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        pass
+
+    async def receive(self):
+        return self.messages.pop(0)
+
+
+def test_todo_feed_websocket_disconnect():
+    # Closed while no todo changes, so only reading the socket notices
+    async def serve():
+        await asyncio.wait_for(todo_feed_websocket(ClosingWebSocket()), 5)
+
+    asyncio.run(serve())
+    assert not todo_feed._subscribers
+
+
+def test_todo_changes(client):
+    first = client.post("/new/todo", json={"title": "First", "completed": False})
+    second = client.post("/new/todo", json={"title": "Second", "completed": False})
+    first_id, second_id = first.json()["id"], second.json()["id"]
+
+    response = client.get("/todos/changes", params={"since": 0})
+    assert response.status_code == 200
+    data = response.json()
+    assert [todo["title"] for todo in data["todos"]] == ["First", "Second"]
+    assert data["deleted"] == []
+    assert data["has_more"] is False
+    since = data["version"]
+
+    assert client.get("/todos/changes", params={"since": since}).json()["todos"] == []
+
+    client.patch(f"/edit/todo/{first_id}", json={"title": "First", "completed": True})
+    client.delete(f"/delete/todo/{second_id}")
+    data = client.get("/todos/changes", params={"since": since}).json()
+    assert [todo["id"] for todo in data["todos"]] == [first_id]
+    assert data["todos"][0]["completed"] is True
+    assert data["deleted"] == [second_id]
+
+    data = client.get("/todos/changes", params={"since": since, "limit": 1}).json()
+    assert [todo["id"] for todo in data["todos"]] == [first_id]
+    assert data["has_more"] is True
+    data = client.get("/todos/changes", params={"since": data["version"]}).json()
+    assert data["deleted"] == [second_id]
+
+
+def test_compact_tombstones():
+    SQLModel.metadata.create_all(engine)
+    with TestClient(app) as client:
+        response = client.post("/new/todo", json={"title": "Gone", "completed": False})
+        client.delete(f"/delete/todo/{response.json()['id']}")
+        with Session(engine) as session:
+            assert compact_tombstones(session, ttl=-1) == 1
+
+        response = client.get("/todos/changes", params={"since": 0})
+        assert response.status_code == 410
+        since = client.get("/todos/changes", params={"since": 2}).json()["version"]
+        assert since == 2
+    SQLModel.metadata.drop_all(engine)
+
+
+@pytest.mark.parametrize("use_orjson", [True, False], ids=["orjson", "adapter"])
+def test_fast_json(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(fast_json, "orjson", None)
+    # The TypedDicts of the adapters describe every column
+    assert list(fast_json.TodoRow.__annotations__) == fast_json.TODO_FIELDS
+    SQLModel.metadata.create_all(engine)
+    with TestClient(app) as client, TestClient(fast_json_app) as fast_client:
+        for i in range(3):
+            client.post("/new/todo", json={"title": f"Todo {i}", "completed": False})
+        for url in ["/", "/todos?limit=2"]:
+            response = client.get(url)
+            fast_response = fast_client.get(url)
+            assert fast_response.status_code == 200
+            assert fast_response.headers["content-type"] == "application/json"
+            assert fast_response.json() == response.json()
+    SQLModel.metadata.drop_all(engine)
+
+
+def test_upgrade_todo_table():
+    # A todo table from before row versions and delta sync
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TABLE todo (id INTEGER NOT NULL PRIMARY KEY, "
+            "title VARCHAR NOT NULL, completed BOOLEAN NOT NULL)"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO todo (title, completed) VALUES ('First', 0), ('Second', 1)"
+        )
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        upgrade_todo_table(connection)
+        upgrade_todo_table(connection)
+
+    with TestClient(app) as client:
+        response = client.get("/todo/1")
+        assert response.status_code == 200
+        assert response.json()["version"] == 1
+        data = client.get("/todos/changes", params={"since": 0}).json()
+        assert [todo["title"] for todo in data["todos"]] == ["First", "Second"]
+
+        client.patch("/edit/todo/1", json={"title": "First", "completed": True})
+        data = client.get("/todos/changes", params={"since": data["version"]}).json()
+        assert [todo["id"] for todo in data["todos"]] == [1]
+        assert response.headers["etag"] != client.get("/todo/1").headers["etag"]
+    SQLModel.metadata.drop_all(engine)
+
+
+def test_sync_app_without_aiosqlite(tmp_path):
+    # A None entry in sys.modules makes importing aiosqlite fail
+    script = (
+        "import sys; sys.modules['aiosqlite'] = None; import main; "
+        "main.create_app('sync'); assert 'async_main' not in sys.modules"
+    )
+    todo_app = Path(__file__).parent.parent / "poetryclass" / "todo_app"
+    env = {**os.environ, "PYTHONPATH": f"{todo_app}{os.pathsep}{todo_app.parents[1]}"}
+    subprocess.run(
+        [sys.executable, "-c", script], cwd=tmp_path, env=env, check=True, timeout=60
+    )
@@ -0,0 +1,96 @@
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+from sklearn.tree import DecisionTreeClassifier
+
+from tests.apps import app_modules
+
+
+@pytest.fixture(name="music", scope="module")
+def music_fixture():
+    with app_modules("music_recommender", "main", "model", "train") as modules:
+        yield modules
+
+
+@pytest.fixture(name="artifact")
+def artifact_fixture(music, tmp_path):
+    return music.train.train(music.train.DATASET, tmp_path, "v1")
+
+
+def test_model_matches_sklearn(music, artifact):
+    music_data = pd.read_csv(music.train.DATASET)
+    X = music_data.drop(columns=[music.train.TARGET])
+    reference = DecisionTreeClassifier(random_state=0)
+    reference.fit(X.values, music_data[music.train.TARGET])
+
+    model = music.model.TreeModel.load(artifact, ["age", "gender"])
+    assert model.version == "v1"
+    # Ages between and beyond the training rows, thresholds sit halfway
+    rows = [[age, gender] for age in np.arange(10, 50, 0.5) for gender in (0, 1)]
+    assert [model.predict(row) for row in rows] == list(reference.predict(rows))
+
+
+def test_latest_artifact(music, tmp_path):
+    with pytest.raises(music.model.ModelArtifactError):
+        music.model.latest_artifact(tmp_path)
+    for version in ["20240101T000000Z", "20250101T000000Z"]:
+        music.train.train(music.train.DATASET, tmp_path, version)
+    # A directory without a manifest isn't an artifact
+    (tmp_path / "20260101T000000Z").mkdir()
+    assert music.model.latest_artifact(tmp_path).name == "20250101T000000Z"
+
+
+def rewrite_manifest(artifact, **changes):
+    manifest_file = artifact / "manifest.json"
+    manifest = json.loads(manifest_file.read_text())
+    manifest_file.write_text(json.dumps({**manifest, **changes}))
+
+
+def save_tree(artifact, tree):
+    # With a matching checksum, so only the nodes are wrong
+    np.save(artifact / "tree.npy", tree)
+    checksum = hashlib.sha256((artifact / "tree.npy").read_bytes()).hexdigest()
+    rewrite_manifest(artifact, files={"tree.npy": checksum})
+
+
+@pytest.mark.parametrize(
+    "corrupt",
+    [
+        lambda artifact: (artifact / "manifest.json").unlink(),
+        lambda artifact: (artifact / "manifest.json").write_text("{"),
+        lambda artifact: rewrite_manifest(artifact, format=2),
+        lambda artifact: (artifact / "tree.npy").write_bytes(b"\x93NUMPY"),
+        lambda artifact: save_tree(artifact, np.zeros(3, dtype="<i4")),
+    ],
+    ids=["missing", "invalid-json", "format", "checksum", "dtype"],
+)
+def test_model_load_rejects_bad_artifact(music, artifact, corrupt):
+    corrupt(artifact)
+    with pytest.raises(music.model.ModelArtifactError):
+        music.model.TreeModel.load(artifact)
+
+
+def test_model_load_checks_features(music, artifact):
+    with pytest.raises(music.model.ModelArtifactError):
+        music.model.TreeModel.load(artifact, ["gender", "age"])
+
+
+def test_recommend(music, artifact, monkeypatch):
+    monkeypatch.setenv("MUSIC_MODEL_DIR", str(artifact))
+    model = music.model.TreeModel.load(artifact)
+    with TestClient(music.main.app) as client:
+        response = client.post("/recommend", json={"age": 21, "gender": 1})
+        assert response.status_code == 200
+        assert response.json() == model.predict([21, 1])
+        assert client.post("/recommend", json={"age": 21}).status_code == 422
+
+
+def test_recommend_fails_to_start_without_artifact(music, tmp_path, monkeypatch):
+    monkeypatch.setenv("MUSIC_MODEL_DIR", str(tmp_path))
+    with pytest.raises(music.model.ModelArtifactError):
+        with TestClient(music.main.app):
+            pass
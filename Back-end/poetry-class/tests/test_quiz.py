@@ -0,0 +1,402 @@
+import io
+import json
+import random
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import SQLModel
+
+from tests.apps import app_modules
+
+# Correct options of the questions imported by the client fixture, by id
+CORRECT_OPTIONS = {1: 0, 2: 1, 3: 2, 4: 3, 5: 0}
+
+
+@pytest.fixture(name="quiz", scope="module")
+def quiz_fixture(tmp_path_factory):
+    # The app keeps its database in the working directory
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(tmp_path_factory.mktemp("quiz"))
+        with app_modules(
+            "quiz-app",
+            "bank",
+            "database",
+            "grading",
+            "importer",
+            "leaderboard",
+            "live",
+            "main",
+            "points",
+            "sampler",
+        ) as modules:
+            yield modules
+            modules.database.engine.dispose()
+
+
+@pytest.fixture(name="question_bank", params=[False, True], ids=["sqlite", "bank"])
+def question_bank_fixture(quiz, request, monkeypatch):
+    # Requested before the client, whose startup loads the bank when it is on
+    monkeypatch.setattr(quiz.bank, "QUESTION_BANK", request.param)
+    monkeypatch.setattr(quiz.bank, "_bank", None)
+    return request.param
+
+
+@pytest.fixture(name="client")
+def client_fixture(quiz):
+    SQLModel.metadata.drop_all(quiz.database.engine)
+    quiz.main.invalidate_question_ids()
+    quiz.main.invalidate_answer_key()
+    with TestClient(quiz.main.app) as client:
+        questions = "".join(
+            json.dumps(
+                {
+                    "question": f"Question {id}",
+                    "options": ["a", "b", "c", "d"],
+                    "correct_option": option,
+                }
+            )
+            + "\n"
+            for id, option in CORRECT_OPTIONS.items()
+        )
+        response = import_file(client, "questions.ndjson", questions)
+        assert response.json() == {"imported": len(CORRECT_OPTIONS)}
+        yield client
+
+
+def import_file(client, name, content):
+    return client.post("/quiz/import", files={"file": (name, content)})
+
+
+def new_question(number):
+    # Brackets, commas and quotes inside strings must not end an item
+    return {
+        "question": f'Question [{number}], "new"',
+        "options": ["a]", "b,", "{c}", "d"],
+        "correct_option": number % 4,
+    }
+
+
+def test_points_accumulator_spreads_threads(quiz):
+    accumulator = quiz.points.PointsAccumulator(4)
+    barrier = threading.Barrier(4)
+
+    def add_points():
+        # Every thread is alive at once, so none reuses another's ident
+        barrier.wait()
+        for _ in range(100):
+            accumulator.add("user", 1)
+
+    threads = [threading.Thread(target=add_points) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [counter["user"] for counter in accumulator._counters] == [100] * 4
+    assert accumulator.pending("user") == 400
+    assert accumulator.drain() == {"user": 400}
+    assert accumulator.pending("user") == 0
+
+
+def test_grade_sheets(client):
+    response = client.post(
+        "/quiz/grade",
+        json={
+            "sheets": [
+                {"user": "ann", "question_ids": [1, 2, 3], "answers": [0, 0, 2]},
+                # Question 99 doesn't exist and counts as wrong
+                {"user": "bob", "question_ids": [4, 99], "answers": [3, 0]},
+                {"question_ids": [], "answers": []},
+            ]
+        },
+    )
+    assert response.status_code == 200
+    assert response.json() == [
+        {"user": "ann", "score": 2, "total": 3, "correct": [True, False, True]},
+        {"user": "bob", "score": 1, "total": 2, "correct": [True, False]},
+        {"user": None, "score": 0, "total": 0, "correct": []},
+    ]
+    assert client.get("/points/users/ann").json()["points"] == 2
+    assert client.get("/points/users/bob").json()["points"] == 1
+
+
+@pytest.mark.parametrize(
+    "sheet",
+    [
+        # Each question scores once
+        {"question_ids": [1] * 5, "answers": [0] * 5},
+        {"question_ids": [1, 2], "answers": [0]},
+        {"question_ids": [2**63], "answers": [0]},
+        {"question_ids": [1], "answers": [2**64]},
+        {"question_ids": [-1], "answers": [0]},
+    ],
+)
+def test_grade_invalid_sheet(client, sheet):
+    response = client.post("/quiz/grade", json={"sheets": [sheet]})
+    assert response.status_code == 422
+
+
+def test_answer_key_load_racing_invalidate(quiz, monkeypatch):
+    loads = []
+
+    def load(session):
+        # The quiz table changes while the key is read
+        if not loads:
+            quiz.grading.invalidate_answer_key()
+        loads.append(quiz.grading.AnswerKey(np.array([len(loads)]), np.array([0])))
+        return loads[-1]
+
+    quiz.grading.invalidate_answer_key()
+    monkeypatch.setattr(quiz.grading.AnswerKey, "load", load)
+    # The stale key still grades its own request but isn't cached
+    assert quiz.grading.answer_key(None) is loads[0]
+    assert quiz.grading.answer_key(None) is loads[1]
+    assert quiz.grading.answer_key(None) is loads[1]
+    assert len(loads) == 2
+
+
+def test_timer_wheel(quiz):
+    wheel = quiz.live.TimerWheel(tick=1, slots=4)
+    fired = []
+    wheel.schedule(2.5, lambda: fired.append("soon"))
+    # Further than one turn of the wheel
+    wheel.schedule(6, lambda: fired.append("later"))
+    wheel.schedule(1, lambda: fired.append("cancelled")).cancel()
+
+    ticks = []
+    for tick in range(1, 8):
+        wheel._advance()
+        ticks.append((tick, list(fired)))
+    assert ticks == [
+        (1, []),
+        (2, []),
+        (3, ["soon"]),
+        (4, ["soon"]),
+        (5, ["soon"]),
+        (6, ["soon", "later"]),
+        (7, ["soon", "later"]),
+    ]
+
+
+def test_live_quiz(client):
+    with client.websocket_connect("/quiz/live?user=ann&n=2&seed=7") as websocket:
+        question = websocket.receive_json()
+        assert question["type"] == "question"
+        assert question["index"] == 0
+        assert "correct_option" not in question
+
+        # An answer has to name its question
+        websocket.send_json({"answer": 0})
+        assert websocket.receive_json()["type"] == "error"
+
+        websocket.send_json({"index": 0, "answer": CORRECT_OPTIONS[question["id"]]})
+        assert websocket.receive_json() == {
+            "type": "result",
+            "index": 0,
+            "correct": True,
+            "score": 1,
+        }
+        question = websocket.receive_json()
+        assert question["index"] == 1
+        wrong = (CORRECT_OPTIONS[question["id"]] + 1) % 4
+        websocket.send_json({"index": 1, "answer": wrong})
+        assert websocket.receive_json()["correct"] is False
+        assert websocket.receive_json() == {
+            "type": "done",
+            "score": 1,
+            "total": 2,
+            "correct": [True, False],
+        }
+    assert client.get("/points/users/ann").json()["points"] == 1
+
+
+def test_live_quiz_timeout(client, quiz, monkeypatch):
+    monkeypatch.setattr(quiz.live, "LIVE_TIME_LIMIT", 0.2)
+    with client.websocket_connect("/quiz/live?n=2&seed=7") as websocket:
+        first = websocket.receive_json()
+        assert websocket.receive_json() == {"type": "timeout", "index": 0, "score": 0}
+        second = websocket.receive_json()
+        assert second["index"] == 1
+
+        # Sent after the first question timed out, it must not answer the second
+        websocket.send_json({"index": 0, "answer": CORRECT_OPTIONS[first["id"]]})
+        websocket.send_json({"index": 1, "answer": CORRECT_OPTIONS[second["id"]]})
+        assert websocket.receive_json() == {
+            "type": "result",
+            "index": 1,
+            "correct": True,
+            "score": 1,
+        }
+        assert websocket.receive_json()["correct"] == [False, True]
+
+
+def test_import_json_array(client, quiz, question_bank, monkeypatch):
+    # Items straddle reads of a few characters
+    monkeypatch.setattr(quiz.importer, "READ_SIZE", 7)
+    questions = [new_question(number) for number in range(6, 9)]
+    response = import_file(client, "questions.json", json.dumps(questions, indent=2))
+    assert response.status_code == 200
+    assert response.json() == {"imported": 3}
+    assert (quiz.bank.get_bank() is not None) is question_bank
+
+    quizzes = client.get("/").json()
+    assert [quiz["id"] for quiz in quizzes] == list(range(1, 9))
+    assert client.get("/7").json() == {"id": 7, **new_question(7)}
+
+
+def test_import_batches(client, quiz):
+    # Blank lines between the questions are skipped
+    lines = "\n\n".join(json.dumps(new_question(number)) for number in range(6, 11))
+    with quiz.main.Session(quiz.database.engine) as session:
+        imported = quiz.importer.import_questions(
+            session, io.StringIO(lines), batch_size=2
+        )
+    assert imported == 5
+    assert [quiz["id"] for quiz in client.get("/").json()] == list(range(1, 11))
+
+
+@pytest.mark.parametrize(
+    "name, content",
+    [
+        # The third question is invalid, the first two must not be kept
+        (
+            "questions.ndjson",
+            "\n".join(
+                [
+                    json.dumps(new_question(6)),
+                    json.dumps(new_question(7)),
+                    json.dumps({**new_question(8), "correct_option": 4}),
+                ]
+            ),
+        ),
+        ("questions.ndjson", json.dumps(new_question(6)) + "\n{not json"),
+        ("questions.json", json.dumps([new_question(6), new_question(7)])[:-1]),
+        ("questions.json", json.dumps([new_question(6), {"question": ""}])),
+        ("questions.json", b"\xff\xfe["),
+    ],
+)
+def test_import_invalid_file(client, question_bank, name, content):
+    response = import_file(client, name, content)
+    assert response.status_code == 400
+    assert [quiz["id"] for quiz in client.get("/").json()] == list(range(1, 6))
+
+
+def test_quiz_session_seed(client, question_bank):
+    first = client.get("/quiz/session", params={"n": 3, "seed": 42}).json()
+    assert first["seed"] == 42
+    ids = [question["id"] for question in first["questions"]]
+    assert len(set(ids)) == 3
+    assert set(ids) <= set(CORRECT_OPTIONS)
+    assert all("correct_option" not in question for question in first["questions"])
+    assert client.get("/quiz/session", params={"n": 3, "seed": 42}).json() == first
+
+    # Without a seed the response names the one it drew
+    drawn = client.get("/quiz/session", params={"n": 3}).json()
+    again = client.get("/quiz/session", params={"n": 3, "seed": drawn["seed"]})
+    assert again.json() == drawn
+
+
+def test_quiz_session_all_questions(client, question_bank):
+    response = client.get("/quiz/session", params={"n": 10, "seed": 1})
+    ids = [question["id"] for question in response.json()["questions"]]
+    assert sorted(ids) == list(CORRECT_OPTIONS)
+
+
+def test_quiz_session_skips_deleted(client):
+    # Sampled from the cached ids, which the delete invalidates
+    client.post("/quiz/delete", params={"id": 3})
+    for seed in range(10):
+        response = client.get("/quiz/session", params={"n": 4, "seed": seed})
+        ids = [question["id"] for question in response.json()["questions"]]
+        assert sorted(ids) == [1, 2, 4, 5]
+
+
+def test_question_ids_read_racing_invalidate(quiz):
+    reads = []
+
+    class Session:
+        def exec(self, query):
+            # The quiz table changes while the ids are read
+            if not reads:
+                quiz.sampler.invalidate_question_ids()
+            reads.append([len(reads)])
+            return SimpleNamespace(all=lambda: reads[-1])
+
+    quiz.sampler.invalidate_question_ids()
+    # The stale ids still serve their own request but aren't cached
+    assert quiz.sampler.question_ids(Session()) == (0,)
+    assert quiz.sampler.question_ids(Session()) == (1,)
+    assert quiz.sampler.question_ids(Session()) == (1,)
+    assert len(reads) == 2
+
+
+def test_quiz_session_invalid_size(client, quiz):
+    for n in [0, quiz.main.SESSION_MAX_QUESTIONS + 1]:
+        assert client.get("/quiz/session", params={"n": n}).status_code == 422
+
+
+def test_skip_list(quiz):
+    skip_list = quiz.leaderboard.SkipList()
+    expected = []
+    shuffle = random.Random(0)
+    keys = [(-shuffle.randrange(50), f"user{i}") for i in range(300)]
+    for key in keys:
+        skip_list.insert(key)
+        expected.append(key)
+    # Remove a third of the keys again
+    for key in shuffle.sample(keys, 100):
+        skip_list.remove(key)
+        expected.remove(key)
+    expected.sort()
+
+    assert len(skip_list) == 200
+    assert skip_list.slice(0, 1000) == expected
+    assert skip_list.slice(150, 10) == expected[150:160]
+    assert skip_list.slice(195, 10) == expected[195:]
+    for position, key in enumerate(expected):
+        assert skip_list.rank(key) == position
+    with pytest.raises(KeyError):
+        skip_list.remove((1, "missing"))
+
+
+def test_leaderboard(client):
+    for user, delta in [("ann", 5), ("bob", 3), ("cat", 5), ("dan", 1), ("bob", 2)]:
+        client.post(f"/points/users/{user}/increment", params={"delta": delta})
+
+    # Tied players share a rank and are listed by name
+    assert client.get("/leaderboard").json() == [
+        {"rank": 1, "user": "ann", "points": 5},
+        {"rank": 1, "user": "bob", "points": 5},
+        {"rank": 1, "user": "cat", "points": 5},
+        {"rank": 4, "user": "dan", "points": 1},
+    ]
+    assert client.get("/leaderboard", params={"limit": 2}).json()[-1]["user"] == "bob"
+    assert client.get("/leaderboard/users/cat").json() == {
+        "rank": 1,
+        "user": "cat",
+        "points": 5,
+    }
+    assert client.get("/leaderboard/users/eve").status_code == 404
+
+    around = client.get("/leaderboard/users/cat/around", params={"radius": 1})
+    assert around.json() == [
+        {"rank": 1, "user": "bob", "points": 5},
+        {"rank": 1, "user": "cat", "points": 5},
+        {"rank": 4, "user": "dan", "points": 1},
+    ]
+    around = client.get("/leaderboard/users/ann/around", params={"radius": 0})
+    assert [entry["user"] for entry in around.json()] == ["ann"]
+    assert client.get("/leaderboard/users/eve/around").status_code == 404
+
+
+def test_leaderboard_loads_on_startup(client, quiz):
+    client.post("/points/users/ann/increment", params={"delta": 2})
+    quiz.leaderboard.leaderboard.load([])
+    # Restarting the app reads the points back from the database
+    with TestClient(quiz.main.app) as restarted:
+        assert restarted.get("/leaderboard").json() == [
+            {"rank": 1, "user": "ann", "points": 2}
+        ]
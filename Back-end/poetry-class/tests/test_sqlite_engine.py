@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from poetryclass.sqlite_engine import (
+    PRAGMAS,
+    POOL_SIZE,
+    create_async_sqlite_engine,
+    create_sqlite_engine,
+    env_flag,
+    is_memory_database,
+)
+
+# PRAGMA values as SQLite reports them back
+EXPECTED_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": 1,
+    "mmap_size": PRAGMAS["mmap_size"],
+    "cache_size": PRAGMAS["cache_size"],
+    "busy_timeout": PRAGMAS["busy_timeout"],
+    "temp_store": 2,
+}
+
+
+def read_pragmas(connection):
+    return {
+        name: connection.execute(text(f"PRAGMA {name}")).scalar()
+        for name in EXPECTED_PRAGMAS
+    }
+
+
+def test_file_engine_pragmas(tmp_path):
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    # Every pooled connection is set up, not only the first
+    with engine.connect() as first, engine.connect() as second:
+        assert read_pragmas(first) == EXPECTED_PRAGMAS
+        assert read_pragmas(second) == EXPECTED_PRAGMAS
+    assert isinstance(engine.pool, QueuePool)
+    assert engine.pool.size() == POOL_SIZE
+    engine.dispose()
+
+
+def test_engine_arguments_win(tmp_path):
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'test.db'}", pool_size=2)
+    assert engine.pool.size() == 2
+    engine.dispose()
+
+
+@pytest.mark.parametrize("url", ["sqlite://", "sqlite:///:memory:"])
+def test_memory_engine_shares_one_database(url):
+    engine = create_sqlite_engine(url)
+    assert isinstance(engine.pool, StaticPool)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE item (id INTEGER)"))
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM item")).scalar() == 0
+        # An in-memory database has no write-ahead log
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "memory"
+        assert read_pragmas(connection)["busy_timeout"] == PRAGMAS["busy_timeout"]
+
+
+def test_async_engine_pragmas(tmp_path):
+    async def pragmas():
+        engine = create_async_sqlite_engine(
+            f"sqlite+aiosqlite:///{tmp_path / 'test.db'}"
+        )
+        async with engine.connect() as connection:
+            values = await connection.run_sync(read_pragmas)
+        await engine.dispose()
+        return values
+
+    assert asyncio.run(pragmas()) == EXPECTED_PRAGMAS
+
+
+@pytest.mark.parametrize(
+    "url, memory",
+    [
+        ("sqlite://", True),
+        ("sqlite:///:memory:", True),
+        ("sqlite+aiosqlite://", True),
+        ("sqlite:///todos.db", False),
+        ("sqlite:////tmp/todos.db", False),
+    ],
+)
+def test_is_memory_database(url, memory):
+    assert is_memory_database(url) is memory
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (None, False),
+        ("1", True),
+        (" TRUE ", True),
+        ("yes", True),
+        ("on", True),
+        ("0", False),
+        ("off", False),
+        ("", False),
+    ],
+)
+def test_env_flag(monkeypatch, value, expected):
+    if value is None:
+        monkeypatch.delenv("TEST_FLAG", raising=False)
+    else:
+        monkeypatch.setenv("TEST_FLAG", value)
+    assert env_flag("TEST_FLAG") is expected
+    if value is None:
+        assert env_flag("TEST_FLAG", default=True) is True
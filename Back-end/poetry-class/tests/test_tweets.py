@@ -0,0 +1,442 @@
+import glob
+import hashlib
+import io
+import os
+import shutil
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+from sqlmodel import Session, SQLModel, select
+
+from tests.apps import app_modules
+
+
+@pytest.fixture(name="tweets", scope="module")
+def tweets_fixture(tmp_path_factory):
+    # The app keeps its database and uploads in the working directory
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(tmp_path_factory.mktemp("tweets"))
+        monkeypatch.setenv("TWEETS_NORMALIZE", "0")
+        monkeypatch.setenv("TWEETS_VARIANT_WORKERS", "1")
+        monkeypatch.setenv("TWEETS_MAX_IMAGE_SIZE", str(64 * 1024))
+        with app_modules(
+            "tweets-app",
+            "database",
+            "images",
+            "main",
+            "models",
+            "storage",
+            "tags",
+            "timeline",
+            "utils",
+        ) as modules:
+            yield modules
+            modules.database.engine.dispose()
+
+
+def reset_tables(tweets) -> None:
+    shutil.rmtree(tweets.utils.UPLOAD_FOLDER, ignore_errors=True)
+    SQLModel.metadata.drop_all(tweets.database.engine)
+    tweets.database.create_db_and_tables()
+    tweets.timeline.invalidate_timeline()
+
+
+@pytest.fixture(name="client")
+def client_fixture(tweets):
+    reset_tables(tweets)
+    with TestClient(tweets.main.app) as client:
+        yield client
+
+
+def png(color: str = "red", size: tuple[int, int] = (32, 24)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def png_name(image: bytes) -> str:
+    return f"{hashlib.sha256(image).hexdigest()}.png"
+
+
+def post_tweet(client, text: str, image: bytes | None = None):
+    files = {"image": ("photo.png", image, "image/png")} if image else None
+    return client.post("/tweets/", data={"text": text}, files=files)
+
+
+def wait_for(condition, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def read_all_pages(client, limit: int) -> list[int]:
+    page = client.get("/tweets/timeline", params={"limit": limit}).json()
+    ids = [tweet["id"] for tweet in page["items"]]
+    while page["next_cursor"] is not None:
+        assert len(ids) <= 100, "the cursor doesn't move forward"
+        page = client.get(
+            "/tweets/timeline", params={"limit": limit, "cursor": page["next_cursor"]}
+        ).json()
+        ids += [tweet["id"] for tweet in page["items"]]
+    return ids
+
+
+def test_timeline_pages(client):
+    ids = [
+        client.post("/tweets/", data={"text": f"Tweet {i}"}).json()["id"]
+        for i in range(5)
+    ]
+
+    page = client.get("/tweets/timeline", params={"limit": 2}).json()
+    assert [tweet["id"] for tweet in page["items"]] == ids[::-1][:2]
+    assert read_all_pages(client, 2) == ids[::-1]
+
+    response = client.get("/tweets/timeline", params={"cursor": "not a cursor"})
+    assert response.status_code == 400
+
+
+def test_timeline_cached_first_page(client):
+    first = client.post("/tweets/", data={"text": "First"}).json()["id"]
+    assert read_all_pages(client, 10) == [first]
+    second = client.post("/tweets/", data={"text": "Second"}).json()["id"]
+    assert read_all_pages(client, 10) == [second, first]
+    client.delete(f"/tweets/{second}")
+    assert read_all_pages(client, 10) == [first]
+
+
+@pytest.mark.parametrize(
+    "created_at",
+    [
+        # A table from before the timeline
+        "",
+        # Upgraded by a version that dated tweets with CURRENT_TIMESTAMP
+        ", created_at DATETIME DEFAULT CURRENT_TIMESTAMP",
+    ],
+)
+def test_timeline_of_upgraded_table(client, tweets, created_at):
+    SQLModel.metadata.drop_all(tweets.database.engine)
+    with tweets.database.engine.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TABLE tweet (id INTEGER NOT NULL PRIMARY KEY, "
+            f"text VARCHAR NOT NULL, image_filename VARCHAR{created_at})"
+        )
+        for i in range(5):
+            connection.exec_driver_sql(
+                f"INSERT INTO tweet (text) VALUES ('Old tweet {i}')"
+            )
+    tweets.database.create_db_and_tables()
+    tweets.timeline.invalidate_timeline()
+
+    assert read_all_pages(client, 2) == [5, 4, 3, 2, 1]
+    new = client.post("/tweets/", data={"text": "New tweet"}).json()["id"]
+    assert read_all_pages(client, 2) == [new, 5, 4, 3, 2, 1]
+
+
+def test_upload_claim_waits_off_the_event_loop(client, tweets):
+    responses = {}
+
+    def upload():
+        responses["upload"] = post_tweet(client, "Photo", png())
+
+    def read_timeline():
+        responses["timeline"] = client.get("/tweets/timeline")
+
+    # As the reaper does while it checks and deletes images
+    with tweets.utils.claims_lock:
+        uploader = threading.Thread(target=upload)
+        uploader.start()
+        uploader.join(0.5)
+        assert "upload" not in responses
+
+        # The upload waits for the lock in a worker thread, not on the loop
+        reader = threading.Thread(target=read_timeline)
+        reader.start()
+        reader.join(5)
+        assert responses["timeline"].status_code == 200
+    uploader.join(5)
+    assert responses["upload"].status_code == 200
+
+
+def test_upload_dedupe(client, tweets):
+    first = post_tweet(client, "First", png()).json()
+    second = post_tweet(client, "Second", png()).json()
+    other = post_tweet(client, "Other", png("blue")).json()
+
+    assert first["image_filename"] == second["image_filename"]
+    assert other["image_filename"] != first["image_filename"]
+    filename = first["image_filename"]
+    assert filename.split(".")[0] == tweets.utils.file_sha256(
+        tweets.utils.image_path(filename)
+    )
+    stored = glob.glob(os.path.join(tweets.utils.UPLOAD_FOLDER, "??", "??", "*"))
+    assert len(stored) == 2
+
+
+def test_image_released_with_its_last_tweet(client, tweets):
+    first = post_tweet(client, "First", png()).json()
+    second = post_tweet(client, "Second", png()).json()
+    path = tweets.utils.image_path(first["image_filename"])
+
+    client.delete(f"/tweets/{first['id']}")
+    # The reaper keeps the image while a tweet uses it
+    assert not wait_for(lambda: not os.path.exists(path), timeout=0.5)
+
+    client.put(
+        f"/tweets/{second['id']}",
+        files={"image": ("new.png", png("blue"), "image/png")},
+    )
+    assert wait_for(lambda: not os.path.exists(path))
+
+    client.delete(f"/tweets/{second['id']}")
+    new_path = tweets.utils.image_path(png_name(png("blue")))
+    assert wait_for(lambda: not os.path.exists(new_path))
+
+
+def write_file(path: str, content: bytes, age: float = 0) -> str:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(content)
+    if age:
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_collect_garbage(client, tweets):
+    utils, storage = tweets.utils, tweets.storage
+    kept = post_tweet(client, "Kept", png()).json()["image_filename"]
+    kept_path = utils.image_path(kept)
+    os.utime(kept_path, (0, 0))
+
+    orphan = write_file(utils.image_path("ab" * 32 + ".png"), b"orphan", age=120)
+    young = write_file(utils.image_path("cd" * 32 + ".png"), b"young")
+    temp = write_file(os.path.join(utils.UPLOAD_FOLDER, ".upload-x.tmp"), b"", age=120)
+    variant = write_file(
+        str(storage.VARIANT_FOLDER / "ef" / "ef" / ("ef" * 32 + ".thumb.webp")),
+        b"variant",
+        age=120,
+    )
+
+    report = storage.collect_garbage(grace=60, batch_size=1)
+    assert report["scanned"] == 3
+    assert report["deleted"] == 1
+    assert report["temp_files"] == 1
+    assert report["bytes_freed"] == len(b"orphan") + len(b"variant")
+    assert os.path.exists(kept_path)
+    assert os.path.exists(young)
+    assert not any(os.path.exists(path) for path in (orphan, temp, variant))
+
+
+def test_migrate_uploads(client, tweets):
+    folder = tweets.utils.UPLOAD_FOLDER
+    duplicate, other = png(), png("blue")
+    names = ["first.png", "copy.PNG", "other.png", "missing.png"]
+    write_file(os.path.join(folder, "first.png"), duplicate)
+    write_file(os.path.join(folder, "copy.PNG"), duplicate)
+    write_file(os.path.join(folder, "other.png"), other)
+    with Session(tweets.database.engine) as db:
+        for name in names:
+            db.add(tweets.models.Tweet(text=name, image_filename=name))
+        db.commit()
+
+        report = tweets.storage.migrate_uploads(db)
+        assert report["tweets"] == 4
+        assert report["moved"] == 3
+        assert report["missing"] == 1
+        assert (report["files_before"], report["files_after"]) == (3, 2)
+        assert report["bytes_reclaimed"] == len(duplicate)
+
+        stored = dict(
+            db.exec(
+                select(tweets.models.Tweet.text, tweets.models.Tweet.image_filename)
+            ).all()
+        )
+    assert stored == {
+        "first.png": png_name(duplicate),
+        "copy.PNG": png_name(duplicate),
+        "other.png": png_name(other),
+        "missing.png": "missing.png",
+    }
+    assert sorted(os.listdir(folder)) == sorted(
+        {name[:2] for name in stored.values() if name != "missing.png"}
+    )
+    for name in set(stored.values()) - {"missing.png"}:
+        assert os.path.isfile(tweets.utils.image_path(name))
+
+    # Running it again changes nothing
+    with Session(tweets.database.engine) as db:
+        assert tweets.storage.migrate_uploads(db)["bytes_reclaimed"] == 0
+
+
+def test_upload_limits(client, tweets):
+    folder = tweets.utils.UPLOAD_FOLDER
+    too_large = b"\0" * (64 * 1024 + 1)
+    response = post_tweet(client, "Too large", too_large)
+    assert response.status_code == 413
+    # Nothing of the upload is left behind
+    assert os.listdir(folder) == []
+
+    response = client.post(
+        "/tweets/",
+        data={"text": "Not an image"},
+        files={"image": ("notes.txt", b"text", "text/plain")},
+    )
+    assert response.status_code == 400
+    assert client.get("/tweets/timeline").json()["items"] == []
+
+    response = post_tweet(client, "Just fits", b"\0" * (64 * 1024))
+    assert response.status_code == 200
+    assert response.json()["image_filename"].endswith(".png")
+
+
+def test_image_variants(client):
+    tweet = post_tweet(client, "Photo", png(size=(400, 300))).json()
+    filename = tweet["image_filename"]
+    item = client.get("/tweets/timeline").json()["items"][0]
+    assert item["image_filename"] == f"/uploads/{filename}"
+    assert item["image_variants"] == {
+        "thumb": f"/uploads/{filename}?size=thumb",
+        "medium": f"/uploads/{filename}?size=medium",
+    }
+
+    sizes = {}
+    for size, url in item["image_variants"].items():
+        response = client.get(url)
+        assert response.status_code == 200
+        with Image.open(io.BytesIO(response.content)) as image:
+            assert image.format == "WEBP"
+            sizes[size] = image.size
+    # Scaled down to fit, never up
+    assert sizes == {"thumb": (160, 120), "medium": (400, 300)}
+
+    # A file Pillow can't read is served as uploaded
+    tweet = post_tweet(client, "Broken", b"not really a png").json()
+    response = client.get(f"/uploads/{tweet['image_filename']}?size=thumb")
+    assert response.content == b"not really a png"
+
+
+def test_variant_of_missing_upload(client, tweets):
+    for prefix in ["00", "01", "02"]:
+        filename = prefix * 32 + ".png"
+        assert client.get(f"/uploads/{filename}?size=thumb").status_code == 404
+    # Nothing is created or rendered for an upload that doesn't exist
+    assert not tweets.images.VARIANT_FOLDER.exists()
+    assert not tweets.images._pending
+
+    # A render that fails leaves no shard folder behind either
+    filename = post_tweet(client, "Broken", b"not a png").json()["image_filename"]
+    client.get(f"/uploads/{filename}?size=thumb")
+    variant = tweets.images.variant_path(filename, tweets.images.ImageSize.thumb)
+    assert not variant.parent.exists()
+
+
+def test_serve_upload_conditional_and_range(client):
+    image = png()
+    filename = post_tweet(client, "Photo", image).json()["image_filename"]
+    url = f"/uploads/{filename}"
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.content == image
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    etag = response.headers["etag"]
+    assert etag == f'"{filename.split(".")[0]}"'
+    assert client.get(f"{url}?size=thumb").headers["etag"] != etag
+
+    response = client.get(url, headers={"If-None-Match": f'"other", W/{etag}'})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+    last_modified = client.get(url).headers["last-modified"]
+    response = client.get(url, headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+    # If-None-Match wins over If-Modified-Since
+    response = client.get(
+        url, headers={"If-None-Match": '"other"', "If-Modified-Since": last_modified}
+    )
+    assert response.status_code == 200
+
+    response = client.get(url, headers={"Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert response.content == image[:10]
+    assert response.headers["content-range"] == f"bytes 0-9/{len(image)}"
+
+    assert client.get("/uploads/../tweets.db").status_code == 404
+    assert client.get("/uploads/" + "0" * 64 + ".png").status_code == 404
+
+
+def test_tag_index(client):
+    first = post_tweet(client, "Learning #Python with @Ann").json()["id"]
+    second = post_tweet(client, "More #python, mail me at ann@example.com").json()["id"]
+    post_tweet(client, "Nothing to see")
+
+    def tagged(tag: str, **params) -> list[int]:
+        page = client.get(f"/tweets/tag/{tag}", params=params).json()
+        return [tweet["id"] for tweet in page["items"]]
+
+    assert tagged("python") == [second, first]
+    assert tagged("%23PYTHON") == [second, first]
+    assert tagged("@ann") == [first]
+    page = client.get("/tweets/tag/python", params={"limit": 1}).json()
+    assert tagged("python", limit=1, cursor=page["next_cursor"]) == [first]
+    assert client.get("/tweets/tag/python?cursor=x").status_code == 400
+
+    client.put(f"/tweets/{first}", data={"text": "Learning #FastAPI"})
+    assert tagged("python") == [second]
+    assert tagged("@ann") == []
+    assert tagged("fastapi") == [first]
+    client.delete(f"/tweets/{second}")
+    assert tagged("python") == []
+
+    # Counts are kept from the uses, edits and deletes don't take them back
+    assert client.get("/trending", params={"limit": 2}).json() == [
+        {"tag": "#python", "count": 2},
+        {"tag": "@ann", "count": 1},
+    ]
+
+
+def test_trending_window(tweets):
+    counter = tweets.tags.TrendingCounter(window=60)
+    now = time.time()
+    counter.add({"#old"}, at=now - 2 * 3600)
+    counter.add({"#recent", "#both"}, at=now - 30 * 60)
+    counter.add({"#both"}, at=now)
+    assert counter.top(10) == [("#both", 2), ("#recent", 1)]
+
+    # The bucket of 30 minutes ago leaves the window 31 minutes later
+    later = now + 31 * 60
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(tweets.tags.time, "time", lambda: later)
+        assert counter.top(10) == [("#both", 1)]
+
+
+def test_upload_normalization(client, tweets, monkeypatch):
+    monkeypatch.setattr(tweets.main, "NORMALIZE", True)
+    before = client.get("/metrics/uploads").json()
+
+    image = png(size=(3000, 1500))
+    response = post_tweet(client, "Large photo", image)
+    filename = response.json()["image_filename"]
+    assert filename.endswith(".webp")
+    with Image.open(tweets.utils.image_path(filename)) as stored:
+        assert stored.format == "WEBP"
+        assert stored.size == (2048, 1024)
+    stored_size = os.path.getsize(tweets.utils.image_path(filename))
+    assert int(response.headers["x-image-bytes-saved"]) == len(image) - stored_size
+
+    # Not something Pillow can read, kept as uploaded
+    response = post_tweet(client, "Broken", b"not really a png")
+    assert response.json()["image_filename"].endswith(".png")
+    assert response.headers["x-image-bytes-saved"] == "0"
+
+    after = client.get("/metrics/uploads").json()
+    assert after["uploads"] - before["uploads"] == 2
+    assert after["normalized"] - before["normalized"] == 1
+    assert after["bytes_saved"] - before["bytes_saved"] == len(image) - stored_size
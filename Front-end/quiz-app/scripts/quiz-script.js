@@ -6,12 +6,13 @@ const resultContainer = document.getElementById("result-container");
 const scoreElement = document.getElementById("score");
 
 let quizData = [];
+let answers = [];
 let currentQuestionIndex = 0;
-let points = 0;
 
 async function fetchQuizData() {
-  const response = await fetch("http://127.0.0.1:8000/");
-  quizData = await response.json();
+  // The session leaves out the correct options, answers are graded on the server
+  const response = await fetch("http://127.0.0.1:8000/quiz/session?n=10");
+  quizData = (await response.json()).questions;
   showQuestion();
 }
 
@@ -52,29 +53,35 @@ function showQuestion() {
 }
 
 async function selectOption(selectedIndex) {
-  const questionData = quizData[currentQuestionIndex];
-  if (selectedIndex === questionData.correct_option) {
-    points++;
-  }
+  answers.push(selectedIndex);
   currentQuestionIndex++;
   showQuestion();
 }
 
 async function showResults() {
-  //     const url = `http://127.0.0.1:8000/points/update/?points=${points}`;
-  //     await fetch(url, {
-  //         method: 'PATCH',
-  //         headers: {
-  //             'Content-Type': 'application/json'
-  //         },
-  // });
+  // Grading also adds the score to the points
+  const response = await fetch("http://127.0.0.1:8000/quiz/grade", {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    body: JSON.stringify({
+      sheets: [
+        {
+          question_ids: quizData.map((question) => question.id),
+          answers: answers,
+        },
+      ],
+    }),
+  });
+  const [result] = await response.json();
   questionContainer.classList.add("hidden");
   resultContainer.classList.remove("hidden");
-  scoreElement.innerText = `${points} / ${quizData.length}`;
+  scoreElement.innerText = `${result.score} / ${result.total}`;
 }
 
 function restartQuiz() {
-  points = 0;
+  answers = [];
   currentQuestionIndex = 0;
   fetchQuizData();
 }
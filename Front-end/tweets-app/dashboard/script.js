@@ -43,7 +43,7 @@ function renderPostInTable(post) {
     row.innerHTML = `
       
       <td title="${post.text}">${post.text}</td>
-      <td>${post.image_filename ? `<img src="${API_URL}${post.image_filename}" alt="Post Image" class='post-img'>` : "No Image"}</td>
+      <td>${post.image_filename ? `<img src="${API_URL}${post.image_variants.thumb}" alt="Post Image" loading="lazy" class='post-img'>` : "No Image"}</td>
       <td>
         <button class="update-btn action-btn update"
         style='padding:8px;'
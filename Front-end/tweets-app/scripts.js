@@ -15,7 +15,7 @@ document.addEventListener("DOMContentLoaded", async () => {
                 tweetDiv.innerHTML = `
           <p>${tweet.text}</p>
           ${tweet.image_filename
-                        ? `<img src="${API_URL}${tweet.image_filename}" alt="Tweet Image" class='post-img'>`
+                        ? `<img src="${API_URL}${tweet.image_variants.medium}" alt="Tweet Image" loading="lazy" class='post-img'>`
                         : ""
                     }
         `;